@@ -0,0 +1,164 @@
+import argparse
+import datetime
+import time
+
+import numpy as np
+
+from engagement import DEFAULT_WEIGHTS
+from snapshot import Snapshot, to_day
+
+# Vectorized versions of the canned aggregates, computed from a snapshot
+# exported by snapshot.py instead of by the database. Each function returns a
+# dict of equal-length arrays (one entry per output row); entity and campaign
+# columns are codes that Snapshot.emails and Snapshot.campaigns decode.
+
+
+def _date_mask(days, since=None, until=None):
+    # [since, until) over an int32 day column; None when unbounded
+    mask = None
+    if since:
+        mask = days >= to_day(since)
+    if until:
+        below = days < to_day(until)
+        mask = below if mask is None else mask & below
+    return mask
+
+
+def entity_totals(snapshot, since=None, until=None):
+    # Total donated per donor (Query2), for donors with at least one donation
+    entity = snapshot.donations["entity"]
+    amount = snapshot.donations["amount"]
+    mask = _date_mask(snapshot.donations["date"], since, until)
+    if mask is not None:
+        entity, amount = entity[mask], amount[mask]
+    size = len(snapshot.entities)
+    counts = np.bincount(entity, minlength=size)
+    totals = np.bincount(entity, weights=amount, minlength=size)
+    donors = np.flatnonzero(counts)
+    return {"entity": donors, "total": totals[donors], "count": counts[donors]}
+
+
+def campaign_stats(snapshot, since=None, until=None):
+    # Sum, count and max of donations per campaign, as CampaignTotals holds
+    # them. Every campaign is returned; max is NaN for one with no donations.
+    campaign = snapshot.donations["campaign"]
+    amount = snapshot.donations["amount"]
+    mask = _date_mask(snapshot.donations["date"], since, until)
+    if mask is not None:
+        campaign, amount = campaign[mask], amount[mask]
+    size = len(snapshot.campaigns)
+    counts = np.bincount(campaign, minlength=size)
+    sums = np.bincount(campaign, weights=amount, minlength=size)
+    maxima = np.full(size, np.nan)
+    if len(campaign):
+        # Group maxima with one sort and a reduceat over the group starts
+        order = np.argsort(campaign, kind="stable")
+        grouped = campaign[order]
+        starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+        maxima[grouped[starts]] = np.maximum.reduceat(amount[order], starts)
+    return {"campaign": np.arange(size), "sum": sums, "count": counts, "max": maxima}
+
+
+def accounting_report(snapshot, since=None, until=None):
+    # Budget coverage by issue, grouped by (issue, budget) like
+    # ACCOUNTING_REPORT_QUERY. coverage is total / budget, NaN without a budget.
+    stats = campaign_stats(snapshot, since, until)
+    issues, issue_codes = np.unique(np.array([key[0] for key in snapshot.campaigns], dtype=object),
+                                    return_inverse=True)
+    budgets, budget_codes = np.unique(snapshot.campaign_budget, return_inverse=True)
+    groups, group_of = np.unique(issue_codes * len(budgets) + budget_codes, return_inverse=True)
+    totals = np.bincount(group_of, weights=stats["sum"], minlength=len(groups))
+    group_budget = budgets[groups % len(budgets)] if len(budgets) else np.empty(0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coverage = np.where(group_budget > 0, totals / group_budget, np.nan)
+    return {"issue": issues[groups // max(len(budgets), 1)], "budget": group_budget,
+            "total": totals, "coverage": coverage}
+
+
+def engagement_scores(snapshot, weights=None, half_life_days=None, since=None, until=None, as_of=None):
+    # The same scores as engagement.compute_engagement_scores: weighted
+    # donations in range plus weighted active volunteering, optionally decayed
+    # by age. Rows are ordered by score descending, then email.
+    merged = dict(DEFAULT_WEIGHTS)
+    merged.update(weights or {})
+    today = to_day(as_of or datetime.date.today())
+    size = len(snapshot.entities)
+
+    donations = snapshot.donations
+    entity, days = donations["entity"], donations["date"]
+    mask = _date_mask(days, since, until)
+    if mask is not None:
+        entity, days = entity[mask], days[mask]
+    membership = snapshot.membership
+    active = membership["end"] > today
+    range_mask = _date_mask(membership["start"], since, until)
+    if range_mask is not None:
+        active &= range_mask
+    volunteer, started = membership["entity"][active], membership["start"][active]
+
+    donation_counts = np.bincount(entity, minlength=size)
+    volunteering_counts = np.bincount(volunteer, minlength=size)
+    if half_life_days:
+        def decayed(ages):
+            return np.power(0.5, np.maximum(today - ages, 0) / float(half_life_days))
+        scores = (merged["donation"] * np.bincount(entity, weights=decayed(days), minlength=size)
+                  + merged["volunteering"] * np.bincount(volunteer, weights=decayed(started), minlength=size))
+    else:
+        scores = merged["donation"] * donation_counts + merged["volunteering"] * volunteering_counts
+    members = np.flatnonzero(donation_counts + volunteering_counts)
+    # Entity codes follow the database's email order, so they break ties
+    members = members[np.lexsort((members, -scores[members]))]
+    return {"entity": members, "score": scores[members], "donation_count": donation_counts[members],
+            "volunteering_count": volunteering_counts[members]}
+
+
+REPORTS = {
+    "totals": entity_totals,
+    "campaigns": campaign_stats,
+    "accounting": accounting_report,
+    "engagement": engagement_scores,
+}
+
+
+def _print_rows(snapshot, result, limit):
+    columns = list(result)
+    print(", ".join(columns))
+    for i in range(min(limit, len(result[columns[0]]))):
+        row = []
+        for name in columns:
+            value = result[name][i]
+            if name == "entity":
+                value = snapshot.entities[value]
+            elif name == "campaign":
+                value = "/".join(snapshot.campaigns[value])
+            row.append(value.item() if isinstance(value, np.generic) else value)
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a canned aggregate over a columnar snapshot.")
+    parser.add_argument("directory", help="snapshot written by snapshot.py")
+    parser.add_argument("report", choices=sorted(REPORTS))
+    parser.add_argument("--since", help="only donations on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="only donations before this date (YYYY-MM-DD)")
+    parser.add_argument("--half-life", type=float, help="engagement: decay half-life in days")
+    parser.add_argument("--limit", type=int, default=20, help="rows to print")
+    args = parser.parse_args()
+
+    try:
+        snapshot = Snapshot(args.directory)
+    except (OSError, ValueError) as e:
+        print(f"Cannot open snapshot: {e}")
+        return
+    options = {"since": args.since, "until": args.until}
+    if args.report == "engagement":
+        options["half_life_days"] = args.half_life
+    started = time.perf_counter()
+    result = REPORTS[args.report](snapshot, **options)
+    elapsed = time.perf_counter() - started
+    _print_rows(snapshot, result, args.limit)
+    print(f"{len(next(iter(result.values())))} rows in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
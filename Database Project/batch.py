@@ -0,0 +1,194 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+from collections import Counter
+
+import psycopg
+
+from config import load_conninfo
+from outcomes import INVALID
+from queries import (CREATE_CAMPAIGN, MAKE_DONATION, REGISTER_DONOR, REPORT_QUERIES, SCHEDULE_VOLUNTEER, STATEMENTS,
+                     report_query)
+
+# Runs a JSONL stream of operations over one connection without prompts, e.g.
+#   {"op": "register_donor", "email": "a@example.org", "name": "Ann"}
+#   {"op": "make_donation", "email": "a@example.org", "issue": "Climate", "location": "Victoria",
+#    "start_date": "2023-01-01", "donation_date": "2023-02-01", "amount": 25}
+#   {"op": "report", "name": "Query3"}
+# and writes one JSONL result per operation, in input order. An "id" field is
+# copied to the result. Operations are taken in batches: each batch is one
+# transaction, and its statements are sent in a single pipeline, so a batch
+# costs about one round trip instead of one per operation.
+DEFAULT_BATCH_SIZE = 500
+
+# The single-statement write commands, which report their outcome instead of
+# raising on a duplicate or an unknown reference, so one of them cannot abort
+# the rest of a pipeline. Fields are listed in parameter order.
+WRITE_OPERATIONS = {
+    "create_campaign": (CREATE_CAMPAIGN, ["issue", "location", "start_date", "duration_days", "phase", "budget",
+                                          "website_push_date"]),
+    "register_donor": (REGISTER_DONOR, ["email", "name"]),
+    "make_donation": (MAKE_DONATION, ["email", "issue", "location", "start_date", "donation_date", "amount"]),
+    "schedule_volunteer": (SCHEDULE_VOLUNTEER, ["email", "issue", "location", "start_date", "scheduled_date"]),
+}
+OPERATIONS = sorted(WRITE_OPERATIONS) + ["report"]
+
+
+def read_operations(stream):
+    # (line number, operation) for every non-blank line; a line that is not a
+    # JSON object comes back as an error string instead
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            operation = json.loads(line)
+        except ValueError as e:
+            yield number, f"not valid JSON: {e}"
+            continue
+        yield number, operation if isinstance(operation, dict) else "not a JSON object"
+
+
+def statement(operation):
+    # The (query, params) of one operation; ValueError when it is malformed
+    kind = operation.get("op")
+    if kind == "report":
+        if operation.get("name") not in REPORT_QUERIES:
+            raise ValueError(f"report needs a name, one of {', '.join(REPORT_QUERIES)}")
+        return report_query(operation["name"], operation.get("since"), operation.get("until"))
+    if kind not in WRITE_OPERATIONS:
+        raise ValueError(f"unknown op {kind!r}; expected one of {', '.join(OPERATIONS)}")
+    name, fields = WRITE_OPERATIONS[kind]
+    missing = [field for field in fields if field not in operation]
+    if missing:
+        raise ValueError(f"{kind} needs {', '.join(missing)}")
+    return STATEMENTS.query(name), tuple(operation[field] for field in fields)
+
+
+def _result(number, operation, **fields):
+    result = {"line": number}
+    if isinstance(operation, dict):
+        if "id" in operation:
+            result["id"] = operation["id"]
+        result["op"] = operation.get("op")
+    result.update(fields)
+    return result
+
+
+def _collect(number, operation, cursor):
+    # The result of an executed operation from its cursor
+    rows = cursor.fetchall()
+    if operation["op"] == "report":
+        return _result(number, operation, outcome="ok", name=operation["name"],
+                       columns=[column.name for column in cursor.description], rows=rows)
+    return _result(number, operation, outcome=rows[0][0])
+
+
+def run_batch(connection, batch):
+    # Run [(line number, operation)] as one transaction and return their
+    # results in order. Statements are pipelined. A statement that still
+    # fails (a check violation, a malformed date) aborts the pipeline, so the
+    # batch is then rolled back and re-run one statement at a time, each
+    # under a savepoint, to fail only the bad operations.
+    results = [None] * len(batch)
+    pending = []
+    for i, (number, operation) in enumerate(batch):
+        if isinstance(operation, str):
+            results[i] = _result(number, operation, outcome=INVALID, error=operation)
+            continue
+        try:
+            pending.append((i, number, operation, statement(operation)))
+        except ValueError as e:
+            results[i] = _result(number, operation, outcome=INVALID, error=str(e))
+    if not pending:
+        return results
+
+    try:
+        with connection.transaction():
+            cursors = []
+            with connection.pipeline():
+                for i, number, operation, (query, params) in pending:
+                    cursor = connection.cursor()
+                    cursor.execute(query, params)
+                    cursors.append((i, number, operation, cursor))
+            for i, number, operation, cursor in cursors:
+                results[i] = _collect(number, operation, cursor)
+                cursor.close()
+        return results
+    except psycopg.OperationalError:
+        raise
+    except psycopg.Error:
+        pass
+
+    with connection.transaction():
+        for i, number, operation, (query, params) in pending:
+            try:
+                with connection.transaction(), connection.cursor() as cursor:
+                    cursor.execute(query, params)
+                    results[i] = _collect(number, operation, cursor)
+            except psycopg.OperationalError:
+                raise
+            except psycopg.Error as e:
+                results[i] = _result(number, operation, outcome=INVALID, error=str(e).strip())
+    return results
+
+
+def run(connection, operations, out, batch_size=DEFAULT_BATCH_SIZE):
+    # Run an iterable of (line number, operation) and write each result to out
+    # as a JSON line as soon as its batch commits; returns (outcome counts,
+    # operation count)
+    outcomes = Counter()
+    count = 0
+    operations = iter(operations)
+    while True:
+        batch = list(itertools.islice(operations, batch_size))
+        if not batch:
+            break
+        for result in run_batch(connection, batch):
+            outcomes[result["outcome"]] += 1
+            out.write(json.dumps(result, default=str) + "\n")
+        out.flush()
+        count += len(batch)
+    return outcomes, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of gng operations without prompts.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL operations, or - for stdin (the default)")
+    parser.add_argument("--output", default="-", help="where to write the JSONL results; - for stdout")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="operations per transaction")
+    parser.add_argument("--config", help="config file with a [database] section (see config.py)")
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    try:
+        connection = psycopg.connect(load_conninfo(args.config), autocommit=True)
+    except (ValueError, psycopg.OperationalError) as e:
+        print(f"The error '{e}' occurred", file=sys.stderr)
+        return 1
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    started = time.perf_counter()
+    try:
+        outcomes, count = run(connection, read_operations(source), out, args.batch_size)
+    except psycopg.Error as e:
+        print(f"Batch run failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        connection.close()
+        for stream in (source, out):
+            if stream not in (sys.stdin, sys.stdout):
+                stream.close()
+    # The summary goes to stderr so stdout stays pure JSONL
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0.0
+    summary = ", ".join(f"{outcome}: {n}" for outcome, n in sorted(outcomes.items()))
+    print(f"{count} operations in {elapsed:.2f}s ({rate:.0f} ops/s); {summary}", file=sys.stderr)
+    return 1 if outcomes[INVALID] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import psycopg
+import psycopg2
+from psycopg2 import OperationalError
+
+from datagen import generate
+from instrumentation import METRICS, InstrumentedConnection
+from queries import BOUNDED_REPORTS, CAMPAIGN_EXISTS, ENTITY_EXISTS, REPORT_QUERIES, STATEMENTS
+from service import ServiceClient
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+# A p95 this much slower than the baseline counts as a regression
+REGRESSION_RATIO = 1.2
+
+
+async def _count(name, rows):
+    # stream_report is an async generator, which instrumented() does not
+    # wrap, so its span is opened here
+    count = 0
+    with METRICS.operation(name):
+        async for _ in rows:
+            count += 1
+    return count
+
+
+def _call(client, name, make):
+    # Run the coroutine make(i) returns on the service's event loop. The
+    # service method's own span is recorded under the benchmark's name for
+    # it, so the ten reports run through GngService.report stay apart.
+    def run(i):
+        async def labelled():
+            with METRICS.labelled(name):
+                return await make(i)
+        return client.call(labelled())
+    return run
+
+
+def _samples(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT entity_email FROM Donations GROUP BY entity_email ORDER BY COUNT(*) DESC LIMIT 1;")
+        email = cursor.fetchone()[0]
+        cursor.execute("SELECT issue, location, start_date FROM Campaigns ORDER BY issue, location, start_date LIMIT 1;")
+        campaign = tuple(str(value) for value in cursor.fetchone())
+        return email, campaign
+    finally:
+        cursor.close()
+        connection.rollback()
+
+
+def operations(client, samples, run_tag):
+    # (name, callable taking the iteration number) for every menu operation,
+    # called on the GngService the menu runs on, with the arguments the menu
+    # passes. Writes use keys unique to this run so they never collide with
+    # earlier runs.
+    service = client.service
+    email, (issue, location, start_date) = samples
+    donor = lambda i: f"bench-{run_tag}-{i}@example.org"
+    volunteer = lambda i: f"bench-vol-{run_tag}-{i}@example.org"
+    ops = []
+    for name in REPORT_QUERIES:
+        if name in BOUNDED_REPORTS:
+            ops.append((name, lambda i, name=name: service.report(name)))
+        else:
+            # The menu prints these as they stream in
+            ops.append((name, lambda i, name=name: _count(name, service.stream_report(name))))
+    ops += [
+        ("view_campaign_status", lambda i: service.campaign_status(issue, location, start_date)),
+        ("print_accounting_report", lambda i: service.accounting_report()),
+        ("calculate_engagement_score", lambda i: service.engagement_scores()),
+        ("member_activity_dashboard", lambda i: service.member_dashboard(email)),
+        # Growing prefixes, as an autocomplete sends them
+        ("search_campaigns", lambda i: service.search("campaigns", issue[:3 + i % 5])),
+        ("search_entities", lambda i: service.search("entities", email[:3 + i % 5])),
+        ("register_donor", lambda i: service.register_donor(donor(i), "Bench Donor")),
+        ("make_donation", lambda i: service.make_donation(donor(i), issue, location, start_date, start_date, "25")),
+        ("create_campaign", lambda i: service.create_campaign(f"Bench {run_tag} {i}", location, start_date, "30",
+                                                              "Planning", "5000", start_date)),
+        ("add_volunteer", lambda i: service.add_volunteer(volunteer(i), "Bench Volunteer", "1", issue, location,
+                                                          start_date, start_date)),
+        ("schedule_volunteer", lambda i: service.schedule_volunteer(volunteer(i), issue, location, start_date,
+                                                                    f"{int(start_date[:4]) + 1}{start_date[4:]}")),
+        ("add_campaign_annotation", lambda i: service.add_campaign_annotation(issue, location, start_date,
+                                                                              f"bench {run_tag} {i}")),
+        ("add_membership_history", lambda i: service.add_membership_history(donor(i), issue, location, start_date,
+                                                                            start_date, start_date, "bench")),
+        ("update_membership_history_annotation", lambda i: service.update_membership_history_annotation(
+            donor(i), issue, location, start_date, f"bench {i}")),
+    ]
+    return [(name, _call(client, name, make)) for name, make in ops]
+
+
+def _percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def peak_kib(operation, i):
+    # Peak client-side allocation of one call, kept out of the timed runs
+    # because tracemalloc slows them
+    tracemalloc.start()
+    try:
+        operation(i)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def measure(operation, iterations, offset=0):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        operation(offset + i)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "ops_per_sec": iterations / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def _ended(connection, operation):
+    # Readers never commit; end their transaction so each call starts fresh
+    def run(i):
+        operation(i)
+        connection.rollback()
+    return run
+
+
+def run_benchmarks(client, samples, iterations=20, only=None):
+    run_tag = str(int(time.time()))
+    selected = [(name, operation) for name, operation in operations(client, samples, run_tag)
+                if not only or name in only]
+    # The call under tracemalloc also warms each operation up (pool
+    # connections, prepared statements). METRICS is reset afterwards so it
+    # holds the timed calls only, and data loading is left out of it too.
+    peaks = {name: peak_kib(operation, iterations) for name, operation in selected}
+    METRICS.reset()
+    results = {}
+    for name, operation in selected:
+        results[name] = measure(operation, iterations)
+        results[name]["peak_kib"] = peaks[name]
+    return results
+
+
+def prepared_vs_plain(connection, samples, iterations=200):
+    # Per-call latency of each read-only registered statement on a psycopg
+    # connection, run unprepared (parsed and planned every time) against
+    # prepare=True, which is how GngService runs them
+    email, campaign = samples
+    params = {ENTITY_EXISTS: (email,), CAMPAIGN_EXISTS: campaign}
+    results = {}
+    cursor = connection.cursor()
+    try:
+        for name in STATEMENTS.names():
+            if not STATEMENTS.query(name).lstrip().lower().startswith("select"):
+                continue
+            args = params.get(name) or None
+
+            def plain(i, name=name, args=args):
+                cursor.execute(STATEMENTS.query(name), args, prepare=False)
+                cursor.fetchall()
+
+            def prepared(i, name=name, args=args):
+                cursor.execute(STATEMENTS.query(name), args, prepare=True)
+                cursor.fetchall()
+
+            plain_result = measure(_ended(connection, plain), iterations)
+            prepared(0)
+            prepared_result = measure(_ended(connection, prepared), iterations)
+            results[name] = {
+                "plain_p50_ms": plain_result["p50_ms"],
+                "prepared_p50_ms": prepared_result["p50_ms"],
+                "saving_ms": plain_result["mean_ms"] - prepared_result["mean_ms"],
+            }
+    finally:
+        cursor.close()
+    return results
+
+
+def compare(results, baseline, ratio=REGRESSION_RATIO):
+    # Returns (name, baseline p95, current p95) for operations that regressed
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("operations", {}).get(name)
+        if previous and previous["p95_ms"] > 0 and current["p95_ms"] > previous["p95_ms"] * ratio:
+            regressions.append((name, previous["p95_ms"], current["p95_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every gng menu operation.")
+    parser.add_argument("--scale", type=float, default=1.0, help="scale factor of the loaded data")
+    parser.add_argument("--generate", action="store_true", help="load synthetic data at --scale first")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--only", nargs="*", help="operation names to run")
+    parser.add_argument("--save", action="store_true", help="write the results as the baseline for --scale")
+    parser.add_argument("--compare", help="baseline JSON to compare against (default: the one for --scale)")
+    parser.add_argument("--prepared", action="store_true", help="compare prepared statements with plain execute")
+    parser.add_argument("--metrics", metavar="PREFIX",
+                        help="instrument the run and write PREFIX.prom and PREFIX.json")
+    parser.add_argument("--slow-ms", type=float, default=500.0, help="slow query threshold for --slow-log")
+    parser.add_argument("--slow-log", help="append statements slower than --slow-ms with their plans to this file")
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    args = parser.parse_args()
+
+    if args.slow_log:
+        METRICS.configure(args.slow_ms / 1000, args.slow_log)
+    # Data loading runs over psycopg2. Its instrumented cursors add a little
+    # client overhead, so they are only used when asked for; the service's
+    # are always on.
+    instrument = args.metrics or args.slow_log
+    try:
+        connection = psycopg2.connect(args.dsn, connection_factory=InstrumentedConnection if instrument else None)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return 2
+    try:
+        if args.generate:
+            generate(connection, scale=args.scale)
+        samples = _samples(connection)
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return 2
+    finally:
+        connection.close()
+
+    if args.prepared:
+        try:
+            with psycopg.connect(args.dsn) as connection:
+                results = prepared_vs_plain(connection, samples, args.iterations)
+        except psycopg.Error as e:
+            print(f"Database error: {e}")
+            return 2
+        print(f"{'statement':24} {'plain p50 ms':>13} {'prepared p50 ms':>16} {'saving/call ms':>15}")
+        for name, r in results.items():
+            print(f"{name:24} {r['plain_p50_ms']:13.3f} {r['prepared_p50_ms']:16.3f} {r['saving_ms']:15.3f}")
+        return 0
+
+    # The caches would answer repeated reads without touching the database
+    try:
+        client = ServiceClient(args.dsn, cache=None, search_cache=None)
+    except psycopg.Error as e:
+        print(f"The error '{e}' occurred")
+        return 2
+    try:
+        results = run_benchmarks(client, samples, args.iterations, args.only)
+    except psycopg.Error as e:
+        print(f"Database error: {e}")
+        return 2
+    finally:
+        client.close()
+
+    print(f"{'operation':40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'peak KiB':>9}")
+    for name, r in results.items():
+        print(f"{name:40} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f} {r['ops_per_sec']:9.1f} {r['peak_kib']:9.1f}")
+    rss_kib = None
+    if sys.platform != "win32":
+        import resource
+        rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"Max RSS: {rss_kib} KiB")
+
+    if args.metrics:
+        METRICS.write_prometheus(f"{args.metrics}.prom")
+        METRICS.write_json(f"{args.metrics}.json")
+        print(f"{'operation':40} {'stmts/call':>10} {'trips/call':>10} {'rows':>10}  slowest statement")
+        for name, m in METRICS.snapshot().items():
+            print(f"{name:40} {m['statements_per_call']:10.1f} {m['round_trips_per_call']:10.1f} {m['rows']:10d}  "
+                  f"{m['slowest_statement']['ms']:.1f} ms {(m['slowest_statement']['sql'] or '')[:60]}")
+
+    report = {"scale": args.scale, "iterations": args.iterations, "max_rss_kib": rss_kib, "operations": results}
+    baseline_path = args.compare or os.path.join(BASELINE_DIR, f"baseline-sf{args.scale:g}.json")
+    status = 0
+    if os.path.exists(baseline_path) and not args.save:
+        with open(baseline_path, encoding="utf-8") as handle:
+            regressions = compare(results, json.load(handle))
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: p95 {before:.2f} ms -> {after:.2f} ms")
+        status = 1 if regressions else 0
+    if args.save:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"Baseline written to {baseline_path}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
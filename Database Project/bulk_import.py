@@ -0,0 +1,288 @@
+import argparse
+import csv
+import io
+import json
+import os
+import time
+
+import psycopg2
+from psycopg2 import OperationalError, sql
+
+DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}$'
+NUMERIC_PATTERN = r'^-?\d+(\.\d+)?$'
+
+# Try-casts for the typed columns, created in pg_temp for the session. The
+# patterns above only check the shape of a value; these also reject values
+# such as 2023-02-30 that have the right shape but whose cast would fail and
+# abort the whole import.
+TRY_CAST_DDL = "".join(f"""
+CREATE OR REPLACE FUNCTION pg_temp.gng_is_{kind}(value text) RETURNS boolean AS $$
+BEGIN
+    PERFORM value::{kind};
+    RETURN true;
+EXCEPTION WHEN data_exception THEN
+    RETURN false;
+END;
+$$ LANGUAGE plpgsql STABLE;
+""" for kind in ["date", "numeric"])
+
+# Per-table import description: the column order, how each column is typed and
+# validated, and which columns must be present. Every table references Entity
+# through entity_email and Campaigns through the campaign_* triple.
+IMPORT_SPECS = {
+    "donations": {
+        "table": "Donations",
+        "columns": ["entity_email", "campaign_issue", "campaign_location",
+                    "campaign_start_date", "donation_date", "amount"],
+        "types": {"campaign_start_date": "date", "donation_date": "date", "amount": "numeric"},
+        "nullable": set(),
+    },
+    "scheduled": {
+        "table": "Scheduled",
+        "columns": ["entity_email", "campaign_issue", "campaign_location",
+                    "campaign_start_date", "scheduled_date"],
+        "types": {"campaign_start_date": "date", "scheduled_date": "date"},
+        "nullable": set(),
+    },
+    "membershiphistory": {
+        "table": "MembershipHistory",
+        "columns": ["entity_email", "campaign_issue", "campaign_location",
+                    "campaign_start_date", "involvement_start_date",
+                    "involvement_end_date", "annotations"],
+        "types": {"campaign_start_date": "date", "involvement_start_date": "date",
+                  "involvement_end_date": "date"},
+        "nullable": {"involvement_end_date", "annotations"},
+    },
+}
+
+
+class IterStream(io.TextIOBase):
+    # Minimal file-like object over an iterator of strings so copy_expert can
+    # pull converted rows on demand instead of holding the whole file.
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _jsonl_as_csv(handle, columns):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for line_no, line in enumerate(handle, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {line_no} is not valid JSON: {e}")
+        # Missing keys and JSON nulls both become SQL NULL (an unquoted empty field)
+        writer.writerow(["" if record.get(col) is None else str(record[col]) for col in columns])
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+
+
+def _column_lengths(cursor, spec):
+    # {column: maximum length} for the target table's VARCHAR columns
+    cursor.execute("""
+        SELECT column_name, character_maximum_length
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND character_maximum_length IS NOT NULL;
+    """, (spec["table"].lower(),))
+    return dict(cursor.fetchall())
+
+
+def _validation_condition(spec, lengths):
+    checks = []
+    for col in spec["columns"]:
+        ident = sql.Identifier(col)
+        kind = spec["types"].get(col)
+        if kind:
+            pattern = DATE_PATTERN if kind == "date" else NUMERIC_PATTERN
+            check = sql.SQL("{} ~ {} AND pg_temp.{}({})").format(
+                ident, sql.Literal(pattern), sql.Identifier(f"gng_is_{kind}"), ident)
+        else:
+            check = sql.SQL("{} <> ''").format(ident)
+            if col in lengths:
+                # Longer values would fail the insert rather than be truncated
+                check = sql.SQL("{} AND char_length({}) <= {}").format(check, ident, sql.Literal(lengths[col]))
+        if col in spec["nullable"]:
+            check = sql.SQL("({} IS NULL OR {})").format(ident, check)
+        else:
+            check = sql.SQL("({} IS NOT NULL AND {})").format(ident, check)
+        checks.append(check)
+    return sql.SQL(" AND ").join(checks)
+
+
+def _typed_columns(spec):
+    typed = []
+    for col in spec["columns"]:
+        kind = spec["types"].get(col)
+        if kind:
+            typed.append(sql.SQL("{}::{} AS {}").format(sql.Identifier(col), sql.SQL(kind), sql.Identifier(col)))
+        else:
+            typed.append(sql.Identifier(col))
+    return sql.SQL(", ").join(typed)
+
+
+def _copy_in(cursor, spec, path, fmt):
+    columns = spec["columns"]
+    with open(path, newline="", encoding="utf-8") as handle:
+        if fmt == "csv":
+            header = next(csv.reader([handle.readline()]), [])
+            header = [name.strip().lower() for name in header]
+            unknown = set(header) - set(columns)
+            missing = set(columns) - set(header) - spec["nullable"]
+            if unknown or missing:
+                raise ValueError(f"CSV header mismatch (unknown: {sorted(unknown)}, missing: {sorted(missing)})")
+            copy_columns, source = header, handle
+        else:
+            copy_columns, source = columns, IterStream(_jsonl_as_csv(handle, columns))
+        copy_stmt = sql.SQL("COPY bulk_stage ({}) FROM STDIN WITH (FORMAT csv)").format(
+            sql.SQL(", ").join(sql.Identifier(col) for col in copy_columns))
+        cursor.copy_expert(copy_stmt.as_string(cursor), source, size=65536)
+        return cursor.rowcount
+
+
+def bulk_import(connection, kind, path, error_path=None, fmt=None):
+    # Stream a CSV/JSONL file into a staging table with COPY, check the Entity
+    # and Campaigns references with one set-based join, merge the valid rows in
+    # a single transaction and write the rejects to error_path.
+    spec = IMPORT_SPECS[kind.lower()]
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+    error_path = error_path or path + ".rejects.csv"
+    columns = sql.SQL(", ").join(sql.Identifier(col) for col in spec["columns"])
+    started = time.perf_counter()
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql.SQL("""
+            CREATE TEMP TABLE bulk_stage (
+                line_no BIGSERIAL,
+                {}
+            ) ON COMMIT DROP;
+        """).format(sql.SQL(", ").join(
+            sql.SQL("{} TEXT").format(sql.Identifier(col)) for col in spec["columns"])))
+        staged = _copy_in(cursor, spec, path, fmt)
+
+        # Cast the well-formed rows, then resolve both foreign keys in one join.
+        # Every row that would fail a cast or a length limit is rejected here,
+        # one by one, instead of failing the whole import.
+        cursor.execute(TRY_CAST_DDL)
+        valid = _validation_condition(spec, _column_lengths(cursor, spec))
+        cursor.execute(sql.SQL("""
+            CREATE TEMP TABLE bulk_typed ON COMMIT DROP AS
+            SELECT line_no, {} FROM bulk_stage WHERE {};
+        """).format(_typed_columns(spec), valid))
+        cursor.execute(sql.SQL("""
+            CREATE TEMP TABLE bulk_checked ON COMMIT DROP AS
+            SELECT t.*, e.email IS NOT NULL AS entity_ok, c.issue IS NOT NULL AS campaign_ok,
+                   e.entity_id, c.campaign_id
+            FROM bulk_typed t
+            LEFT JOIN Entity e ON e.email = t.entity_email
+            LEFT JOIN Campaigns c ON c.issue = t.campaign_issue
+                AND c.location = t.campaign_location
+                AND c.start_date = t.campaign_start_date;
+        """))
+
+        # The surrogate keys come from the same join, sparing the key
+        # resolution trigger a lookup per row
+        cursor.execute(sql.SQL("""
+            INSERT INTO {} ({}, entity_id, campaign_id)
+            SELECT {}, entity_id, campaign_id FROM bulk_checked
+            WHERE entity_ok AND campaign_ok
+            ON CONFLICT DO NOTHING;
+        """).format(sql.Identifier(spec["table"].lower()), columns, columns))
+        inserted = cursor.rowcount
+
+        # Rejects are streamed straight from the server into the error file
+        reject_query = sql.SQL("""
+            COPY (
+                SELECT line_no, {cols}, 'malformed value' AS reason
+                FROM bulk_stage WHERE ({valid}) IS NOT TRUE
+                UNION ALL
+                SELECT line_no, {text_cols},
+                       CASE WHEN NOT entity_ok THEN 'unknown entity' ELSE 'unknown campaign' END
+                FROM bulk_checked WHERE NOT (entity_ok AND campaign_ok)
+                ORDER BY line_no
+            ) TO STDOUT WITH (FORMAT csv, HEADER true)
+        """).format(cols=columns, valid=valid, text_cols=sql.SQL(", ").join(
+            sql.SQL("{}::text AS {}").format(sql.Identifier(col), sql.Identifier(col)) for col in spec["columns"]))
+        with open(error_path, "w", newline="", encoding="utf-8") as errors_out:
+            cursor.copy_expert(reject_query.as_string(cursor), errors_out, size=65536)
+            rejected = cursor.rowcount
+
+        connection.commit()
+    except (ValueError, OSError) as e:
+        connection.rollback()
+        print(f"Import failed: {e}")
+        return None
+    except OperationalError as e:
+        connection.rollback()
+        print(f"The error '{e}' occurred")
+        return None
+    except psycopg2.Error as e:
+        connection.rollback()
+        print(f"An error occurred: {e}")
+        return None
+    finally:
+        cursor.close()
+
+    elapsed = time.perf_counter() - started
+    if rejected == 0 and os.path.exists(error_path):
+        os.remove(error_path)
+    return {
+        "table": spec["table"],
+        "staged": staged,
+        "inserted": inserted,
+        "duplicates": staged - rejected - inserted,
+        "rejected": rejected,
+        "error_file": error_path if rejected else None,
+        "seconds": elapsed,
+        "rows_per_second": staged / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load Donations, Scheduled or MembershipHistory rows.")
+    parser.add_argument("table", choices=sorted(IMPORT_SPECS))
+    parser.add_argument("path", help="CSV (with header) or JSONL file to import")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--errors", help="where to write rejected rows (default: <path>.rejects.csv)")
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    args = parser.parse_args()
+
+    try:
+        connection = psycopg2.connect(args.dsn)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return
+    try:
+        result = bulk_import(connection, args.table, args.path, args.errors, args.format)
+    finally:
+        connection.close()
+    if result is not None:
+        print(f"{result['table']}: {result['staged']} rows read, {result['inserted']} inserted, "
+              f"{result['duplicates']} duplicates skipped, {result['rejected']} rejected "
+              f"in {result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s)")
+        if result["error_file"]:
+            print(f"Rejected rows written to {result['error_file']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import select
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+
+# Tables each canned report reads. Query3, Query8 and Query9 read
+# CampaignTotals, which changes exactly when Donations does.
+REPORT_TABLES = {
+    "Query1": {"entity", "donations"},
+    "Query2": {"donations"},
+    "Query3": {"campaigns", "donations"},
+    "Query4": {"member", "employee"},
+    "Query5": {"campaigns", "donations"},
+    "Query6": {"scheduled"},
+    "Query7": {"entity", "volunteer", "member", "employee"},
+    "Query8": {"donations"},
+    "Query9": {"donations"},
+    "Query10": {"campaigns"},
+}
+
+# Tables changed by each write operation
+WRITE_TABLES = {
+    "create_campaign": {"campaigns"},
+    "add_volunteer": {"entity", "volunteer", "scheduled"},
+    "schedule_volunteer": {"scheduled"},
+    "make_donation": {"donations"},
+    "register_donor": {"entity"},
+    "add_campaign_annotation": {"campaigns"},
+    "add_membership_history": {"membershiphistory"},
+    "update_membership_history_annotation": {"membershiphistory"},
+}
+
+# The channel of the statement-level triggers that migration 0006 installs on
+# the cached tables, so other processes can drop their cached results
+NOTIFY_CHANNEL = "gng_table_changed"
+
+
+class ResultCache:
+    # In-process LRU cache of report results with a TTL. Entries are bounded
+    # both in number and in total rows, and are dropped as soon as a table
+    # they were read from is written.
+
+    def __init__(self, max_entries=64, max_rows=200_000, ttl=30.0):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, tables, columns, rows)
+        self._rows = 0
+        # Bumped on every write to a table; a result fetched across a bump is
+        # not stored, since it may predate the write. clear() bumps the epoch,
+        # which counts as a write to every table.
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _generation(self, tables):
+        return (self._epoch,) + tuple(self._generations.get(table, 0) for table in sorted(tables))
+
+    def generation(self, tables):
+        with self._lock:
+            return self._generation(tables)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2], entry[3]
+
+    def put(self, key, tables, columns, rows, generation=None):
+        rows = list(rows)
+        with self._lock:
+            if generation is not None and generation != self._generation(tables):
+                return False
+            if len(rows) > self.max_rows:
+                return False
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, frozenset(tables), columns, rows)
+            self._rows += len(rows)
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._rows -= len(entry[3])
+
+    def invalidate(self, tables):
+        tables = {table.lower() for table in tables}
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            stale = [key for key, entry in self._entries.items() if entry[1] & tables]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def invalidate_after(self, operation):
+        return self.invalidate(WRITE_TABLES[operation])
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._rows = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "rows": self._rows,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+# Shared by the service layer and the psycopg2 tools in this process
+REPORT_CACHE = ResultCache()
+# Campaign and entity search results (search.py): many small entries, one per
+# prefix typed into an autocomplete
+SEARCH_CACHE = ResultCache(max_entries=4096, max_rows=50_000, ttl=60.0)
+
+
+def invalidate_after(operation):
+    # Drop what a successful write made stale from every cache in this process
+    return sum(cache.invalidate_after(operation) for cache in (REPORT_CACHE, SEARCH_CACHE))
+
+
+class CacheInvalidationListener:
+    # Background thread that LISTENs for table-change notifications from
+    # other processes and invalidates the matching cache entries. GngService
+    # starts one for its caches; start one yourself for the psycopg2 tools.
+
+    def __init__(self, dsn, caches=(REPORT_CACHE, SEARCH_CACHE), poll_interval=5.0):
+        self.dsn = dsn
+        self.caches = caches
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        # Written by stop() so the thread does not sit out a whole poll_interval
+        self._wakeup, self._waker = socket.socketpair()
+        self._thread = threading.Thread(target=self._run, name="gng-cache-listener", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._waker.send(b"\0")
+        self._thread.join()
+        self._wakeup.close()
+        self._waker.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                connection = psycopg2.connect(self.dsn)
+            except psycopg2.OperationalError:
+                self._stop.wait(self.poll_interval)
+                continue
+            try:
+                connection.autocommit = True
+                cursor = connection.cursor()
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL};")
+                cursor.close()
+                # Notifications may have been missed while disconnected
+                for cache in self.caches:
+                    cache.clear()
+                while not self._stop.is_set():
+                    readable, _, _ = select.select([connection, self._wakeup], [], [], self.poll_interval)
+                    if connection not in readable:
+                        continue
+                    connection.poll()
+                    tables = {notify.payload for notify in connection.notifies}
+                    connection.notifies.clear()
+                    if tables:
+                        for cache in self.caches:
+                            cache.invalidate(tables)
+            except psycopg2.Error:
+                self._stop.wait(self.poll_interval)
+            finally:
+                connection.close()
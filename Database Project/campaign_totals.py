@@ -0,0 +1,239 @@
+import argparse
+import os
+
+import psycopg2
+from psycopg2 import OperationalError
+
+from keys import CAMPAIGN_COLUMNS
+from partitions import donation_date_range
+
+# Per-campaign donation aggregates kept in step with Donations by
+# statement-level triggers, so reports read one row per campaign instead of
+# re-aggregating the whole donation history. Migration 0003 keeps its own
+# copy of this text; a change here also needs a new migration.
+CAMPAIGN_TOTALS_DDL = """
+CREATE TABLE IF NOT EXISTS CampaignTotals (
+    campaign_issue VARCHAR(255),
+    campaign_location VARCHAR(255),
+    campaign_start_date DATE,
+    donation_sum NUMERIC NOT NULL DEFAULT 0,
+    donation_count BIGINT NOT NULL DEFAULT 0,
+    donation_max NUMERIC,
+    PRIMARY KEY (campaign_issue, campaign_location, campaign_start_date),
+    FOREIGN KEY (campaign_issue, campaign_location, campaign_start_date)
+      REFERENCES Campaigns(issue, location, start_date) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION campaign_totals_add() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO CampaignTotals AS t (campaign_issue, campaign_location, campaign_start_date,
+                                     donation_sum, donation_count, donation_max)
+    SELECT campaign_issue, campaign_location, campaign_start_date,
+           COALESCE(SUM(amount), 0), COUNT(*), MAX(amount)
+    FROM new_rows
+    GROUP BY campaign_issue, campaign_location, campaign_start_date
+    ON CONFLICT (campaign_issue, campaign_location, campaign_start_date) DO UPDATE
+    SET donation_sum = t.donation_sum + EXCLUDED.donation_sum,
+        donation_count = t.donation_count + EXCLUDED.donation_count,
+        donation_max = GREATEST(t.donation_max, EXCLUDED.donation_max);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION campaign_totals_remove() RETURNS trigger AS $$
+BEGIN
+    -- Sums and counts are subtracted; the max can only be recomputed, and
+    -- only for campaigns whose current max was one of the removed amounts
+    WITH removed AS (
+        SELECT campaign_issue, campaign_location, campaign_start_date,
+               COALESCE(SUM(amount), 0) AS amount_sum, COUNT(*) AS amount_count,
+               MAX(amount) AS amount_max
+        FROM old_rows
+        GROUP BY campaign_issue, campaign_location, campaign_start_date
+    )
+    UPDATE CampaignTotals t
+    SET donation_sum = t.donation_sum - r.amount_sum,
+        donation_count = t.donation_count - r.amount_count,
+        donation_max = CASE
+            WHEN r.amount_max IS NULL OR r.amount_max < t.donation_max THEN t.donation_max
+            ELSE (SELECT MAX(d.amount) FROM Donations d
+                  WHERE d.campaign_issue = t.campaign_issue
+                    AND d.campaign_location = t.campaign_location
+                    AND d.campaign_start_date = t.campaign_start_date)
+        END
+    FROM removed r
+    WHERE t.campaign_issue = r.campaign_issue
+      AND t.campaign_location = r.campaign_location
+      AND t.campaign_start_date = r.campaign_start_date;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS campaign_totals_insert ON Donations;
+CREATE TRIGGER campaign_totals_insert
+    AFTER INSERT ON Donations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_add();
+
+DROP TRIGGER IF EXISTS campaign_totals_delete ON Donations;
+CREATE TRIGGER campaign_totals_delete
+    AFTER DELETE ON Donations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_remove();
+
+-- An UPDATE is applied as removing the old rows and adding the new ones
+DROP TRIGGER IF EXISTS campaign_totals_update_remove ON Donations;
+CREATE TRIGGER campaign_totals_update_remove
+    AFTER UPDATE ON Donations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_remove();
+
+DROP TRIGGER IF EXISTS campaign_totals_update_add ON Donations;
+CREATE TRIGGER campaign_totals_update_add
+    AFTER UPDATE ON Donations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_add();
+"""
+
+RECOMPUTE_QUERY = """
+    SELECT campaign_issue, campaign_location, campaign_start_date,
+           COALESCE(SUM(amount), 0) AS donation_sum, COUNT(*) AS donation_count, MAX(amount) AS donation_max
+    FROM Donations
+    GROUP BY campaign_issue, campaign_location, campaign_start_date
+"""
+
+# Report queries that read the summary instead of scanning Donations. They
+# return the same rows as the Query3, Query8 and Query9 views.
+CAMPAIGNS_OVER_1000_QUERY = f"""
+    select {CAMPAIGN_COLUMNS} from Campaigns c where c.issue in (
+        select t.campaign_issue from CampaignTotals t
+        group by t.campaign_issue having SUM(t.donation_sum) > 1000);
+"""
+HIGHEST_DONATION_QUERY = """
+    select campaign_issue, MAX(donation_max) as highest_donation
+    from CampaignTotals where donation_count > 0
+    group by campaign_issue;
+"""
+DONATION_COUNTS_QUERY = """
+    select campaign_issue, SUM(donation_count) as donation_counts
+    from CampaignTotals
+    group by campaign_issue having SUM(donation_count) > 1;
+"""
+
+# Budget coverage per campaign issue for print_accounting_report
+ACCOUNTING_REPORT_QUERY = """
+    SELECT c.issue, c.budget, COALESCE(SUM(t.donation_sum), 0) as total_donations
+    FROM Campaigns c
+    LEFT JOIN CampaignTotals t ON c.issue = t.campaign_issue AND c.location = t.campaign_location AND c.start_date = t.campaign_start_date
+    GROUP BY c.issue, c.budget
+    ORDER BY c.issue;
+"""
+
+# The same report over donations made in a date range. CampaignTotals only
+# holds lifetime totals, so this reads Donations, pruned to the partitions in range.
+ACCOUNTING_RANGE_QUERY = """
+    SELECT c.issue, c.budget, COALESCE(SUM(d.amount), 0) as total_donations
+    FROM Campaigns c
+    LEFT JOIN Donations d ON d.campaign_id = c.campaign_id AND {range}
+    GROUP BY c.issue, c.budget
+    ORDER BY c.issue;
+"""
+
+
+def accounting_report_query(since=None, until=None):
+    if not since and not until:
+        return ACCOUNTING_REPORT_QUERY, None
+    condition, params = donation_date_range("d", since, until)
+    return ACCOUNTING_RANGE_QUERY.format(range=condition), params
+
+
+def rebuild_campaign_totals(connection):
+    # Full recompute; used to backfill on install and to repair drift
+    cursor = connection.cursor()
+    try:
+        cursor.execute("LOCK TABLE Donations IN SHARE MODE;")
+        cursor.execute("TRUNCATE CampaignTotals;")
+        cursor.execute(f"""
+            INSERT INTO CampaignTotals (campaign_issue, campaign_location, campaign_start_date,
+                                        donation_sum, donation_count, donation_max)
+            {RECOMPUTE_QUERY};
+        """)
+        connection.commit()
+        return cursor.rowcount
+    except psycopg2.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def install_campaign_totals(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(CAMPAIGN_TOTALS_DDL)
+        connection.commit()
+    except psycopg2.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return rebuild_campaign_totals(connection)
+
+
+def check_campaign_totals(connection):
+    # Compare the summary against a full recompute and return the campaigns
+    # that disagree as (issue, location, start_date, summary, recomputed) tuples
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+            WITH actual AS ({RECOMPUTE_QUERY})
+            SELECT COALESCE(t.campaign_issue, a.campaign_issue),
+                   COALESCE(t.campaign_location, a.campaign_location),
+                   COALESCE(t.campaign_start_date, a.campaign_start_date),
+                   t.donation_sum, t.donation_count, t.donation_max,
+                   a.donation_sum, a.donation_count, a.donation_max
+            FROM (SELECT * FROM CampaignTotals WHERE donation_count > 0) t
+            FULL OUTER JOIN actual a
+              ON t.campaign_issue = a.campaign_issue
+             AND t.campaign_location = a.campaign_location
+             AND t.campaign_start_date = a.campaign_start_date
+            WHERE t.donation_sum IS DISTINCT FROM a.donation_sum
+               OR t.donation_count IS DISTINCT FROM a.donation_count
+               OR t.donation_max IS DISTINCT FROM a.donation_max;
+        """)
+        return [(row[0], row[1], row[2], row[3:6], row[6:9]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        connection.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the CampaignTotals summary table.")
+    parser.add_argument("action", choices=["install", "check", "rebuild"])
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    args = parser.parse_args()
+
+    try:
+        connection = psycopg2.connect(args.dsn)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return
+    try:
+        if args.action == "install":
+            print(f"CampaignTotals installed with {install_campaign_totals(connection)} campaigns.")
+        elif args.action == "rebuild":
+            print(f"CampaignTotals rebuilt with {rebuild_campaign_totals(connection)} campaigns.")
+        else:
+            mismatches = check_campaign_totals(connection)
+            if not mismatches:
+                print("CampaignTotals is consistent with Donations.")
+            for issue, location, start_date, summary, actual in mismatches:
+                print(f"Campaign: {issue}, {location}, {start_date}: summary (sum, count, max) = {summary}, recomputed = {actual}")
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
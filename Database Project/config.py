@@ -0,0 +1,36 @@
+import configparser
+import os
+
+from psycopg.conninfo import make_conninfo
+
+# Connection settings for the menu and the batch runner. The first of these
+# that is set wins:
+#   1. a config file passed explicitly (--config)
+#   2. GNG_DSN, a libpq connection string
+#   3. the config file named by GNG_CONFIG, or gng.ini next to this file
+# A config file holds libpq keywords in a [database] section, e.g.
+#   [database]
+#   host = db.example.org
+#   dbname = gng
+#   user = gng
+#   password = ...
+# Anything left unset falls through to libpq, which reads PGHOST, PGUSER,
+# PGPASSWORD, ~/.pgpass and so on.
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gng.ini")
+CONFIG_SECTION = "database"
+
+
+def load_conninfo(path=None):
+    # The libpq connection string to use; raises ValueError for a config file
+    # that was asked for explicitly but cannot be read
+    if path is None and os.environ.get("GNG_DSN"):
+        return os.environ["GNG_DSN"]
+    explicit = path or os.environ.get("GNG_CONFIG")
+    parser = configparser.ConfigParser(interpolation=None)
+    if not parser.read(explicit or DEFAULT_CONFIG, encoding="utf-8"):
+        if explicit:
+            raise ValueError(f"Cannot read config file {explicit}")
+        return ""
+    if not parser.has_section(CONFIG_SECTION):
+        raise ValueError(f"{explicit or DEFAULT_CONFIG} has no [{CONFIG_SECTION}] section")
+    return make_conninfo(**dict(parser[CONFIG_SECTION]))
@@ -0,0 +1,91 @@
+import datetime
+from decimal import Decimal
+
+from streaming import stream_query
+
+# Each activity stream is aggregated to a JSON array of row arrays server-side,
+# so one statement returns everything the dashboard shows. Amounts travel as
+# text to keep NUMERIC precision.
+_DONATIONS_AGG = """
+    COALESCE(json_agg(json_build_array(d.campaign_issue, d.campaign_location, d.donation_date, d.amount::text)
+                      ORDER BY d.donation_date, d.campaign_issue, d.campaign_location), '[]')
+"""
+_VOLUNTEERING_AGG = """
+    COALESCE(json_agg(json_build_array(m.campaign_issue, m.campaign_location, m.campaign_start_date,
+                                       m.involvement_start_date, m.involvement_end_date)
+                      ORDER BY m.involvement_start_date, m.campaign_issue, m.campaign_location), '[]')
+"""
+_SCHEDULED_AGG = """
+    COALESCE(json_agg(json_build_array(s.campaign_issue, s.campaign_location, s.campaign_start_date, s.scheduled_date)
+                      ORDER BY s.scheduled_date, s.campaign_issue, s.campaign_location), '[]')
+"""
+
+MEMBER_DASHBOARD_QUERY = f"""
+    SELECT
+        (SELECT {_DONATIONS_AGG} FROM Donations d WHERE d.entity_email = %(email)s),
+        (SELECT {_VOLUNTEERING_AGG} FROM MembershipHistory m WHERE m.entity_email = %(email)s),
+        (SELECT {_SCHEDULED_AGG} FROM Scheduled s WHERE s.entity_email = %(email)s);
+"""
+
+BATCH_DASHBOARD_QUERY = f"""
+    WITH emails AS (
+        SELECT DISTINCT unnest(%(emails)s::varchar[]) AS email
+    ),
+    donations AS (
+        SELECT d.entity_email, {_DONATIONS_AGG} AS items
+        FROM Donations d JOIN emails e ON e.email = d.entity_email
+        GROUP BY d.entity_email
+    ),
+    volunteering AS (
+        SELECT m.entity_email, {_VOLUNTEERING_AGG} AS items
+        FROM MembershipHistory m JOIN emails e ON e.email = m.entity_email
+        GROUP BY m.entity_email
+    ),
+    scheduled AS (
+        SELECT s.entity_email, {_SCHEDULED_AGG} AS items
+        FROM Scheduled s JOIN emails e ON e.email = s.entity_email
+        GROUP BY s.entity_email
+    )
+    SELECT e.email,
+           COALESCE(d.items, '[]'), COALESCE(v.items, '[]'), COALESCE(s.items, '[]')
+    FROM emails e
+    LEFT JOIN donations d ON d.entity_email = e.email
+    LEFT JOIN volunteering v ON v.entity_email = e.email
+    LEFT JOIN scheduled s ON s.entity_email = e.email
+    ORDER BY e.email
+"""
+
+
+def _date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+
+def build_dashboard(donations, volunteering, scheduled):
+    # Rebuild the same tuples the per-table queries used to return
+    return {
+        "donations": [(issue, location, _date(donated), Decimal(amount) if amount is not None else None)
+                      for issue, location, donated, amount in donations],
+        "volunteering": [(issue, location, _date(start), _date(involved_from), _date(involved_to))
+                         for issue, location, start, involved_from, involved_to in volunteering],
+        "scheduled": [(issue, location, _date(start), _date(scheduled_on))
+                      for issue, location, start, scheduled_on in scheduled],
+    }
+
+
+def get_member_dashboard(connection, entity_email):
+    # All three activity streams for one member in a single round trip
+    cursor = connection.cursor()
+    try:
+        cursor.execute(MEMBER_DASHBOARD_QUERY, {"email": entity_email})
+        return build_dashboard(*cursor.fetchone())
+    finally:
+        cursor.close()
+
+
+def iter_member_dashboards(connection, entity_emails, itersize=500):
+    # Dashboards for many members from one set-based query, yielded as
+    # (email, dashboard) pairs in email order. Rows stream from a server-side
+    # cursor, so a nightly digest over thousands of members stays in bounded memory.
+    rows = stream_query(connection, BATCH_DASHBOARD_QUERY, {"emails": list(entity_emails)}, itersize=itersize)
+    for email, donations, volunteering, scheduled in rows:
+        yield email, build_dashboard(donations, volunteering, scheduled)
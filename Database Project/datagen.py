@@ -0,0 +1,248 @@
+import argparse
+import csv
+import datetime
+import io
+import itertools
+import os
+import random
+import time
+
+import psycopg2
+from psycopg2 import OperationalError
+
+from bulk_import import IterStream
+from keys import SURROGATE_COLUMNS
+from partitions import create_partitions
+
+# Row counts at scale factor 1.0; every table scales linearly
+BASE_ROWS = {
+    "entity": 200_000,
+    "campaigns": 2_000,
+    "donations": 2_000_000,
+    "scheduled": 400_000,
+    "membershiphistory": 300_000,
+}
+# Share of entities holding each role
+ROLE_SHARE = {"volunteer": 0.20, "member": 0.30, "employee": 0.01}
+
+ISSUES = [
+    "Save the Bees", "Clean the Seas", "Plant Trees", "Clean The Lake", "Protect Wetlands",
+    "Stop Plastic", "Urban Gardens", "Clean Air", "Save the Whales", "River Restoration",
+    "Solar Schools", "Wildlife Corridors", "Coral Reefs", "Zero Waste", "Bike Lanes",
+]
+LOCATIONS = [
+    "Meadowville", "Oceanview", "Greenfield", "Carolina", "Grapeville", "Victoria", "Saanich",
+    "Esquimalt", "Oak Bay", "Langford", "Sooke", "Sidney", "Colwood", "Duncan", "Nanaimo",
+]
+PHASES = ["Planning", "Execution", "Executing", "Finalizing"]
+FIRST_NAMES = ["Alice", "Bob", "Carol", "Dave", "Duncan", "Erin", "Frank", "Grace", "Heidi", "Ivan"]
+LAST_NAMES = ["Johnson", "Smith", "Danvers", "Wilson", "Douglas", "Wright", "Nguyen", "Patel", "Garcia", "Chen"]
+
+EPOCH = datetime.date(2015, 1, 1)
+SPAN_DAYS = 11 * 365
+
+# Load order respects the foreign keys; truncation runs in reverse
+TABLES = ["entity", "campaigns", "volunteer", "member", "employee",
+          "donations", "scheduled", "membershiphistory"]
+
+
+def _skewed(rng, n, skew):
+    # Index in [0, n) with a power-law bias towards 0: a few popular campaigns
+    # and frequent donors take most of the activity, like the real data
+    return min(int(n * rng.random() ** skew), n - 1)
+
+
+def _day(offset):
+    return EPOCH + datetime.timedelta(days=offset)
+
+
+def entity_email(i):
+    return f"user{i:07d}@example.org"
+
+
+class SyntheticData:
+    # Deterministic row generators for every table: the same seed and scale
+    # factor always produce the same rows
+
+    def __init__(self, scale=1.0, seed=370, skew=3.0):
+        self.scale = scale
+        self.seed = seed
+        self.skew = skew
+        self.counts = {table: max(1, int(rows * scale)) for table, rows in BASE_ROWS.items()}
+        self.campaign_keys = self._make_campaign_keys()
+
+    def _rng(self, table):
+        # Independent stream per table so regenerating one table is stable
+        return random.Random(f"{self.seed}:{table}")
+
+    def _make_campaign_keys(self):
+        rng = self._rng("campaign_keys")
+        keys = []
+        seen = set()
+        while len(keys) < self.counts["campaigns"]:
+            key = (rng.choice(ISSUES), rng.choice(LOCATIONS), _day(rng.randrange(SPAN_DAYS)))
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+        return keys
+
+    def entity(self):
+        rng = self._rng("entity")
+        for i in range(self.counts["entity"]):
+            yield entity_email(i), f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    def campaigns(self):
+        rng = self._rng("campaigns")
+        for issue, location, start_date in self.campaign_keys:
+            duration = rng.randint(10, 120)
+            push_date = start_date - datetime.timedelta(days=rng.randint(5, 60))
+            yield (issue, location, start_date, duration, rng.choice(PHASES),
+                   rng.randrange(1_000, 100_000, 500), push_date)
+
+    def _role(self, role):
+        rng = self._rng(role)
+        for i in range(self.counts["entity"]):
+            if rng.random() < ROLE_SHARE[role]:
+                yield i, rng
+
+    def volunteer(self):
+        for i, rng in self._role("volunteer"):
+            yield entity_email(i), rng.randint(1, 3)
+
+    def member(self):
+        for i, rng in self._role("member"):
+            yield entity_email(i), _day(rng.randrange(SPAN_DAYS))
+
+    def employee(self):
+        for i, rng in self._role("employee"):
+            yield entity_email(i), rng.randrange(30_000, 120_000, 1_000)
+
+    def _activity(self, table):
+        rng = self._rng(table)
+        for _ in range(self.counts[table]):
+            email = entity_email(_skewed(rng, self.counts["entity"], self.skew))
+            campaign = self.campaign_keys[_skewed(rng, len(self.campaign_keys), self.skew)]
+            yield rng, email, campaign
+
+    def donations(self):
+        for rng, email, (issue, location, start_date) in self._activity("donations"):
+            donated = start_date + datetime.timedelta(days=rng.randint(-30, 120))
+            # Mostly small gifts with a long tail of large ones
+            amount = round(min(rng.lognormvariate(3.5, 1.2), 250_000), 2)
+            yield email, issue, location, start_date, donated, amount
+
+    def scheduled(self):
+        for rng, email, (issue, location, start_date) in self._activity("scheduled"):
+            yield email, issue, location, start_date, start_date + datetime.timedelta(days=rng.randint(0, 90))
+
+    def membershiphistory(self):
+        for rng, email, (issue, location, start_date) in self._activity("membershiphistory"):
+            involved_from = start_date + datetime.timedelta(days=rng.randint(0, 30))
+            involved_to = None if rng.random() < 0.3 else involved_from + datetime.timedelta(days=rng.randint(1, 365))
+            yield email, issue, location, start_date, involved_from, involved_to, None
+
+    def rows(self, table):
+        return getattr(self, table)()
+
+
+def _as_csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+        if out.tell() > 65536:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+
+def _copy_rows(cursor, table, rows):
+    # Random activity can repeat a primary key, so rows go through a staging
+    # copy of the table and duplicates are dropped on the way in. The
+    # surrogate keys are left to the identity columns and the key resolution
+    # trigger, and columns past the end of the generated rows (such as
+    # Campaigns.annotations) to their defaults.
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    cursor.execute("""
+        SELECT array_agg(quote_ident(column_name) ORDER BY ordinal_position)
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name::text <> ALL(%s);
+    """, (table, SURROGATE_COLUMNS))
+    columns = ", ".join(cursor.fetchone()[0][:len(first)])
+    rows = itertools.chain([first], rows)
+    # Only the loaded columns are staged: LIKE would copy the NOT NULL of
+    # entity_id and campaign_id, which COPY leaves empty
+    cursor.execute(f"CREATE TEMP TABLE datagen_stage ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA;")
+    cursor.copy_expert(f"COPY datagen_stage ({columns}) FROM STDIN WITH (FORMAT csv)", IterStream(_as_csv(rows)),
+                       size=65536)
+    cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM datagen_stage ON CONFLICT DO NOTHING;")
+    loaded = cursor.rowcount
+    cursor.execute("DROP TABLE datagen_stage;")
+    return loaded
+
+
+def generate(connection, scale=1.0, seed=370, skew=3.0, reset=True, verbose=True):
+    # Fill the whole schema at the given scale factor in one transaction and
+    # return the number of rows loaded per table
+    data = SyntheticData(scale, seed, skew)
+    loaded = {}
+    cursor = connection.cursor()
+    try:
+        if reset:
+            cursor.execute("TRUNCATE " + ", ".join(reversed(TABLES)) + " RESTART IDENTITY CASCADE;")
+        # Monthly partitions for every donation date generated, so none lands
+        # in the default partition (no-op when Donations is not partitioned)
+        create_partitions(cursor, EPOCH - datetime.timedelta(days=31),
+                          EPOCH + datetime.timedelta(days=SPAN_DAYS + 121))
+        for table in TABLES:
+            started = time.perf_counter()
+            loaded[table] = _copy_rows(cursor, table, data.rows(table))
+            if verbose:
+                print(f"{table}: {loaded[table]} rows in {time.perf_counter() - started:.1f}s")
+        connection.commit()
+    except psycopg2.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    # Fresh statistics and visibility maps so plans match a settled database
+    connection.autocommit = True
+    cursor = connection.cursor()
+    try:
+        for table in TABLES:
+            cursor.execute(f"VACUUM ANALYZE {table};")
+    finally:
+        cursor.close()
+        connection.autocommit = False
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the gng schema with deterministic synthetic data.")
+    parser.add_argument("--scale", type=float, default=1.0, help="1.0 = 2M donations, 200k entities")
+    parser.add_argument("--seed", type=int, default=370)
+    parser.add_argument("--skew", type=float, default=3.0, help="higher values concentrate activity on fewer rows")
+    parser.add_argument("--append", action="store_true", help="keep existing rows instead of truncating")
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    args = parser.parse_args()
+
+    try:
+        connection = psycopg2.connect(args.dsn)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return
+    try:
+        generate(connection, args.scale, args.seed, args.skew, reset=not args.append)
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
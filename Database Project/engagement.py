@@ -0,0 +1,245 @@
+import datetime
+import json
+
+import psycopg2
+from psycopg2.extras import Json
+
+from partitions import donation_date_range
+
+# Points awarded per activity; callers may pass their own weights
+DEFAULT_WEIGHTS = {
+    'donation': 10,  # points per donation transaction
+    'volunteering': 20,  # points per active volunteering event
+}
+
+# Installed by migration 0004, which keeps its own copy of this text and of
+# ENGAGEMENT_TRIGGERS_DDL; a change here also needs a new migration
+ENGAGEMENT_SCORES_DDL = """
+CREATE TABLE IF NOT EXISTS EngagementScores (
+    entity_email VARCHAR(255) PRIMARY KEY,
+    score NUMERIC NOT NULL,
+    donation_count BIGINT NOT NULL,
+    volunteering_count BIGINT NOT NULL,
+    computed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    FOREIGN KEY (entity_email) REFERENCES Entity(email) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS engagementscores_score_idx ON EngagementScores (score DESC, entity_email);
+
+-- The settings the snapshot was computed with; an incremental refresh is only
+-- valid when it uses the same settings
+CREATE TABLE IF NOT EXISTS EngagementScoreConfig (
+    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    settings JSONB NOT NULL,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Members whose activity changed since the last refresh
+CREATE TABLE IF NOT EXISTS EngagementDirty (
+    entity_email VARCHAR(255) PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION engagement_mark_new() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO EngagementDirty (entity_email)
+    SELECT DISTINCT entity_email FROM new_rows
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION engagement_mark_old() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO EngagementDirty (entity_email)
+    SELECT DISTINCT entity_email FROM old_rows
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+_TRIGGER_TEMPLATE = """
+DROP TRIGGER IF EXISTS engagement_{event}_{side}_{table} ON {table};
+CREATE TRIGGER engagement_{event}_{side}_{table}
+    AFTER {event} ON {table}
+    REFERENCING {side} TABLE AS {side}_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_{side}();
+"""
+
+
+def _trigger_ddl():
+    statements = []
+    for table in ("Donations", "MembershipHistory"):
+        for event, sides in (("INSERT", ["new"]), ("DELETE", ["old"]), ("UPDATE", ["old", "new"])):
+            for side in sides:
+                statements.append(_TRIGGER_TEMPLATE.format(event=event, side=side, table=table))
+    return "".join(statements)
+
+
+ENGAGEMENT_TRIGGERS_DDL = _trigger_ddl()
+
+
+def install_engagement_scores(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(ENGAGEMENT_SCORES_DDL + ENGAGEMENT_TRIGGERS_DDL)
+        connection.commit()
+    except psycopg2.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _settings(weights, half_life_days, since, until):
+    merged = dict(DEFAULT_WEIGHTS)
+    merged.update(weights or {})
+    return {
+        "weights": merged,
+        "as_of": str(datetime.date.today()),
+        "half_life_days": half_life_days,
+        "since": str(since) if since else None,
+        "until": str(until) if until else None,
+    }
+
+
+def _score_query(settings, only_emails=False):
+    # One statement: both activity streams are scanned once, unioned and
+    # aggregated together. Each event is worth its weight, optionally decayed
+    # by age with the given half-life.
+    if settings["half_life_days"]:
+        donation_decay = "power(0.5, GREATEST(%(as_of)s::date - d.donation_date, 0) / %(half_life)s::float)"
+        volunteering_decay = "power(0.5, GREATEST(%(as_of)s::date - m.involvement_start_date, 0) / %(half_life)s::float)"
+    else:
+        donation_decay = volunteering_decay = "1"
+    email_filter = "AND {alias}.entity_email = ANY(%(emails)s)" if only_emails else ""
+    # Only the bounds that are set are emitted, so a donation range prunes
+    # the Donations partitions outside it
+    donation_range, _ = donation_date_range("d", settings["since"], settings["until"])
+    since_filter = "AND m.involvement_start_date >= %(since)s::date" if settings["since"] else ""
+    until_filter = "AND m.involvement_start_date < %(until)s::date" if settings["until"] else ""
+    return f"""
+        SELECT entity_email, SUM(points) AS score,
+               SUM(donations) AS donation_count, SUM(volunteering) AS volunteering_count
+        FROM (
+            SELECT d.entity_email, %(donation)s * {donation_decay} AS points, 1 AS donations, 0 AS volunteering
+            FROM Donations d
+            WHERE {donation_range}
+              {email_filter.format(alias='d')}
+            UNION ALL
+            SELECT m.entity_email, %(volunteering)s * {volunteering_decay}, 0, 1
+            FROM MembershipHistory m
+            WHERE (m.involvement_end_date IS NULL OR m.involvement_end_date > %(as_of)s::date)
+              {since_filter}
+              {until_filter}
+              {email_filter.format(alias='m')}
+        ) activity
+        GROUP BY entity_email
+    """
+
+
+def _query_params(settings, emails=None):
+    return {
+        "donation": settings["weights"]["donation"],
+        "volunteering": settings["weights"]["volunteering"],
+        "half_life": settings["half_life_days"],
+        "as_of": settings["as_of"],
+        "since": settings["since"],
+        "until": settings["until"],
+        "emails": emails,
+    }
+
+
+def engagement_query(weights=None, half_life_days=None, since=None, until=None):
+    # The single-pass scoring statement and its parameters, ordered by score
+    settings = _settings(weights, half_life_days, since, until)
+    return _score_query(settings) + " ORDER BY score DESC, entity_email;", _query_params(settings)
+
+
+def compute_engagement_scores(connection, weights=None, half_life_days=None, since=None, until=None):
+    # Score every member in one pass and return (email, score, donations, volunteering) rows
+    query, params = engagement_query(weights, half_life_days, since, until)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def refresh_engagement_scores(connection, weights=None, half_life_days=None, since=None, until=None,
+                              incremental=True):
+    # Persist scores into EngagementScores. Incremental refreshes rescore only
+    # the members marked dirty by the activity triggers; a full refresh runs
+    # when asked for or when the settings differ from the last snapshot.
+    # Returns (mode, members rescored).
+    settings = _settings(weights, half_life_days, since, until)
+    params = _query_params(settings)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT settings FROM EngagementScoreConfig WHERE id = 1 FOR UPDATE;")
+        row = cursor.fetchone()
+        previous = row[0] if row else None
+        if isinstance(previous, str):
+            previous = json.loads(previous)
+        # Settings include the as-of date, because decay and the active
+        # volunteering cutoff both move with the calendar; the first refresh
+        # of a new day is therefore always a full one
+        if incremental and previous == settings:
+            cursor.execute("DELETE FROM EngagementDirty RETURNING entity_email;")
+            emails = [email for (email,) in cursor.fetchall()]
+            mode = "incremental"
+            if emails:
+                params["emails"] = emails
+                cursor.execute("DELETE FROM EngagementScores WHERE entity_email = ANY(%(emails)s);", params)
+                cursor.execute(f"""
+                    INSERT INTO EngagementScores (entity_email, score, donation_count, volunteering_count)
+                    {_score_query(settings, only_emails=True)};
+                """, params)
+            rescored = len(emails)
+        else:
+            mode = "full"
+            cursor.execute("DELETE FROM EngagementDirty;")
+            cursor.execute("DELETE FROM EngagementScores;")
+            cursor.execute(f"""
+                INSERT INTO EngagementScores (entity_email, score, donation_count, volunteering_count)
+                {_score_query(settings)};
+            """, params)
+            rescored = cursor.rowcount
+        cursor.execute("""
+            INSERT INTO EngagementScoreConfig (id, settings, refreshed_at) VALUES (1, %s, now())
+            ON CONFLICT (id) DO UPDATE SET settings = EXCLUDED.settings, refreshed_at = EXCLUDED.refreshed_at;
+        """, (Json(settings),))
+        connection.commit()
+        return mode, rescored
+    except psycopg2.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def top_engagement_scores(connection, n=10):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT entity_email, score, donation_count, volunteering_count, computed_at
+            FROM EngagementScores
+            ORDER BY score DESC, entity_email
+            LIMIT %s;
+        """, (n,))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def get_engagement_score(connection, entity_email):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT entity_email, score, donation_count, volunteering_count, computed_at
+            FROM EngagementScores
+            WHERE entity_email = %s;
+        """, (entity_email,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
@@ -0,0 +1,435 @@
+import contextvars
+import datetime
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statements that only read are re-run under EXPLAIN ANALYZE for the slow
+# query log; anything that writes gets a plain EXPLAIN so it is not repeated
+_WRITES = re.compile(r"\b(insert|update|delete|merge|truncate|copy|call)\b", re.IGNORECASE)
+_READS = ("select", "with", "values", "table")
+
+_current = contextvars.ContextVar("gng_operation", default=None)
+# Name given to the next operation opened, set by Metrics.labelled
+_next_name = contextvars.ContextVar("gng_operation_label", default=None)
+
+
+def sql_text(query, context=None):
+    # The statement as text with whitespace collapsed. Placeholders are kept,
+    # so parameter values (emails, amounts) never reach the metrics.
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = query.as_string(context) if hasattr(query, "as_string") else str(query)
+    return " ".join(query.split())
+
+
+def explain_statement(query):
+    text = sql_text(query)
+    first = text.split(" ", 1)[0].lower() if text else ""
+    if first in _READS and not _WRITES.search(text):
+        return "EXPLAIN (ANALYZE, BUFFERS) "
+    return "EXPLAIN "
+
+
+class _Span:
+    # Counters for one running operation. Nested operations (a batch calling
+    # the single-item variant) add their counts to every enclosing span.
+
+    __slots__ = ("name", "parent", "statements", "round_trips", "rows", "commits", "rollbacks", "errors",
+                 "slowest_seconds", "slowest_sql")
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.statements = 0
+        self.round_trips = 0
+        self.rows = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.errors = 0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = None
+
+    def chain(self):
+        span = self
+        while span is not None:
+            yield span
+            span = span.parent
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.statements = 0
+        self.round_trips = 0
+        self.rows = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = None
+
+    def add(self, seconds, span, failed):
+        self.calls += 1
+        self.failures += 1 if failed else 0
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.statements += span.statements
+        self.round_trips += span.round_trips
+        self.rows += span.rows
+        self.commits += span.commits
+        self.rollbacks += span.rollbacks
+        if span.slowest_sql is not None and span.slowest_seconds >= self.slowest_seconds:
+            self.slowest_seconds = span.slowest_seconds
+            self.slowest_sql = span.slowest_sql
+
+    def cumulative_buckets(self):
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            total += count
+            yield bound, total
+
+    def as_dict(self):
+        calls = self.calls or 1
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "seconds_sum": self.seconds,
+            "mean_ms": self.seconds / calls * 1000,
+            "max_ms": self.max_seconds * 1000,
+            "buckets": {f"{bound:g}": count for bound, count in self.cumulative_buckets()},
+            "statements": self.statements,
+            "round_trips": self.round_trips,
+            "statements_per_call": self.statements / calls,
+            "round_trips_per_call": self.round_trips / calls,
+            "rows": self.rows,
+            "commits": self.commits,
+            "rollbacks": self.rollbacks,
+            "slowest_statement": {"ms": self.slowest_seconds * 1000, "sql": self.slowest_sql},
+        }
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_COUNTERS = [
+    ("statements", "gng_operation_statements_total", "SQL statements sent by the operation."),
+    ("round_trips", "gng_operation_round_trips_total", "Client-server round trips made by the operation."),
+    ("rows", "gng_operation_rows_total", "Rows returned to the client by the operation."),
+    ("commits", "gng_operation_commits_total", "Transactions committed by the operation."),
+    ("rollbacks", "gng_operation_rollbacks_total", "Transactions rolled back by the operation."),
+    ("failures", "gng_operation_failures_total", "Calls in which a statement failed or an exception escaped."),
+]
+
+
+class Metrics:
+    # Per-operation latency histograms and statement counters for this
+    # process. Operations are opened with operation() or the instrumented
+    # decorator; the instrumented cursors report every statement they run to
+    # the innermost open operation.
+
+    def __init__(self, slow_query_seconds=None, slow_query_log=None):
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.slow_query_seconds = slow_query_seconds
+        self.slow_query_log = slow_query_log
+
+    def configure(self, slow_query_seconds=None, slow_query_log=None):
+        # Statements slower than slow_query_seconds are appended to
+        # slow_query_log (JSON lines) together with their EXPLAIN output
+        self.slow_query_seconds = slow_query_seconds
+        self.slow_query_log = slow_query_log
+
+    @contextmanager
+    def labelled(self, name):
+        # The next operation opened in this block is recorded as name instead
+        # of its own name; operations nested in it keep theirs. This tells
+        # apart calls of one instrumented function, such as each report run
+        # through GngService.report, without a second span around it.
+        token = _next_name.set(name)
+        try:
+            yield
+        finally:
+            _next_name.reset(token)
+
+    @contextmanager
+    def operation(self, name):
+        # The label is used up here and not restored when the span ends, so
+        # a second operation in the same labelled block keeps its own name
+        label = _next_name.get()
+        if label is not None:
+            _next_name.set(None)
+        span = _Span(label or name, _current.get())
+        token = _current.set(span)
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield span
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            _current.reset(token)
+            with self._lock:
+                self._stats.setdefault(span.name, OperationStats()).add(seconds, span, failed or span.errors > 0)
+
+    def statement(self, query, seconds, round_trips=1, rows=0, failed=False):
+        # Record one statement against the open operations. Returns True when
+        # it ran longer than the slow query threshold, so the caller can
+        # fetch its plan and pass it to log_slow_query.
+        span = _current.get()
+        if span is not None:
+            sql = sql_text(query)
+            for open_span in span.chain():
+                open_span.statements += 1
+                open_span.round_trips += round_trips
+                open_span.rows += max(rows, 0)
+                open_span.errors += 1 if failed else 0
+                if seconds >= open_span.slowest_seconds:
+                    open_span.slowest_seconds = seconds
+                    open_span.slowest_sql = sql
+        return (not failed and self.slow_query_log is not None and self.slow_query_seconds is not None
+                and seconds >= self.slow_query_seconds)
+
+    def transaction(self, ended, round_trip):
+        # ended is "commit" or "rollback"; round_trip is False when there was
+        # no open transaction and the driver sent nothing
+        span = _current.get()
+        if span is None:
+            return
+        for open_span in span.chain():
+            if ended == "commit":
+                open_span.commits += 1
+            else:
+                open_span.rollbacks += 1
+            open_span.round_trips += 1 if round_trip else 0
+
+    def log_slow_query(self, query, seconds, plan):
+        span = _current.get()
+        entry = {
+            "at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "operation": span.name if span is not None else None,
+            "ms": seconds * 1000,
+            "sql": sql_text(query),
+            "plan": plan,
+        }
+        with self._lock:
+            with open(self.slow_query_log, "a", encoding="utf-8") as handle:
+                handle.write(json.dumps(entry) + "\n")
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._stats.items())}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def to_json(self):
+        return json.dumps({"buckets": list(LATENCY_BUCKETS), "operations": self.snapshot()}, indent=2)
+
+    def to_prometheus(self):
+        with self._lock:
+            stats = sorted(self._stats.items())
+            lines = [
+                "# HELP gng_operation_duration_seconds Latency of gng operations.",
+                "# TYPE gng_operation_duration_seconds histogram",
+            ]
+            for name, s in stats:
+                label = _label(name)
+                for bound, count in s.cumulative_buckets():
+                    lines.append(f'gng_operation_duration_seconds_bucket{{operation="{label}",le="{bound:g}"}} {count}')
+                lines.append(f'gng_operation_duration_seconds_bucket{{operation="{label}",le="+Inf"}} {s.calls}')
+                lines.append(f'gng_operation_duration_seconds_sum{{operation="{label}"}} {s.seconds!r}')
+                lines.append(f'gng_operation_duration_seconds_count{{operation="{label}"}} {s.calls}')
+            for attribute, metric, description in _COUNTERS:
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} counter")
+                for name, s in stats:
+                    lines.append(f'{metric}{{operation="{_label(name)}"}} {getattr(s, attribute)}')
+            lines.append("# HELP gng_operation_slowest_statement_seconds Slowest single statement seen in the operation.")
+            lines.append("# TYPE gng_operation_slowest_statement_seconds gauge")
+            for name, s in stats:
+                if s.slowest_sql is not None:
+                    lines.append(f'gng_operation_slowest_statement_seconds{{operation="{_label(name)}",'
+                                 f'sql="{_label(s.slowest_sql[:200])}"}} {s.slowest_seconds!r}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Written to a temporary file and renamed, so the node_exporter
+        # textfile collector never reads a half-written file
+        self._write(path, self.to_prometheus())
+
+    def write_json(self, path):
+        self._write(path, self.to_json() + "\n")
+
+    def _write(self, path, text):
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            handle.write(text)
+        os.replace(temporary, path)
+
+
+METRICS = Metrics()
+
+
+def instrumented(name=None):
+    # Decorator timing every call of a service coroutine or plain function as
+    # the operation name, defaulting to the function's own name
+    def decorate(function):
+        operation = name or function.__name__
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def run(*args, **kwargs):
+                with METRICS.operation(operation):
+                    return await function(*args, **kwargs)
+        else:
+            @functools.wraps(function)
+            def run(*args, **kwargs):
+                with METRICS.operation(operation):
+                    return function(*args, **kwargs)
+        return run
+    return decorate
+
+
+def _explain(connection, query, params):
+    # Re-run the statement under EXPLAIN inside a savepoint (or a throwaway
+    # transaction in autocommit mode), leaving the caller's transaction as it was
+    cursor = connection.cursor(cursor_factory=extensions.cursor)
+    savepoint = not connection.autocommit
+    try:
+        cursor.execute("SAVEPOINT gng_explain;" if savepoint else "BEGIN;")
+        try:
+            cursor.execute(explain_statement(query) + sql_text(query, connection).rstrip(";"), params)
+            return "\n".join(row[0] for row in cursor.fetchall())
+        finally:
+            cursor.execute("ROLLBACK TO SAVEPOINT gng_explain; RELEASE SAVEPOINT gng_explain;" if savepoint
+                           else "ROLLBACK;")
+    finally:
+        cursor.close()
+
+
+class InstrumentedCursor(extensions.cursor):
+    # psycopg2 cursor reporting each statement's latency, round trips and
+    # rows to METRICS. A named cursor is recorded once it has been read (or
+    # closed), so its time includes the FETCH round trips.
+
+    def _record(self, query, params, seconds, round_trips=1, rows=0, failed=False):
+        if METRICS.statement(query, seconds, round_trips, rows, failed):
+            try:
+                plan = _explain(self.connection, query, params)
+            except psycopg2.Error as e:
+                plan = f"EXPLAIN failed: {e}"
+            METRICS.log_slow_query(query, seconds, plan)
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        except psycopg2.Error:
+            self._record(query, vars, time.perf_counter() - started, failed=True)
+            raise
+        seconds = time.perf_counter() - started
+        if self.name is not None:
+            self._pending = (query, vars, seconds)
+        else:
+            self._record(query, vars, seconds, rows=self.rowcount if self.description else 0)
+        return result
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        started = time.perf_counter()
+        try:
+            result = super().executemany(query, vars_list)
+        except psycopg2.Error:
+            self._record(query, None, time.perf_counter() - started, round_trips=len(vars_list), failed=True)
+            raise
+        # executemany runs the statement once per parameter set; no plan is taken
+        METRICS.statement(query, time.perf_counter() - started, round_trips=len(vars_list))
+        return result
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            result = super().copy_expert(sql, file, size)
+        except psycopg2.Error:
+            METRICS.statement(sql, time.perf_counter() - started, failed=True)
+            raise
+        METRICS.statement(sql, time.perf_counter() - started, rows=self.rowcount)
+        return result
+
+    def __iter__(self):
+        if self.name is None:
+            return super().__iter__()
+        return self._stream()
+
+    def _stream(self):
+        query, params, seconds = getattr(self, "_pending", (None, None, 0.0))
+        self._pending = None
+        round_trips, rows, failed = 1, 0, False
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    batch = self.fetchmany(self.itersize)
+                except psycopg2.Error:
+                    failed = True
+                    raise
+                finally:
+                    seconds += time.perf_counter() - started
+                    round_trips += 1
+                rows += len(batch)
+                yield from batch
+                if len(batch) < self.itersize:
+                    break
+        finally:
+            if query is not None:
+                self._record(query, params, seconds, round_trips, rows, failed)
+
+    def close(self):
+        pending = getattr(self, "_pending", None)
+        self._pending = None
+        if pending is not None and not self.closed:
+            self._record(*pending)
+        super().close()
+
+
+class InstrumentedConnection(extensions.connection):
+    # Pass as connection_factory to psycopg2.connect: cursors
+    # default to InstrumentedCursor and commits/rollbacks are counted
+
+    def cursor(self, *args, **kwargs):
+        if kwargs.get("cursor_factory") is None:
+            kwargs["cursor_factory"] = InstrumentedCursor
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        open_transaction = self.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE
+        super().commit()
+        METRICS.transaction("commit", open_transaction)
+
+    def rollback(self):
+        open_transaction = self.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE
+        super().rollback()
+        METRICS.transaction("rollback", open_transaction)
@@ -0,0 +1,201 @@
+import argparse
+import os
+import statistics
+import time
+
+import psycopg2
+from psycopg2 import OperationalError
+
+# Integer surrogate keys for Campaigns (campaign_id) and Entity (entity_id),
+# carried alongside the natural keys by every table that references them.
+# Handlers keep accepting issue/location/start_date and email; the ids are
+# filled in by a BEFORE trigger (migration 0008) when a writer does not supply
+# them, and joins between the large tables and Campaigns compare one int4
+# instead of two VARCHAR(255) columns and a date.
+SURROGATE_COLUMNS = ["entity_id", "campaign_id"]
+
+# The user-facing columns of Campaigns, without the surrogate key, for the
+# reports that used to select c.*
+CAMPAIGN_COLUMNS = "issue, location, start_date, duration_days, phase, budget, website_push_date, annotations"
+
+# What `python keys.py measure` reports:
+#  - the space the ids take as installed. Migration 0008 added them next to
+#    the natural keys and dropped nothing, so this is pure growth: the id
+#    columns in each table and every index with an id column (the unique
+#    ids, and the campaign_id keyset indexes of migration 0009).
+#  - MEASURED_INDEXES: what moving the natural-key primary key and campaign
+#    index of Donations and Scheduled onto the ids would save. That swap has
+#    not been made. Both forms are built fresh inside a rolled-back
+#    transaction, so neither carries bloat the other lacks.
+#  - measured_joins(): the shipped queries that join a large table on
+#    campaign_id, timed as they ship and with the join on the natural key.
+ID_COLUMNS = {
+    "Campaigns": ["campaign_id"],
+    "Entity": ["entity_id"],
+    "Donations": SURROGATE_COLUMNS,
+    "Scheduled": SURROGATE_COLUMNS,
+    "MembershipHistory": SURROGATE_COLUMNS,
+}
+MEASURED_INDEXES = [
+    ("donations primary key",
+     "Donations (entity_email, campaign_issue, campaign_location, campaign_start_date, donation_date)",
+     "Donations (entity_id, campaign_id, donation_date)"),
+    ("donations by campaign",
+     "Donations (campaign_issue, campaign_location, campaign_start_date) INCLUDE (amount)",
+     "Donations (campaign_id) INCLUDE (amount)"),
+    ("scheduled primary key",
+     "Scheduled (entity_email, campaign_issue, campaign_location, campaign_start_date, scheduled_date)",
+     "Scheduled (entity_id, campaign_id, scheduled_date)"),
+    ("scheduled by campaign",
+     "Scheduled (campaign_issue, campaign_location, campaign_start_date)",
+     "Scheduled (campaign_id)"),
+]
+
+# Every index of the tables above with an id column, and its size summed
+# over all partitions
+_ID_INDEXES_QUERY = """
+    SELECT i.indexrelid::regclass::text, t.relname,
+           COALESCE((SELECT SUM(pg_relation_size(relid)) FROM pg_partition_tree(i.indexrelid)),
+                    pg_relation_size(i.indexrelid))
+    FROM pg_index i
+    JOIN pg_class t ON t.oid = i.indrelid
+    WHERE t.oid = ANY(%s::regclass[])
+      AND EXISTS (SELECT 1 FROM pg_attribute a
+                  WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) AND a.attname = ANY(%s))
+    ORDER BY 1;
+"""
+
+
+def _natural(query, alias):
+    # query with its campaign_id join on alias rewritten to the natural key,
+    # which is how it read before migration 0008
+    join = f"{alias}.campaign_id = c.campaign_id"
+    if join not in query:
+        raise ValueError(f"No {join} join to rewrite in {query}")
+    return query.replace(join, f"{alias}.campaign_issue = c.issue AND {alias}.campaign_location = c.location "
+                               f"AND {alias}.campaign_start_date = c.start_date")
+
+
+def measured_joins():
+    # (name, natural-key query, shipped query, params). Imported here because
+    # queries and campaign_totals import this module.
+    from campaign_totals import accounting_report_query
+    from live import STATE_QUERY
+    from queries import REPORT_QUERIES
+    accounting, params = accounting_report_query(since="1900-01-01")
+    return [
+        ("accounting report, date range", _natural(accounting, "d"), accounting, params),
+        ("Query5", _natural(REPORT_QUERIES["Query5"], "d"), REPORT_QUERIES["Query5"], None),
+        ("live campaign state", _natural(STATE_QUERY, "s"), STATE_QUERY, None),
+    ]
+
+
+def _heap_growth(cursor, table, columns):
+    # Bytes the id columns add to the table, as the size difference of two
+    # fresh copies of it with and without them
+    cursor.execute("""
+        SELECT string_agg(quote_ident(column_name), ', ' ORDER BY ordinal_position)
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = lower(%s) AND column_name <> ALL(%s);
+    """, (table, columns))
+    kept = cursor.fetchone()[0]
+    cursor.execute(f"CREATE TEMP TABLE gng_measured_with AS SELECT * FROM {table};")
+    cursor.execute(f"CREATE TEMP TABLE gng_measured_without AS SELECT {kept} FROM {table};")
+    cursor.execute("SELECT pg_relation_size('gng_measured_with') - pg_relation_size('gng_measured_without');")
+    growth = cursor.fetchone()[0]
+    cursor.execute("DROP TABLE gng_measured_with, gng_measured_without;")
+    return growth
+
+
+def _index_size(cursor, definition):
+    # Build the index, sum its size over all partitions and drop it again. An
+    # index on a plain table has no partition tree and is measured directly.
+    cursor.execute(f"CREATE INDEX gng_measured_idx ON {definition};")
+    cursor.execute("""
+        SELECT COALESCE(SUM(pg_relation_size(relid)), pg_relation_size('gng_measured_idx'))
+        FROM pg_partition_tree('gng_measured_idx'::regclass);
+    """)
+    size = cursor.fetchone()[0]
+    cursor.execute("DROP INDEX gng_measured_idx;")
+    return size
+
+
+def _median_ms(cursor, query, repeat, params=None):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(query, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def measure(connection, repeat=10):
+    # Returns (installed, indexes, joins). installed is ([(table, bytes)] of
+    # id columns, [(index, table, bytes)] of indexes with an id column);
+    # indexes and joins are (name, natural, surrogate) triples of index sizes
+    # in bytes and median latencies in milliseconds.
+    heap, indexes, joins = [], [], []
+    cursor = connection.cursor()
+    try:
+        for table, columns in ID_COLUMNS.items():
+            heap.append((table, _heap_growth(cursor, table, columns)))
+        cursor.execute(_ID_INDEXES_QUERY, (list(ID_COLUMNS), SURROGATE_COLUMNS))
+        installed = (heap, cursor.fetchall())
+        for name, natural, surrogate in MEASURED_INDEXES:
+            indexes.append((name, _index_size(cursor, natural), _index_size(cursor, surrogate)))
+        connection.rollback()
+        for name, natural, surrogate, params in measured_joins():
+            # One untimed run of each warms the cache for both
+            _median_ms(cursor, natural, 1, params)
+            _median_ms(cursor, surrogate, 1, params)
+            joins.append((name, _median_ms(cursor, natural, repeat, params),
+                          _median_ms(cursor, surrogate, repeat, params)))
+        return installed, indexes, joins
+    finally:
+        cursor.close()
+        connection.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Surrogate key maintenance and measurements.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    measure_parser = subparsers.add_parser(
+        "measure", help="compare index sizes and join latency of natural and surrogate keys "
+                        "(builds indexes, so run it on benchmark data, not production)")
+    measure_parser.add_argument("--repeat", type=int, default=10, help="timed runs per join")
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    args = parser.parse_args()
+
+    try:
+        connection = psycopg2.connect(args.dsn)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return
+    try:
+        (heap, id_indexes), indexes, joins = measure(connection, args.repeat)
+    except psycopg2.Error as e:
+        print(f"Measurement failed: {e}")
+        return
+    finally:
+        connection.close()
+
+    mb = 2**20
+    print("Installed: what the ids add (migration 0008 dropped nothing)")
+    for table, size in heap:
+        print(f"  {table + ' id columns':<40}{size / mb:>9.1f} MB")
+    for name, table, size in id_indexes:
+        print(f"  {name + ' (' + table + ')':<40}{size / mb:>9.1f} MB")
+    total = sum(size for _, size in heap) + sum(size for _, _, size in id_indexes)
+    print(f"  {'total':<40}{total / mb:>9.1f} MB")
+    print("Not installed: moving these indexes onto the ids")
+    print(f"{'index':<34}{'natural key':>14}{'surrogate key':>16}{'saved':>8}")
+    for name, natural, surrogate in indexes:
+        saved = 1 - surrogate / natural if natural else 0
+        print(f"{name:<34}{natural / mb:>11.1f} MB{surrogate / mb:>13.1f} MB{saved:>8.0%}")
+    print(f"{'shipped join (median)':<34}{'natural key':>14}{'surrogate key':>16}{'speedup':>8}")
+    for name, natural, surrogate in joins:
+        print(f"{name:<34}{natural:>11.1f} ms{surrogate:>13.1f} ms{natural / surrogate if surrogate else 0:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
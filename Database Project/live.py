@@ -0,0 +1,210 @@
+import argparse
+import collections
+import json
+import os
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2 import OperationalError
+
+# Live per-campaign funding and staffing for fundraising events. Statement
+# triggers on Donations, Scheduled and Campaigns (migration 0011) NOTIFY the
+# campaign_ids a committed statement touched; LiveCampaigns re-reads only those campaigns and
+# passes the rows that actually changed to its subscribers. Everything is
+# loaded in full once, when the listener connects, and again only after it
+# had to reconnect, since notifications sent in between are lost.
+LIVE_CHANNEL = "gng_campaign_changed"
+
+CampaignState = collections.namedtuple(
+    "CampaignState", "issue location start_date budget donation_sum donation_count coverage volunteers")
+
+# Funding comes from the trigger-maintained CampaignTotals row, volunteers
+# from the (campaign_id, ...) index on Scheduled, so reading one campaign
+# never scans Donations
+STATE_QUERY = """
+    SELECT c.campaign_id, c.issue, c.location, c.start_date, c.budget,
+           COALESCE(t.donation_sum, 0), COALESCE(t.donation_count, 0),
+           (SELECT COUNT(DISTINCT s.entity_email) FROM Scheduled s WHERE s.campaign_id = c.campaign_id)
+    FROM Campaigns c
+    LEFT JOIN CampaignTotals t ON t.campaign_issue = c.issue AND t.campaign_location = c.location
+                              AND t.campaign_start_date = c.start_date
+"""
+
+
+def _state(row):
+    campaign_id, issue, location, start_date, budget, donation_sum, donation_count, volunteers = row
+    # Coverage in percent, None without a budget, as the accounting report prints it
+    coverage = round(float(donation_sum) / float(budget) * 100, 2) if budget and budget > 0 else None
+    return campaign_id, CampaignState(issue, location, start_date, budget, donation_sum, donation_count, coverage,
+                                      volunteers)
+
+
+def read_campaigns(cursor, campaign_ids=None):
+    # {campaign_id: CampaignState} for the given campaigns, or for all of them
+    if campaign_ids is None:
+        cursor.execute(STATE_QUERY + ";")
+    else:
+        cursor.execute(STATE_QUERY + " WHERE c.campaign_id = ANY(%s);", (sorted(campaign_ids),))
+    return dict(_state(row) for row in cursor.fetchall())
+
+
+class LiveCampaigns:
+    # Background thread that keeps self.state ({campaign_id: CampaignState})
+    # current and calls every subscriber with {campaign_id: CampaignState or
+    # None} for the campaigns that changed; None means the campaign is gone.
+    # Subscribers run on the listener thread and should return quickly.
+
+    def __init__(self, dsn, poll_interval=5.0, batch_delay=0.05):
+        self.dsn = dsn
+        self.poll_interval = poll_interval
+        # Notifications arriving this soon after one another are handled
+        # together, so a burst of donations costs one read
+        self.batch_delay = batch_delay
+        self.state = {}
+        self.resyncs = 0
+        self.refreshes = 0
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="gng-live-campaigns", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def subscribe(self, callback):
+        # The subscriber first receives every campaign known so far; holding
+        # the lock keeps that from arriving after a newer change
+        with self._lock:
+            self._subscribers.append(callback)
+            if self.state:
+                callback(dict(self.state))
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.state)
+
+    def _apply(self, fresh, campaign_ids=None):
+        # Merge freshly read rows into the state and publish the differences.
+        # campaign_ids limits the merge to the campaigns that were re-read;
+        # one of those missing from fresh has been deleted.
+        with self._lock:
+            keys = set(self.state) | set(fresh) if campaign_ids is None else set(campaign_ids)
+            changes = {}
+            for campaign_id in keys:
+                row = fresh.get(campaign_id)
+                if self.state.get(campaign_id) != row:
+                    changes[campaign_id] = row
+                    if row is None:
+                        self.state.pop(campaign_id, None)
+                    else:
+                        self.state[campaign_id] = row
+            subscribers = list(self._subscribers)
+        if changes:
+            for callback in subscribers:
+                callback(changes)
+        return changes
+
+    def _resync(self, cursor):
+        self.resyncs += 1
+        return self._apply(read_campaigns(cursor))
+
+    def _refresh(self, cursor, campaign_ids):
+        self.refreshes += 1
+        return self._apply(read_campaigns(cursor, campaign_ids), campaign_ids)
+
+    def _drain(self, connection):
+        # (campaign_ids, resync) from the notifications received so far
+        campaign_ids, resync = set(), False
+        connection.poll()
+        for notify in connection.notifies:
+            try:
+                payload = json.loads(notify.payload)
+            except ValueError:
+                resync = True
+                continue
+            resync = resync or payload.get("resync", False)
+            campaign_ids.update(payload.get("ids") or [])
+        connection.notifies.clear()
+        return campaign_ids, resync
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                connection = psycopg2.connect(self.dsn)
+            except psycopg2.OperationalError:
+                self._stop.wait(self.poll_interval)
+                continue
+            try:
+                connection.autocommit = True
+                cursor = connection.cursor()
+                # LISTEN before the full read: a change committed after the
+                # read began is also notified, and re-reading it is harmless
+                cursor.execute(f"LISTEN {LIVE_CHANNEL};")
+                self._resync(cursor)
+                while not self._stop.is_set():
+                    if select.select([connection], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    campaign_ids, resync = self._drain(connection)
+                    if self._stop.wait(self.batch_delay):
+                        break
+                    more_ids, more_resync = self._drain(connection)
+                    campaign_ids |= more_ids
+                    if resync or more_resync:
+                        self._resync(cursor)
+                    elif campaign_ids:
+                        self._refresh(cursor, campaign_ids)
+            except psycopg2.Error:
+                self._stop.wait(self.poll_interval)
+            finally:
+                connection.close()
+
+
+def format_change(campaign_id, row):
+    if row is None:
+        return f"campaign {campaign_id} removed"
+    coverage = "N/A" if row.coverage is None else f"{row.coverage:.2f}%"
+    return (f"Campaign: {row.issue}, {row.location}, starting {row.start_date}, Donations: {row.donation_sum} "
+            f"({row.donation_count}), Coverage: {coverage}, Volunteers: {row.volunteers}")
+
+
+def print_changes(changes):
+    for campaign_id, row in sorted(changes.items()):
+        print(format_change(campaign_id, row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print campaign funding and volunteers as they change.")
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""),
+                        help="libpq connection string of the primary; standbys do not deliver NOTIFY")
+    args = parser.parse_args()
+
+    try:
+        psycopg2.connect(args.dsn).close()
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return
+    live = LiveCampaigns(args.dsn)
+    live.subscribe(print_changes)
+    live.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        live.stop()
+
+
+if __name__ == "__main__":
+    main()
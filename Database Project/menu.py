@@ -0,0 +1,291 @@
+import time
+
+from psycopg import Error, OperationalError
+
+from live import LiveCampaigns, print_changes
+from outcomes import CREATED, EXISTS, INVALID, NOT_FOUND, UNKNOWN_CAMPAIGN, UNKNOWN_DONOR, UPDATED
+from queries import BOUNDED_REPORTS, DATE_RANGE_REPORTS
+from streaming import format_row
+
+# Prompt-driven front end for the menu in gng.py. Each action reads its fields
+# with input(), calls the async service through a ServiceClient and prints the
+# outcome; no SQL runs here.
+
+
+def _date_range():
+    # Optional donation date range; leaving both blank covers all donations
+    since = input("Donations from (YYYY-MM-DD, blank for all): ").strip() or None
+    until = input("Donations before (YYYY-MM-DD, blank for all): ").strip() or None
+    return since, until
+
+
+def _choose(matches, describe):
+    # Pick one of the ranked search matches; a single match is taken as is
+    if len(matches) == 1:
+        print(f"Using {describe(matches[0])}")
+        return matches[0]
+    for number, row in enumerate(matches, 1):
+        print(f"{number}. {describe(row)}")
+    choice = input("Select a number (blank to cancel): ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(matches):
+        return matches[int(choice) - 1]
+    return None
+
+
+def _campaign(client):
+    # The (issue, location, start date) of a campaign found by searching for
+    # part of its issue or location, or None
+    matches = client.search("campaigns", input("Find campaign (part of issue or location): "))
+    if not matches:
+        print("No matching campaigns.")
+        return None
+    row = _choose(matches, lambda row: f"{row[0]}, {row[1]}, starting {row[2]}")
+    return row[:3] if row else None
+
+
+def _entity(client, role):
+    # The email of an entity found by searching for part of its name or email
+    matches = client.search("entities", input(f"Find {role} (part of name or email): "))
+    if not matches:
+        print(f"No matching {role}s.")
+        return None
+    row = _choose(matches, lambda row: f"{row[1]} <{row[0]}>")
+    return row[0] if row else None
+
+
+def show_report(client, name):
+    since, until = _date_range() if name in DATE_RANGE_REPORTS else (None, None)
+    if name in BOUNDED_REPORTS:
+        _, rows = client.report(name, since, until)
+        for row in rows:
+            print(format_row(row))
+        return
+    # Entity-sized reports are printed as the rows stream in
+    async def stream():
+        async for row in client.service.stream_report(name, since=since, until=until):
+            print(format_row(row))
+    client.call(stream())
+
+
+def create_campaign(client):
+    issue = input("Enter issue: ")
+    location = input("Enter location: ")
+    start_date = input("Enter start date (YYYY-MM-DD): ")
+    duration_days = input("Enter duration days: ")
+    phase = input("Enter phase: ")
+    budget = input("Enter budget: ")
+    website_push_date = input("Enter website push date (YYYY-MM-DD): ")
+    outcome = client.create_campaign(issue, location, start_date, duration_days, phase, budget, website_push_date)
+    print({
+        CREATED: "Campaign created successfully.",
+        EXISTS: "This campaign already exists.",
+        INVALID: "One or more checks failed.",
+    }[outcome])
+
+
+def add_volunteer(client):
+    email = input("Enter volunteer email: ")
+    name = input("Enter name: ")
+    tier = input("Enter tier: ")
+    campaign = _campaign(client)
+    if campaign is None:
+        return
+    issue, location, start_date = campaign
+    volunteer_start_date = input("Enter volunteer start date (YYYY-MM-DD): ")
+    outcome = client.add_volunteer(email, name, tier, issue, location, start_date, volunteer_start_date)
+    print({
+        CREATED: "Volunteer added successfully.",
+        EXISTS: "This email is already used for a volunteer.",
+        UNKNOWN_CAMPAIGN: "The campaign details provided do not match any existing campaigns.",
+    }[outcome])
+
+
+def schedule_volunteer(client):
+    email = _entity(client, "volunteer")
+    campaign = _campaign(client) if email else None
+    if campaign is None:
+        return
+    issue, location, start_date = campaign
+    volunteer_start_date = input("Enter volunteer start date (YYYY-MM-DD): ")
+    outcome = client.schedule_volunteer(email, issue, location, start_date, volunteer_start_date)
+    print({
+        CREATED: "Volunteer scheduled successfully.",
+        EXISTS: "This volunteer is already scheduled for that date.",
+        UNKNOWN_DONOR: "No entity found with the given email.",
+        UNKNOWN_CAMPAIGN: "The campaign details provided do not match any existing campaigns.",
+    }[outcome])
+
+
+def view_campaign_status(client):
+    campaign = _campaign(client)
+    if campaign is None:
+        return
+    issue, location, start_date = campaign
+    row = client.campaign_status(issue, location, start_date)
+    if row is None:
+        print("No campaign found with the provided details.")
+    else:
+        print(format_row(row))
+
+
+def print_accounting_report(client):
+    results = client.accounting_report(*_date_range())
+    if not results:
+        print("No campaigns found.")
+        return
+
+    print("Budget Coverage by Donations:")
+    for issue, budget, total_donations in results:
+        if budget > 0:  # Avoid division by zero
+            coverage_percentage = (total_donations / budget) * 100
+            bar_length = int(coverage_percentage / 2)  # Here, 100% = 50 characters in bar length
+            print(f"Campaign: {issue}, Budget: {budget}, Donations: {total_donations}, Coverage: {coverage_percentage:.2f}%")
+            print(f"[{'#' * bar_length}]")
+        else:
+            print(f"Campaign: {issue}, Budget: {budget}, Donations: {total_donations}, Coverage: N/A (No budget specified)")
+
+
+def make_donation(client):
+    donor_email = _entity(client, "donor")
+    campaign = _campaign(client) if donor_email else None
+    if campaign is None:
+        return
+    campaign_issue, campaign_location, campaign_start_date = campaign
+    donation_date = input("Enter donation date (YYYY-MM-DD): ")
+    amount = input("Enter donation amount: ")
+    outcome = client.make_donation(donor_email, campaign_issue, campaign_location, campaign_start_date,
+                                   donation_date, amount)
+    print({
+        CREATED: "Donation added successfully.",
+        EXISTS: "This donation has already been recorded.",
+        UNKNOWN_DONOR: "No donor found with the given email. Please add the donor first.",
+        UNKNOWN_CAMPAIGN: "No campaign found with the given details. Please add the campaign first.",
+    }[outcome])
+
+
+def register_donor(client):
+    donor_email = input("Enter donor email: ")
+    donor_name = input("Enter donor name: ")
+    outcome = client.register_donor(donor_email, donor_name)
+    print({
+        CREATED: "New donor added successfully.",
+        EXISTS: "A donor with this email already exists.",
+    }[outcome])
+
+
+def add_campaign_annotation(client):
+    campaign = _campaign(client)
+    if campaign is None:
+        return
+    issue, location, start_date = campaign
+    annotation = input("Enter annotation: ")
+    outcome = client.add_campaign_annotation(issue, location, start_date, annotation)
+    print({
+        UPDATED: "Annotation added to campaign successfully.",
+        NOT_FOUND: "No campaign found with the provided details.",
+    }[outcome])
+
+
+def add_membership_history(client):
+    entity_email = _entity(client, "entity")
+    campaign = _campaign(client) if entity_email else None
+    if campaign is None:
+        return
+    campaign_issue, campaign_location, campaign_start_date = campaign
+    involvement_start_date = input("Enter involvement start date (YYYY-MM-DD): ")
+    involvement_end_date = input("Enter involvement end date (YYYY-MM-DD): ")
+    annotations = input("Enter annotations: ")
+    outcome = client.add_membership_history(entity_email, campaign_issue, campaign_location, campaign_start_date,
+                                            involvement_start_date, involvement_end_date, annotations)
+    print({
+        CREATED: "Membership history added successfully.",
+        EXISTS: "This membership history already exists.",
+        UNKNOWN_DONOR: "No entity found with the given email.",
+        UNKNOWN_CAMPAIGN: "No campaign found with the given details.",
+    }[outcome])
+
+
+def update_membership_history_annotation(client):
+    entity_email = _entity(client, "entity")
+    campaign = _campaign(client) if entity_email else None
+    if campaign is None:
+        return
+    campaign_issue, campaign_location, campaign_start_date = campaign
+    new_annotation = input("Enter new annotation: ")
+    outcome = client.update_membership_history_annotation(entity_email, campaign_issue, campaign_location,
+                                                          campaign_start_date, new_annotation)
+    print({
+        UPDATED: "Membership history annotation updated successfully for the specific campaign.",
+        NOT_FOUND: "No matching membership history found or no changes were made.",
+    }[outcome])
+
+
+def calculate_engagement_score(client):
+    since, until = _date_range()
+    for email, total_score, _, _ in client.engagement_scores(since=since, until=until):
+        print(f"Member Email: {email}, Engagement Score: {total_score}")
+
+
+def member_activity_dashboard(client):
+    entity_email = _entity(client, "member")
+    if entity_email is None:
+        return
+    dashboard = client.member_dashboard(entity_email)
+
+    print(f"Activity Dashboard for {entity_email}:")
+    print("Donations:")
+    for donation in dashboard["donations"]:
+        print(f"Issue: {donation[0]}, Location: {donation[1]}, Date: {donation[2]}, Amount: {donation[3]}")
+
+    print("\nVolunteering:")
+    for volunteer in dashboard["volunteering"]:
+        print(f"Issue: {volunteer[0]}, Location: {volunteer[1]}, Campaign Start: {volunteer[2]}, Involvement: {volunteer[3]} to {volunteer[4]}")
+
+    print("\nScheduled Activities:")
+    for schedule in dashboard["scheduled"]:
+        print(f"Issue: {schedule[0]}, Location: {schedule[1]}, Campaign Start: {schedule[2]}, Scheduled Date: {schedule[3]}")
+
+
+def live_campaign_dashboard(client):
+    # Campaign funding and volunteers, printed once in full and then as they
+    # change, until Ctrl+C. Listens on the primary: standbys do not deliver NOTIFY.
+    live = LiveCampaigns(client.service.conninfo)
+    live.subscribe(print_changes)
+    live.start()
+    print("Watching campaigns; press Ctrl+C to return to the menu.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        live.stop()
+
+
+MENU_ACTIONS = {
+    "11": create_campaign,
+    "12": add_volunteer,
+    "13": schedule_volunteer,
+    "14": view_campaign_status,
+    "15": print_accounting_report,
+    "16": make_donation,
+    "17": register_donor,
+    "18": add_campaign_annotation,
+    "19": add_membership_history,
+    "20": update_membership_history_annotation,
+    "21": calculate_engagement_score,
+    "22": member_activity_dashboard,
+    "23": live_campaign_dashboard,
+}
+
+
+def run_choice(client, choice):
+    try:
+        if choice in {str(n) for n in range(1, 11)}:
+            show_report(client, f"Query{choice}")
+        else:
+            MENU_ACTIONS[choice](client)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+    except Error as e:
+        print(f"Database error: {e}")
@@ -0,0 +1,110 @@
+import argparse
+import importlib.util
+import os
+import re
+
+import psycopg2
+from psycopg2 import OperationalError
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+_MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.(sql|py)$")
+
+# Arbitrary key for pg_advisory_lock so two migrate runs cannot interleave
+_MIGRATION_LOCK_KEY = 370_097
+
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    # Migrations are NNNN_name.sql files, or NNNN_name.py files defining
+    # upgrade(cursor), applied in version order
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _MIGRATION_FILE.match(filename)
+        if match:
+            version, name, kind = match.groups()
+            migrations.append((int(version), name, kind, os.path.join(directory, filename)))
+    versions = [version for version, _, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Duplicate migration version numbers in " + directory)
+    return migrations
+
+
+def _apply(cursor, kind, path):
+    if kind == "sql":
+        with open(path, encoding="utf-8") as handle:
+            cursor.execute(handle.read())
+    else:
+        spec = importlib.util.spec_from_file_location("migration_" + os.path.basename(path)[:-3], path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.upgrade(cursor)
+
+
+def applied_versions(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS SchemaMigrations (
+                version INT PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+        cursor.execute("SELECT version FROM SchemaMigrations;")
+        versions = {version for (version,) in cursor.fetchall()}
+        connection.commit()
+        return versions
+    finally:
+        cursor.close()
+
+
+def migrate(connection, target=None, directory=MIGRATIONS_DIR):
+    # Apply every pending migration up to target, each in its own transaction.
+    # Returns the (version, name) pairs that were applied.
+    applied = []
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT pg_advisory_lock(%s);", (_MIGRATION_LOCK_KEY,))
+        done = applied_versions(connection)
+        for version, name, kind, path in discover_migrations(directory):
+            if version in done or (target is not None and version > target):
+                continue
+            try:
+                _apply(cursor, kind, path)
+                cursor.execute("INSERT INTO SchemaMigrations (version, name) VALUES (%s, %s);", (version, name))
+                connection.commit()
+            except psycopg2.Error:
+                connection.rollback()
+                raise
+            applied.append((version, name))
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s);", (_MIGRATION_LOCK_KEY,))
+        connection.commit()
+        cursor.close()
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("--target", type=int, help="stop after this migration version")
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    args = parser.parse_args()
+
+    try:
+        connection = psycopg2.connect(args.dsn)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return
+    try:
+        applied = migrate(connection, args.target)
+        if not applied:
+            print("Schema is up to date.")
+        for version, name in applied:
+            print(f"Applied migration {version:04d} {name}")
+    except psycopg2.Error as e:
+        print(f"Migration failed: {e}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
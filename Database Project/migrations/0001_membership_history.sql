@@ -0,0 +1,15 @@
+-- MembershipHistory is used by the scoring, dashboard and annotation code but
+-- was never part of gng-construct.sql
+CREATE TABLE IF NOT EXISTS MembershipHistory (
+    entity_email VARCHAR(255),
+    campaign_issue VARCHAR(255),
+    campaign_location VARCHAR(255),
+    campaign_start_date DATE,
+    involvement_start_date DATE,
+    involvement_end_date DATE,
+    annotations TEXT,
+    PRIMARY KEY (entity_email, campaign_issue, campaign_location, campaign_start_date, involvement_start_date),
+    FOREIGN KEY (entity_email) REFERENCES Entity(email),
+    FOREIGN KEY (campaign_issue, campaign_location, campaign_start_date)
+      REFERENCES Campaigns(issue, location, start_date)
+);
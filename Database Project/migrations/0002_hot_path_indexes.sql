@@ -0,0 +1,28 @@
+-- The primary keys of Donations, Scheduled and MembershipHistory lead with
+-- entity_email, so lookups by member are covered. These indexes cover the
+-- campaign-keyed joins and the date filters used by the reports.
+
+-- Campaign joins (accounting report, Query5, CampaignTotals max recompute);
+-- amount is included so per-campaign aggregates can use index-only scans
+CREATE INDEX IF NOT EXISTS donations_campaign_idx
+    ON Donations (campaign_issue, campaign_location, campaign_start_date) INCLUDE (amount);
+
+-- Date-windowed reports and engagement scoring
+CREATE INDEX IF NOT EXISTS donations_donation_date_idx
+    ON Donations (donation_date) INCLUDE (entity_email, amount);
+
+CREATE INDEX IF NOT EXISTS scheduled_campaign_idx
+    ON Scheduled (campaign_issue, campaign_location, campaign_start_date);
+
+-- Query6 filters on campaign_start_date and returns entity_email
+CREATE INDEX IF NOT EXISTS scheduled_campaign_start_date_idx
+    ON Scheduled (campaign_start_date, entity_email);
+
+CREATE INDEX IF NOT EXISTS membershiphistory_campaign_idx
+    ON MembershipHistory (campaign_issue, campaign_location, campaign_start_date);
+
+-- Active involvements (end date unset or in the future) for engagement scoring
+CREATE INDEX IF NOT EXISTS membershiphistory_open_idx
+    ON MembershipHistory (entity_email) WHERE involvement_end_date IS NULL;
+CREATE INDEX IF NOT EXISTS membershiphistory_end_date_idx
+    ON MembershipHistory (involvement_end_date, entity_email) WHERE involvement_end_date IS NOT NULL;
@@ -0,0 +1,94 @@
+-- Per-campaign donation aggregates kept in step with Donations by
+-- statement-level triggers (see campaign_totals.py), filled from the
+-- donations already recorded
+
+CREATE TABLE IF NOT EXISTS CampaignTotals (
+    campaign_issue VARCHAR(255),
+    campaign_location VARCHAR(255),
+    campaign_start_date DATE,
+    donation_sum NUMERIC NOT NULL DEFAULT 0,
+    donation_count BIGINT NOT NULL DEFAULT 0,
+    donation_max NUMERIC,
+    PRIMARY KEY (campaign_issue, campaign_location, campaign_start_date),
+    FOREIGN KEY (campaign_issue, campaign_location, campaign_start_date)
+      REFERENCES Campaigns(issue, location, start_date) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION campaign_totals_add() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO CampaignTotals AS t (campaign_issue, campaign_location, campaign_start_date,
+                                     donation_sum, donation_count, donation_max)
+    SELECT campaign_issue, campaign_location, campaign_start_date,
+           COALESCE(SUM(amount), 0), COUNT(*), MAX(amount)
+    FROM new_rows
+    GROUP BY campaign_issue, campaign_location, campaign_start_date
+    ON CONFLICT (campaign_issue, campaign_location, campaign_start_date) DO UPDATE
+    SET donation_sum = t.donation_sum + EXCLUDED.donation_sum,
+        donation_count = t.donation_count + EXCLUDED.donation_count,
+        donation_max = GREATEST(t.donation_max, EXCLUDED.donation_max);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION campaign_totals_remove() RETURNS trigger AS $$
+BEGIN
+    -- Sums and counts are subtracted; the max can only be recomputed, and
+    -- only for campaigns whose current max was one of the removed amounts
+    WITH removed AS (
+        SELECT campaign_issue, campaign_location, campaign_start_date,
+               COALESCE(SUM(amount), 0) AS amount_sum, COUNT(*) AS amount_count,
+               MAX(amount) AS amount_max
+        FROM old_rows
+        GROUP BY campaign_issue, campaign_location, campaign_start_date
+    )
+    UPDATE CampaignTotals t
+    SET donation_sum = t.donation_sum - r.amount_sum,
+        donation_count = t.donation_count - r.amount_count,
+        donation_max = CASE
+            WHEN r.amount_max IS NULL OR r.amount_max < t.donation_max THEN t.donation_max
+            ELSE (SELECT MAX(d.amount) FROM Donations d
+                  WHERE d.campaign_issue = t.campaign_issue
+                    AND d.campaign_location = t.campaign_location
+                    AND d.campaign_start_date = t.campaign_start_date)
+        END
+    FROM removed r
+    WHERE t.campaign_issue = r.campaign_issue
+      AND t.campaign_location = r.campaign_location
+      AND t.campaign_start_date = r.campaign_start_date;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS campaign_totals_insert ON Donations;
+CREATE TRIGGER campaign_totals_insert
+    AFTER INSERT ON Donations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_add();
+
+DROP TRIGGER IF EXISTS campaign_totals_delete ON Donations;
+CREATE TRIGGER campaign_totals_delete
+    AFTER DELETE ON Donations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_remove();
+
+-- An UPDATE is applied as removing the old rows and adding the new ones
+DROP TRIGGER IF EXISTS campaign_totals_update_remove ON Donations;
+CREATE TRIGGER campaign_totals_update_remove
+    AFTER UPDATE ON Donations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_remove();
+
+DROP TRIGGER IF EXISTS campaign_totals_update_add ON Donations;
+CREATE TRIGGER campaign_totals_update_add
+    AFTER UPDATE ON Donations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_add();
+
+LOCK TABLE Donations IN SHARE MODE;
+TRUNCATE CampaignTotals;
+INSERT INTO CampaignTotals (campaign_issue, campaign_location, campaign_start_date,
+                            donation_sum, donation_count, donation_max)
+    SELECT campaign_issue, campaign_location, campaign_start_date,
+           COALESCE(SUM(amount), 0) AS donation_sum, COUNT(*) AS donation_count, MAX(amount) AS donation_max
+    FROM Donations
+    GROUP BY campaign_issue, campaign_location, campaign_start_date;
@@ -0,0 +1,91 @@
+-- The EngagementScores snapshot of engagement.py and the triggers that mark
+-- members dirty when their donations or memberships change
+
+CREATE TABLE IF NOT EXISTS EngagementScores (
+    entity_email VARCHAR(255) PRIMARY KEY,
+    score NUMERIC NOT NULL,
+    donation_count BIGINT NOT NULL,
+    volunteering_count BIGINT NOT NULL,
+    computed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    FOREIGN KEY (entity_email) REFERENCES Entity(email) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS engagementscores_score_idx ON EngagementScores (score DESC, entity_email);
+
+-- The settings the snapshot was computed with; an incremental refresh is only
+-- valid when it uses the same settings
+CREATE TABLE IF NOT EXISTS EngagementScoreConfig (
+    id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    settings JSONB NOT NULL,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Members whose activity changed since the last refresh
+CREATE TABLE IF NOT EXISTS EngagementDirty (
+    entity_email VARCHAR(255) PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION engagement_mark_new() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO EngagementDirty (entity_email)
+    SELECT DISTINCT entity_email FROM new_rows
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION engagement_mark_old() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO EngagementDirty (entity_email)
+    SELECT DISTINCT entity_email FROM old_rows
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS engagement_INSERT_new_Donations ON Donations;
+CREATE TRIGGER engagement_INSERT_new_Donations
+    AFTER INSERT ON Donations
+    REFERENCING new TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_new();
+
+DROP TRIGGER IF EXISTS engagement_DELETE_old_Donations ON Donations;
+CREATE TRIGGER engagement_DELETE_old_Donations
+    AFTER DELETE ON Donations
+    REFERENCING old TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_old();
+
+DROP TRIGGER IF EXISTS engagement_UPDATE_old_Donations ON Donations;
+CREATE TRIGGER engagement_UPDATE_old_Donations
+    AFTER UPDATE ON Donations
+    REFERENCING old TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_old();
+
+DROP TRIGGER IF EXISTS engagement_UPDATE_new_Donations ON Donations;
+CREATE TRIGGER engagement_UPDATE_new_Donations
+    AFTER UPDATE ON Donations
+    REFERENCING new TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_new();
+
+DROP TRIGGER IF EXISTS engagement_INSERT_new_MembershipHistory ON MembershipHistory;
+CREATE TRIGGER engagement_INSERT_new_MembershipHistory
+    AFTER INSERT ON MembershipHistory
+    REFERENCING new TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_new();
+
+DROP TRIGGER IF EXISTS engagement_DELETE_old_MembershipHistory ON MembershipHistory;
+CREATE TRIGGER engagement_DELETE_old_MembershipHistory
+    AFTER DELETE ON MembershipHistory
+    REFERENCING old TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_old();
+
+DROP TRIGGER IF EXISTS engagement_UPDATE_old_MembershipHistory ON MembershipHistory;
+CREATE TRIGGER engagement_UPDATE_old_MembershipHistory
+    AFTER UPDATE ON MembershipHistory
+    REFERENCING old TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_old();
+
+DROP TRIGGER IF EXISTS engagement_UPDATE_new_MembershipHistory ON MembershipHistory;
+CREATE TRIGGER engagement_UPDATE_new_MembershipHistory
+    AFTER UPDATE ON MembershipHistory
+    REFERENCING new TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_new();
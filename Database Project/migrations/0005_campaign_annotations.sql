@@ -0,0 +1,3 @@
+-- add_campaign_annotation updates Campaigns.annotations, which
+-- gng-construct.sql never created
+ALTER TABLE Campaigns ADD COLUMN IF NOT EXISTS annotations TEXT;
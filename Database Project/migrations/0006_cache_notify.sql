@@ -0,0 +1,44 @@
+-- Statement-level triggers that announce writes made by any process, so other
+-- processes can drop their cached results (cache.CacheInvalidationListener)
+
+CREATE OR REPLACE FUNCTION gng_notify_table_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('gng_table_changed', lower(TG_TABLE_NAME));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS gng_notify_entity ON entity;
+CREATE TRIGGER gng_notify_entity
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON entity
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_notify_table_changed();
+
+DROP TRIGGER IF EXISTS gng_notify_campaigns ON campaigns;
+CREATE TRIGGER gng_notify_campaigns
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON campaigns
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_notify_table_changed();
+
+DROP TRIGGER IF EXISTS gng_notify_donations ON donations;
+CREATE TRIGGER gng_notify_donations
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON donations
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_notify_table_changed();
+
+DROP TRIGGER IF EXISTS gng_notify_volunteer ON volunteer;
+CREATE TRIGGER gng_notify_volunteer
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON volunteer
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_notify_table_changed();
+
+DROP TRIGGER IF EXISTS gng_notify_member ON member;
+CREATE TRIGGER gng_notify_member
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON member
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_notify_table_changed();
+
+DROP TRIGGER IF EXISTS gng_notify_employee ON employee;
+CREATE TRIGGER gng_notify_employee
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON employee
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_notify_table_changed();
+
+DROP TRIGGER IF EXISTS gng_notify_scheduled ON scheduled;
+CREATE TRIGGER gng_notify_scheduled
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON scheduled
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_notify_table_changed();
@@ -0,0 +1,127 @@
+import datetime
+
+# Partitions created past the current month, as partitions.MONTHS_AHEAD was
+# when this migration was written
+MONTHS_AHEAD = 3
+
+DONATIONS_PARTITIONED_DDL = """
+CREATE TABLE Donations (
+    entity_email VARCHAR(255),
+    campaign_issue VARCHAR(255),
+    campaign_location VARCHAR(255),
+    campaign_start_date DATE,
+    donation_date DATE,
+    amount NUMERIC,
+    PRIMARY KEY (entity_email, campaign_issue, campaign_location, campaign_start_date, donation_date),
+    FOREIGN KEY (entity_email) REFERENCES Entity(email),
+    FOREIGN KEY (campaign_issue, campaign_location, campaign_start_date) REFERENCES Campaigns(issue, location, start_date)
+) PARTITION BY RANGE (donation_date);
+
+CREATE TABLE donations_default PARTITION OF Donations DEFAULT;
+
+-- The hot-path indexes of migration 0002, now partitioned indexes that every
+-- partition inherits
+CREATE INDEX donations_campaign_idx
+    ON Donations (campaign_issue, campaign_location, campaign_start_date) INCLUDE (amount);
+CREATE INDEX donations_donation_date_idx
+    ON Donations (donation_date) INCLUDE (entity_email, amount);
+"""
+
+# The Donations triggers of migrations 0003, 0004 and 0006. Their functions
+# are unchanged and stay in place; only the triggers go with the old table.
+DONATIONS_TRIGGERS_DDL = """
+CREATE TRIGGER campaign_totals_insert
+    AFTER INSERT ON Donations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_add();
+CREATE TRIGGER campaign_totals_delete
+    AFTER DELETE ON Donations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_remove();
+CREATE TRIGGER campaign_totals_update_remove
+    AFTER UPDATE ON Donations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_remove();
+CREATE TRIGGER campaign_totals_update_add
+    AFTER UPDATE ON Donations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION campaign_totals_add();
+
+CREATE TRIGGER engagement_INSERT_new_Donations
+    AFTER INSERT ON Donations
+    REFERENCING new TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_new();
+CREATE TRIGGER engagement_DELETE_old_Donations
+    AFTER DELETE ON Donations
+    REFERENCING old TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_old();
+CREATE TRIGGER engagement_UPDATE_old_Donations
+    AFTER UPDATE ON Donations
+    REFERENCING old TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_old();
+CREATE TRIGGER engagement_UPDATE_new_Donations
+    AFTER UPDATE ON Donations
+    REFERENCING new TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION engagement_mark_new();
+
+CREATE TRIGGER gng_notify_donations
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON donations
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_notify_table_changed();
+"""
+
+# The report views of gng-construct.sql are bound to the old table, so they
+# are dropped and recreated from their own definitions
+_DEPENDENT_VIEWS = """
+    SELECT DISTINCT v.oid::regclass::text, pg_get_viewdef(v.oid)
+    FROM pg_depend d
+    JOIN pg_rewrite r ON r.oid = d.objid
+    JOIN pg_class v ON v.oid = r.ev_class
+    WHERE d.refobjid = 'donations'::regclass AND v.relkind = 'v';
+"""
+
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade(cursor):
+    # Rebuild Donations as a table range partitioned by month of
+    # donation_date. The rows are copied before any trigger exists on the new
+    # table, so CampaignTotals and EngagementDirty stay as they are.
+    cursor.execute("LOCK TABLE Donations IN ACCESS EXCLUSIVE MODE;")
+    cursor.execute(_DEPENDENT_VIEWS)
+    views = cursor.fetchall()
+    for name, _ in views:
+        cursor.execute(f"DROP VIEW {name};")
+
+    cursor.execute("ALTER TABLE Donations RENAME TO donations_unpartitioned;")
+    cursor.execute("ALTER TABLE donations_unpartitioned RENAME CONSTRAINT donations_pkey TO donations_unpartitioned_pkey;")
+    cursor.execute("DROP INDEX IF EXISTS donations_campaign_idx, donations_donation_date_idx;")
+    cursor.execute(DONATIONS_PARTITIONED_DDL)
+
+    # Partitions for every month with data and the months ahead, created
+    # before the copy so no row lands in the default partition
+    cursor.execute("SELECT MIN(donation_date), MAX(donation_date) FROM donations_unpartitioned;")
+    first, last = cursor.fetchone()
+    this_month = datetime.date.today().replace(day=1)
+    month = min(first or this_month, this_month).replace(day=1)
+    last = _add_months(max(last or this_month, this_month).replace(day=1), MONTHS_AHEAD)
+    while month <= last:
+        cursor.execute(f"""
+            CREATE TABLE donations_{month:%Y_%m} PARTITION OF Donations
+            FOR VALUES FROM (%s) TO (%s);
+        """, (month, _add_months(month, 1)))
+        month = _add_months(month, 1)
+    cursor.execute("""
+        INSERT INTO Donations (entity_email, campaign_issue, campaign_location, campaign_start_date, donation_date, amount)
+        SELECT entity_email, campaign_issue, campaign_location, campaign_start_date, donation_date, amount
+        FROM donations_unpartitioned;
+    """)
+    cursor.execute("DROP TABLE donations_unpartitioned;")
+
+    for name, definition in views:
+        cursor.execute(f"CREATE VIEW {name} AS {definition}")
+    # Triggers do not survive the swap; reinstall them on the partitioned table
+    cursor.execute(DONATIONS_TRIGGERS_DDL)
+    cursor.execute("ANALYZE Donations;")
@@ -0,0 +1,76 @@
+REFERENCING_TABLES = ["Donations", "Scheduled", "MembershipHistory"]
+
+SURROGATE_KEYS_DDL = """
+ALTER TABLE Campaigns ADD COLUMN IF NOT EXISTS campaign_id INTEGER GENERATED BY DEFAULT AS IDENTITY;
+ALTER TABLE Campaigns ADD CONSTRAINT campaigns_campaign_id_key UNIQUE (campaign_id);
+ALTER TABLE Entity ADD COLUMN IF NOT EXISTS entity_id INTEGER GENERATED BY DEFAULT AS IDENTITY;
+ALTER TABLE Entity ADD CONSTRAINT entity_entity_id_key UNIQUE (entity_id);
+"""
+
+# Fills in the ids a writer did not supply. A statement that inserts the
+# Entity or Campaigns row itself must pass them: rows inserted earlier in the
+# same statement are not visible to the trigger.
+KEY_RESOLUTION_DDL = """
+CREATE OR REPLACE FUNCTION gng_resolve_keys() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' OR NEW.entity_id IS NULL THEN
+        SELECT entity_id INTO NEW.entity_id FROM Entity WHERE email = NEW.entity_email;
+    END IF;
+    IF TG_OP = 'UPDATE' OR NEW.campaign_id IS NULL THEN
+        SELECT campaign_id INTO NEW.campaign_id FROM Campaigns
+        WHERE issue = NEW.campaign_issue AND location = NEW.campaign_location AND start_date = NEW.campaign_start_date;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS gng_resolve_keys ON Donations;
+CREATE TRIGGER gng_resolve_keys
+    BEFORE INSERT OR UPDATE OF entity_email, campaign_issue, campaign_location, campaign_start_date ON Donations
+    FOR EACH ROW EXECUTE FUNCTION gng_resolve_keys();
+
+DROP TRIGGER IF EXISTS gng_resolve_keys ON Scheduled;
+CREATE TRIGGER gng_resolve_keys
+    BEFORE INSERT OR UPDATE OF entity_email, campaign_issue, campaign_location, campaign_start_date ON Scheduled
+    FOR EACH ROW EXECUTE FUNCTION gng_resolve_keys();
+
+DROP TRIGGER IF EXISTS gng_resolve_keys ON MembershipHistory;
+CREATE TRIGGER gng_resolve_keys
+    BEFORE INSERT OR UPDATE OF entity_email, campaign_issue, campaign_location, campaign_start_date ON MembershipHistory
+    FOR EACH ROW EXECUTE FUNCTION gng_resolve_keys();
+"""
+
+# The id-keyed counterparts of the campaign access-path indexes
+SURROGATE_INDEXES_DDL = """
+CREATE INDEX IF NOT EXISTS donations_campaign_id_idx ON Donations (campaign_id) INCLUDE (amount);
+CREATE INDEX IF NOT EXISTS scheduled_campaign_id_idx ON Scheduled (campaign_id);
+"""
+
+
+def upgrade(cursor):
+    # Add campaign_id and entity_id next to the natural keys. Nothing is
+    # dropped, so every existing query and writer keeps working unchanged.
+    cursor.execute(SURROGATE_KEYS_DDL)
+    for table in REFERENCING_TABLES:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN entity_id INTEGER, ADD COLUMN campaign_id INTEGER;")
+        # The backfill changes no natural key or amount, so the summary,
+        # engagement and notify triggers are skipped rather than replayed
+        cursor.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER;")
+        cursor.execute(f"""
+            UPDATE {table} t
+            SET entity_id = e.entity_id, campaign_id = c.campaign_id
+            FROM Entity e, Campaigns c
+            WHERE e.email = t.entity_email
+              AND c.issue = t.campaign_issue AND c.location = t.campaign_location
+              AND c.start_date = t.campaign_start_date;
+        """)
+        cursor.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER;")
+        # Added after the backfill so each is validated in one pass
+        cursor.execute(f"""
+            ALTER TABLE {table}
+                ADD FOREIGN KEY (entity_id) REFERENCES Entity(entity_id),
+                ADD FOREIGN KEY (campaign_id) REFERENCES Campaigns(campaign_id);
+        """)
+    cursor.execute(KEY_RESOLUTION_DDL + SURROGATE_INDEXES_DDL)
+    for table in REFERENCING_TABLES:
+        cursor.execute(f"ANALYZE {table};")
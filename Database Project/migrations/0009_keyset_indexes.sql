@@ -0,0 +1,20 @@
+-- Orderings of the paginated listings in pagination.py. A page continues
+-- after the previous page's last key, so each listing needs an index that
+-- returns its rows in exactly that order after the equality columns.
+
+-- Member dashboard lists: a member's activity by date, then campaign key
+CREATE INDEX IF NOT EXISTS donations_entity_date_idx
+    ON Donations (entity_email, donation_date, campaign_issue, campaign_location, campaign_start_date) INCLUDE (amount);
+CREATE INDEX IF NOT EXISTS membershiphistory_entity_start_idx
+    ON MembershipHistory (entity_email, involvement_start_date, campaign_issue, campaign_location, campaign_start_date);
+CREATE INDEX IF NOT EXISTS scheduled_entity_date_idx
+    ON Scheduled (entity_email, scheduled_date, campaign_issue, campaign_location, campaign_start_date);
+
+-- A campaign's donations and schedule by date, then email. These extend the
+-- campaign_id indexes of migration 0008, which they replace.
+CREATE INDEX IF NOT EXISTS donations_campaign_date_idx
+    ON Donations (campaign_id, donation_date, entity_email) INCLUDE (amount);
+DROP INDEX IF EXISTS donations_campaign_id_idx;
+CREATE INDEX IF NOT EXISTS scheduled_campaign_date_idx
+    ON Scheduled (campaign_id, scheduled_date, entity_email);
+DROP INDEX IF EXISTS scheduled_campaign_id_idx;
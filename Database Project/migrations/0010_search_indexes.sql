@@ -0,0 +1,14 @@
+-- pg_trgm and the trigram indexes behind search.py, one on each searched
+-- expression. Creating an extension needs CREATE on the database; a DBA can
+-- run CREATE EXTENSION pg_trgm beforehand, after which this only adds the
+-- indexes.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS campaigns_search_trgm_idx
+    ON Campaigns USING gist ((lower(issue || ' ' || location)) gist_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS entity_search_trgm_idx
+    ON Entity USING gist ((lower(email || ' ' || COALESCE(name, ''))) gist_trgm_ops);
+
+ANALYZE Campaigns;
+ANALYZE Entity;
@@ -0,0 +1,84 @@
+-- Notify the campaign_ids each statement on Donations, Scheduled and
+-- Campaigns touched, for live.LiveCampaigns. The keys come from the
+-- transition tables, so a bulk import sends a handful of notifications rather
+-- than one per row, chunked to 500 ids to stay well under the 8000-byte
+-- payload limit. TRUNCATE has no transition tables and asks listeners to
+-- reload everything instead.
+
+CREATE OR REPLACE FUNCTION gng_live_notify() RETURNS trigger AS $$
+DECLARE
+    ids INTEGER[];
+    i INTEGER := 1;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('gng_campaign_changed', json_build_object('table', lower(TG_TABLE_NAME), 'resync', true)::text);
+        RETURN NULL;
+    ELSIF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT campaign_id) INTO ids FROM new_rows WHERE campaign_id IS NOT NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT campaign_id) INTO ids FROM old_rows WHERE campaign_id IS NOT NULL;
+    ELSE
+        SELECT array_agg(campaign_id) INTO ids FROM (
+            SELECT campaign_id FROM old_rows UNION SELECT campaign_id FROM new_rows
+        ) changed
+        WHERE campaign_id IS NOT NULL;
+    END IF;
+    WHILE i <= COALESCE(array_length(ids, 1), 0) LOOP
+        PERFORM pg_notify('gng_campaign_changed', json_build_object(
+            'table', lower(TG_TABLE_NAME), 'ids', ids[i:i + 500 - 1])::text);
+        i := i + 500;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS gng_live_insert ON Donations;
+CREATE TRIGGER gng_live_insert
+    AFTER INSERT ON Donations REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+DROP TRIGGER IF EXISTS gng_live_update ON Donations;
+CREATE TRIGGER gng_live_update
+    AFTER UPDATE ON Donations REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+DROP TRIGGER IF EXISTS gng_live_delete ON Donations;
+CREATE TRIGGER gng_live_delete
+    AFTER DELETE ON Donations REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+DROP TRIGGER IF EXISTS gng_live_truncate ON Donations;
+CREATE TRIGGER gng_live_truncate
+    AFTER TRUNCATE ON Donations
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+
+DROP TRIGGER IF EXISTS gng_live_insert ON Scheduled;
+CREATE TRIGGER gng_live_insert
+    AFTER INSERT ON Scheduled REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+DROP TRIGGER IF EXISTS gng_live_update ON Scheduled;
+CREATE TRIGGER gng_live_update
+    AFTER UPDATE ON Scheduled REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+DROP TRIGGER IF EXISTS gng_live_delete ON Scheduled;
+CREATE TRIGGER gng_live_delete
+    AFTER DELETE ON Scheduled REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+DROP TRIGGER IF EXISTS gng_live_truncate ON Scheduled;
+CREATE TRIGGER gng_live_truncate
+    AFTER TRUNCATE ON Scheduled
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+
+DROP TRIGGER IF EXISTS gng_live_insert ON Campaigns;
+CREATE TRIGGER gng_live_insert
+    AFTER INSERT ON Campaigns REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+DROP TRIGGER IF EXISTS gng_live_update ON Campaigns;
+CREATE TRIGGER gng_live_update
+    AFTER UPDATE ON Campaigns REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+DROP TRIGGER IF EXISTS gng_live_delete ON Campaigns;
+CREATE TRIGGER gng_live_delete
+    AFTER DELETE ON Campaigns REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
+DROP TRIGGER IF EXISTS gng_live_truncate ON Campaigns;
+CREATE TRIGGER gng_live_truncate
+    AFTER TRUNCATE ON Campaigns
+    FOR EACH STATEMENT EXECUTE FUNCTION gng_live_notify();
@@ -0,0 +1,15 @@
+# Outcomes returned by the write operations, shared by the async service and
+# the psycopg2 batch tools
+CREATED = "created"
+UPDATED = "updated"
+EXISTS = "exists"
+NOT_FOUND = "not_found"
+UNKNOWN_DONOR = "unknown_donor"
+UNKNOWN_CAMPAIGN = "unknown_campaign"
+INVALID = "invalid"
+
+
+def unknown_reference(error):
+    # Tell a missing entity from a missing campaign by the violated constraint
+    constraint = (error.diag.constraint_name or "").lower()
+    return UNKNOWN_DONOR if "email" in constraint else UNKNOWN_CAMPAIGN
@@ -0,0 +1,230 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+
+from keys import CAMPAIGN_COLUMNS
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# Keyset (seek) pagination: each listing is ordered by a unique key and a page
+# continues strictly after the key of the previous page's last row, so the
+# database seeks straight to it in an index. Page N costs the same as page 1;
+# nothing is skipped with OFFSET.
+#
+# query has three slots: {seek} for the "after the token" condition, {order}
+# for the ORDER BY list and, for a union, {lower_bound}, which pushes a
+# ">= first key" bound into each branch. key is the ordering as (expression,
+# SQL type, position of its value in the output row). params are the
+# caller-supplied parameters.
+LISTINGS = {
+    # Entities who have made a donation (Query1): Entity primary key
+    "Query1": {
+        "query": """
+            SELECT e.email, e.name FROM Entity e
+            WHERE EXISTS (SELECT 1 FROM Donations d WHERE d.entity_email = e.email) {seek}
+            ORDER BY {order} LIMIT %(limit)s
+        """,
+        "key": [("e.email", "varchar", 0)],
+        "params": [],
+    },
+    # Total donations per entity (Query2): Donations primary key, which
+    # leads with entity_email, feeds a grouped aggregate in key order
+    "Query2": {
+        "query": """
+            SELECT d.entity_email, SUM(d.amount) AS total_donations FROM Donations d
+            WHERE TRUE {seek}
+            GROUP BY d.entity_email
+            ORDER BY {order} LIMIT %(limit)s
+        """,
+        "key": [("d.entity_email", "varchar", 0)],
+        "params": [],
+    },
+    # Campaigns with no donations (Query5): Campaigns primary key
+    "Query5": {
+        "query": f"""
+            SELECT {CAMPAIGN_COLUMNS} FROM Campaigns c
+            WHERE NOT EXISTS (SELECT 1 FROM Donations d WHERE d.campaign_id = c.campaign_id) {{seek}}
+            ORDER BY {{order}} LIMIT %(limit)s
+        """,
+        "key": [("c.issue", "varchar", 0), ("c.location", "varchar", 1), ("c.start_date", "date", 2)],
+        "params": [],
+    },
+    # Entities scheduled for campaigns after June 1, 2023 (Query6): Scheduled
+    # primary key, which leads with entity_email
+    "Query6": {
+        "query": """
+            SELECT DISTINCT s.entity_email FROM Scheduled s
+            WHERE s.campaign_start_date >= '2023-06-01' {seek}
+            ORDER BY {order} LIMIT %(limit)s
+        """,
+        "key": [("s.entity_email", "varchar", 0)],
+        "params": [],
+    },
+    # Entities with their roles (Query7). Each role table holds an entity at
+    # most once, so UNION ALL returns what UNION did. Every branch reads at
+    # most one page from its primary key; only those rows are sorted.
+    "Query7": {
+        "query": """
+            SELECT email, name, role FROM (
+                (SELECT e.email, e.name, 'Volunteer' AS role FROM Entity e JOIN Volunteer v ON e.email = v.entity_email
+                 WHERE TRUE {lower_bound} ORDER BY e.email LIMIT %(limit)s)
+                UNION ALL
+                (SELECT e.email, e.name, 'Member' AS role FROM Entity e JOIN Member m ON e.email = m.entity_email
+                 WHERE TRUE {lower_bound} ORDER BY e.email LIMIT %(limit)s)
+                UNION ALL
+                (SELECT e.email, e.name, 'Employee' AS role FROM Entity e JOIN Employee p ON e.email = p.entity_email
+                 WHERE TRUE {lower_bound} ORDER BY e.email LIMIT %(limit)s)
+            ) r
+            WHERE TRUE {seek}
+            ORDER BY {order} LIMIT %(limit)s
+        """,
+        "key": [("r.email", "varchar", 0), ("r.role", "text", 2)],
+        "lower_bound": "AND e.email >= %(k0)s::varchar",
+        "params": [],
+    },
+    # The member activity dashboard, one list at a time; each ordering has a
+    # matching (entity_email, date, campaign key) index from migration 0009
+    "member_donations": {
+        "query": """
+            SELECT d.campaign_issue, d.campaign_location, d.campaign_start_date, d.donation_date, d.amount
+            FROM Donations d
+            WHERE d.entity_email = %(email)s {seek}
+            ORDER BY {order} LIMIT %(limit)s
+        """,
+        "key": [("d.donation_date", "date", 3), ("d.campaign_issue", "varchar", 0),
+                ("d.campaign_location", "varchar", 1), ("d.campaign_start_date", "date", 2)],
+        "params": ["email"],
+    },
+    "member_volunteering": {
+        "query": """
+            SELECT m.campaign_issue, m.campaign_location, m.campaign_start_date,
+                   m.involvement_start_date, m.involvement_end_date
+            FROM MembershipHistory m
+            WHERE m.entity_email = %(email)s {seek}
+            ORDER BY {order} LIMIT %(limit)s
+        """,
+        "key": [("m.involvement_start_date", "date", 3), ("m.campaign_issue", "varchar", 0),
+                ("m.campaign_location", "varchar", 1), ("m.campaign_start_date", "date", 2)],
+        "params": ["email"],
+    },
+    "member_scheduled": {
+        "query": """
+            SELECT s.campaign_issue, s.campaign_location, s.campaign_start_date, s.scheduled_date
+            FROM Scheduled s
+            WHERE s.entity_email = %(email)s {seek}
+            ORDER BY {order} LIMIT %(limit)s
+        """,
+        "key": [("s.scheduled_date", "date", 3), ("s.campaign_issue", "varchar", 0),
+                ("s.campaign_location", "varchar", 1), ("s.campaign_start_date", "date", 2)],
+        "params": ["email"],
+    },
+    # A campaign's donations and schedule, for the campaign status view; the
+    # campaign is resolved to its campaign_id once, then the
+    # (campaign_id, date, entity_email) index is walked in order
+    "campaign_donations": {
+        "query": """
+            SELECT d.entity_email, d.donation_date, d.amount
+            FROM Donations d
+            WHERE d.campaign_id = (SELECT campaign_id FROM Campaigns
+                                   WHERE issue = %(issue)s AND location = %(location)s AND start_date = %(start_date)s)
+              {seek}
+            ORDER BY {order} LIMIT %(limit)s
+        """,
+        "key": [("d.donation_date", "date", 1), ("d.entity_email", "varchar", 0)],
+        "params": ["issue", "location", "start_date"],
+    },
+    "campaign_schedule": {
+        "query": """
+            SELECT s.entity_email, s.scheduled_date
+            FROM Scheduled s
+            WHERE s.campaign_id = (SELECT campaign_id FROM Campaigns
+                                   WHERE issue = %(issue)s AND location = %(location)s AND start_date = %(start_date)s)
+              {seek}
+            ORDER BY {order} LIMIT %(limit)s
+        """,
+        "key": [("s.scheduled_date", "date", 1), ("s.entity_email", "varchar", 0)],
+        "params": ["issue", "location", "start_date"],
+    },
+}
+
+
+def _fingerprint(name, params):
+    # Ties a token to its listing and parameters, so it cannot resume a
+    # different listing (or another member's) by mistake
+    text = json.dumps([name] + [str(params[key]) for key in LISTINGS[name]["params"]])
+    return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+
+def _encode_value(value):
+    return value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+
+
+def encode_token(name, params, row):
+    # Opaque continuation token holding the ordering key of the last row
+    spec = LISTINGS[name]
+    payload = {"f": _fingerprint(name, params), "k": [_encode_value(row[index]) for _, _, index in spec["key"]]}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_token(name, params, token):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        values = payload["k"]
+        fingerprint = payload["f"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise ValueError("Malformed continuation token")
+    if fingerprint != _fingerprint(name, params) or len(values) != len(LISTINGS[name]["key"]):
+        raise ValueError(f"Continuation token does not belong to this {name} listing")
+    return values
+
+
+def page_query(name, params=None, token=None, limit=DEFAULT_PAGE_SIZE):
+    # The SQL and parameters for one page. One row more than the page is
+    # fetched to tell whether another page follows.
+    if name not in LISTINGS:
+        raise ValueError(f"Unknown listing {name}")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"Page size must be between 1 and {MAX_PAGE_SIZE}")
+    spec = LISTINGS[name]
+    params = dict(params or {})
+    missing = [key for key in spec["params"] if key not in params]
+    if missing:
+        raise ValueError(f"{name} needs {', '.join(missing)}")
+    query_params = {key: params[key] for key in spec["params"]}
+    query_params["limit"] = limit + 1
+
+    seek = lower_bound = ""
+    if token:
+        for i, value in enumerate(decode_token(name, params, token)):
+            query_params[f"k{i}"] = value
+        # A row comparison matches the index order, so it is one index seek
+        columns = ", ".join(expression for expression, _, _ in spec["key"])
+        values = ", ".join(f"%(k{i})s::{kind}" for i, (_, kind, _) in enumerate(spec["key"]))
+        seek = f"AND ({columns}) > ({values})"
+        lower_bound = spec.get("lower_bound", "")
+    order = ", ".join(expression for expression, _, _ in spec["key"])
+    query = spec["query"].format(seek=seek, order=order, lower_bound=lower_bound)
+    return query, query_params
+
+
+def split_page(name, params, rows, limit):
+    # (the page's rows, token for the next page or None on the last page)
+    if len(rows) <= limit:
+        return list(rows), None
+    rows = list(rows[:limit])
+    return rows, encode_token(name, params, rows[-1])
+
+
+def fetch_page(connection, name, params=None, token=None, limit=DEFAULT_PAGE_SIZE):
+    # One page of a listing over a psycopg2 connection: (rows, next token)
+    query, query_params = page_query(name, params, token, limit)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, query_params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return split_page(name, params or {}, rows, limit)
@@ -0,0 +1,238 @@
+import argparse
+import datetime
+import os
+import re
+
+import psycopg2
+from psycopg2 import OperationalError, sql
+
+from cache import NOTIFY_CHANNEL
+from live import LIVE_CHANNEL
+
+# Donations is range partitioned by donation_date, one partition per calendar
+# month named donations_YYYY_MM, plus a DEFAULT partition that catches dates
+# no monthly partition covers yet. Partitions older than the retention window
+# are detached and renamed donations_archive_YYYY_MM.
+PARTITION_PATTERN = re.compile(r"^donations_(\d{4})_(\d{2})$")
+ARCHIVE_PREFIX = "donations_archive_"
+DEFAULT_PARTITION = "donations_default"
+
+# How far past the current month ensure_partitions keeps partitions ready
+MONTHS_AHEAD = 3
+
+_BOUND = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"donations_{month:%Y_%m}"
+
+
+def donation_date_range(alias, since=None, until=None):
+    # A condition limiting alias.donation_date to [since, until) and its
+    # parameters. Only the given bounds are emitted, as plain comparisons on
+    # the partition key, so the planner scans only the partitions they cover.
+    conditions = []
+    if since:
+        conditions.append(f"{alias}.donation_date >= %(since)s::date")
+    if until:
+        conditions.append(f"{alias}.donation_date < %(until)s::date")
+    return " AND ".join(conditions) or "TRUE", {"since": since, "until": until}
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('donations'));")
+    return cursor.fetchone()[0]
+
+
+def list_partitions(cursor):
+    # (name, lower bound, upper bound) of the attached monthly partitions, oldest first
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'donations'::regclass;
+    """)
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = _BOUND.search(bound or "")
+        if match:
+            lower, upper = (datetime.date.fromisoformat(value) for value in match.groups())
+            partitions.append((name, lower, upper))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(cursor, month):
+    # Create the partition for one month. Rows for that month already sitting
+    # in the DEFAULT partition are moved into it first, since ATTACH refuses
+    # to create a partition that the default still holds rows for. Moving rows
+    # between partitions does not change Donations as a whole, so the
+    # statement triggers on Donations rightly do not fire.
+    name = partition_name(month)
+    lower, upper = month, add_months(month, 1)
+    cursor.execute(sql.SQL("CREATE TABLE {} (LIKE Donations INCLUDING DEFAULTS INCLUDING CONSTRAINTS);").format(
+        sql.Identifier(name)))
+    cursor.execute(sql.SQL("""
+        WITH moved AS (
+            DELETE FROM donations_default
+            WHERE donation_date >= %(lower)s AND donation_date < %(upper)s
+            RETURNING *
+        )
+        INSERT INTO {} SELECT * FROM moved;
+    """).format(sql.Identifier(name)), {"lower": lower, "upper": upper})
+    cursor.execute(sql.SQL("ALTER TABLE Donations ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);").format(
+        sql.Identifier(name)), (lower, upper))
+    return name
+
+
+def create_partitions(cursor, first, last):
+    # Make sure every month from first through last has a partition; returns
+    # the names created. A no-op when Donations is not partitioned.
+    if not is_partitioned(cursor):
+        return []
+    existing = {lower for _, lower, _ in list_partitions(cursor)}
+    created = []
+    month = month_start(first)
+    while month <= last:
+        if month not in existing:
+            created.append(create_partition(cursor, month))
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_partitions(connection, months_ahead=MONTHS_AHEAD, today=None):
+    # Keep partitions ready from the newest existing one through months_ahead
+    # past the current month; meant to run daily from cron
+    today = today or datetime.date.today()
+    cursor = connection.cursor()
+    try:
+        partitions = list_partitions(cursor)
+        first = partitions[-1][2] if partitions else month_start(today)
+        last = add_months(month_start(today), months_ahead)
+        created = create_partitions(cursor, min(first, month_start(today)), last)
+        connection.commit()
+        return created
+    except psycopg2.Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# Take the detached rows out of the trigger-maintained summaries, exactly as
+# the DELETE triggers on Donations would have
+_ARCHIVED_TOTALS = """
+    WITH removed AS (
+        SELECT campaign_issue, campaign_location, campaign_start_date,
+               SUM(amount) AS amount_sum, COUNT(*) AS amount_count
+        FROM {archive}
+        GROUP BY campaign_issue, campaign_location, campaign_start_date
+    )
+    UPDATE CampaignTotals t
+    SET donation_sum = t.donation_sum - COALESCE(r.amount_sum, 0),
+        donation_count = t.donation_count - r.amount_count,
+        donation_max = (SELECT MAX(d.amount) FROM Donations d
+                        WHERE d.campaign_issue = t.campaign_issue
+                          AND d.campaign_location = t.campaign_location
+                          AND d.campaign_start_date = t.campaign_start_date)
+    FROM removed r
+    WHERE t.campaign_issue = r.campaign_issue
+      AND t.campaign_location = r.campaign_location
+      AND t.campaign_start_date = r.campaign_start_date;
+"""
+_ARCHIVED_ENGAGEMENT = """
+    INSERT INTO EngagementDirty (entity_email)
+    SELECT DISTINCT entity_email FROM {archive}
+    ON CONFLICT DO NOTHING;
+"""
+
+
+def archive_partitions(connection, before, export_dir=None, drop=False):
+    # Detach every monthly partition that ends on or before `before`. Each is
+    # renamed donations_archive_YYYY_MM, optionally written to
+    # export_dir/<name>.csv, and dropped when drop is set. Returns the
+    # archived (name, row count) pairs.
+    archived = []
+    cursor = connection.cursor()
+    try:
+        for name, lower, upper in list_partitions(cursor):
+            if upper > before:
+                break
+            archive = sql.Identifier(ARCHIVE_PREFIX + name[len("donations_"):])
+            cursor.execute(sql.SQL("ALTER TABLE Donations DETACH PARTITION {};").format(sql.Identifier(name)))
+            cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(sql.Identifier(name), archive))
+            cursor.execute(sql.SQL(_ARCHIVED_TOTALS).format(archive=archive))
+            cursor.execute(sql.SQL(_ARCHIVED_ENGAGEMENT).format(archive=archive))
+            # DETACH fires no triggers, so announce the change to the report
+            # caches and have live dashboards reload their totals
+            cursor.execute("SELECT pg_notify(%s, 'donations');", (NOTIFY_CHANNEL,))
+            cursor.execute("""SELECT pg_notify(%s, '{"table": "donations", "resync": true}');""", (LIVE_CHANNEL,))
+            cursor.execute(sql.SQL("SELECT COUNT(*) FROM {};").format(archive))
+            rows = cursor.fetchone()[0]
+            if export_dir:
+                path = os.path.join(export_dir, f"{archive.string}.csv")
+                with open(path, "w", newline="", encoding="utf-8") as out:
+                    cursor.copy_expert(sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER true)").format(
+                        archive).as_string(cursor), out, size=65536)
+            if drop:
+                cursor.execute(sql.SQL("DROP TABLE {};").format(archive))
+            # One partition per transaction keeps the ACCESS EXCLUSIVE lock
+            # that DETACH takes on Donations short
+            connection.commit()
+            archived.append((archive.string, rows))
+        return archived
+    except (psycopg2.Error, OSError):
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the monthly Donations partitions.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    ensure = subparsers.add_parser("ensure", help="create the partitions for the coming months")
+    ensure.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    archive = subparsers.add_parser("archive", help="detach partitions older than a retention window")
+    archive.add_argument("--keep-months", type=int, required=True, help="full months to keep attached")
+    archive.add_argument("--export-dir", help="write each archived partition to <dir>/<name>.csv")
+    archive.add_argument("--drop", action="store_true", help="drop archived partitions after export")
+    subparsers.add_parser("list", help="show the attached partitions")
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    args = parser.parse_args()
+
+    try:
+        connection = psycopg2.connect(args.dsn)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return
+    try:
+        if args.action == "ensure":
+            created = ensure_partitions(connection, args.months_ahead)
+            print(f"Created {len(created)} partitions: {', '.join(created)}" if created else "Partitions are up to date.")
+        elif args.action == "archive":
+            before = add_months(month_start(datetime.date.today()), -args.keep_months)
+            for name, rows in archive_partitions(connection, before, args.export_dir, args.drop):
+                print(f"Archived {name} ({rows} rows){' and dropped it' if args.drop else ''}")
+        else:
+            cursor = connection.cursor()
+            try:
+                for name, lower, upper in list_partitions(cursor):
+                    print(f"{name}: {lower} to {upper}")
+            finally:
+                cursor.close()
+    except (psycopg2.Error, OSError) as e:
+        print(f"Partition maintenance failed: {e}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
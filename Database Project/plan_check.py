@@ -0,0 +1,253 @@
+import argparse
+import os
+import sys
+
+import psycopg2
+from psycopg2 import OperationalError
+
+from dashboard import MEMBER_DASHBOARD_QUERY
+from pagination import LISTINGS, fetch_page, page_query
+from queries import REPORT_QUERIES
+from search import SEARCHES, normalize, search_query
+
+# Tables that grow with the donor base; a sequential scan on one of these is a
+# missing index unless the query is expected to read the whole table
+LARGE_TABLES = {"donations", "scheduled", "membershiphistory", "entity", "volunteer", "member", "employee"}
+
+# Reports that aggregate or list an entire table by design; the tables they
+# are allowed to read in full
+FULL_SCAN_ALLOWED = {
+    "Query1": {"entity", "donations"},
+    "Query2": {"donations"},
+    "Query4": {"member", "employee"},
+    "Query7": {"entity", "volunteer", "member", "employee"},
+}
+
+# Hot-path lookups issued by the service, checked alongside the reports.
+# Parameters are filled from a sample row so the planner sees realistic values.
+LOOKUP_QUERIES = {
+    "member_dashboard": (MEMBER_DASHBOARD_QUERY, "SELECT entity_email AS email FROM Donations LIMIT 1"),
+    "campaign_status": (
+        "SELECT * FROM Campaigns WHERE issue = %(issue)s AND location = %(location)s AND start_date = %(start_date)s;",
+        "SELECT issue, location, start_date FROM Campaigns LIMIT 1",
+    ),
+    "campaign_donations": (
+        "SELECT MAX(amount) FROM Donations WHERE campaign_issue = %(issue)s AND campaign_location = %(location)s AND campaign_start_date = %(start_date)s;",
+        "SELECT campaign_issue AS issue, campaign_location AS location, campaign_start_date AS start_date FROM Donations LIMIT 1",
+    ),
+    "campaign_schedule": (
+        "SELECT entity_email FROM Scheduled WHERE campaign_issue = %(issue)s AND campaign_location = %(location)s AND campaign_start_date = %(start_date)s;",
+        "SELECT campaign_issue AS issue, campaign_location AS location, campaign_start_date AS start_date FROM Scheduled LIMIT 1",
+    ),
+    "member_history": (
+        "SELECT * FROM MembershipHistory WHERE entity_email = %(email)s AND (involvement_end_date IS NULL OR involvement_end_date > CURRENT_DATE);",
+        "SELECT entity_email AS email FROM MembershipHistory LIMIT 1",
+    ),
+}
+
+# Sample parameters for the paginated listings, by the parameters they take
+LISTING_SAMPLES = {
+    ("email",): "SELECT entity_email AS email FROM Donations LIMIT 1",
+    ("issue", "location", "start_date"):
+        "SELECT campaign_issue AS issue, campaign_location AS location, campaign_start_date AS start_date "
+        "FROM Donations LIMIT 1",
+}
+LISTING_PAGE_SIZE = 20
+
+# Sample search text, the start of an existing name. Searches back an
+# autocomplete, so they must not scan even the small Campaigns table.
+SEARCH_SAMPLES = {
+    "campaigns": "SELECT left(issue, 4) AS text FROM Campaigns LIMIT 1",
+    "entities": "SELECT left(COALESCE(name, email), 4) AS text FROM Entity LIMIT 1",
+}
+
+# Below this many donations the planner rightly prefers sequential scans, so
+# the check says nothing useful about production plans
+MIN_DONATIONS = 100_000
+
+
+def partition_parents(connection):
+    # {partition: parent table} for every partition in the database, so a scan
+    # of any Donations partition, the default one included, counts as one of
+    # donations
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT lower(c.relname), lower(p.relname)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relkind = 'p';
+        """)
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+        connection.rollback()
+
+
+def _seq_scans(plan, parents):
+    # Walk an EXPLAIN (FORMAT JSON) plan tree and yield scanned relation names,
+    # reporting a scan of a partition as one of its parent table
+    if plan.get("Node Type") == "Seq Scan":
+        name = plan.get("Relation Name", "").lower()
+        yield parents.get(name, name)
+    for child in plan.get("Plans", []):
+        yield from _seq_scans(child, parents)
+
+
+def _sorts(plan):
+    # Yield the estimated row count of every Sort node in a plan tree
+    if plan.get("Node Type") == "Sort":
+        yield plan.get("Plan Rows", 0)
+    for child in plan.get("Plans", []):
+        yield from _sorts(child)
+
+
+def explain(connection, query, params=None):
+    # The root node of the query's EXPLAIN (FORMAT JSON) plan
+    cursor = connection.cursor()
+    try:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + query.rstrip().rstrip(";"), params)
+        return cursor.fetchone()[0][0]["Plan"]
+    finally:
+        cursor.close()
+        connection.rollback()
+
+
+def explain_seq_scans(connection, query, params=None, parents=None):
+    if parents is None:
+        parents = partition_parents(connection)
+    return set(_seq_scans(explain(connection, query, params), parents))
+
+
+def check_listing(connection, name, params, parents):
+    # Problems with the plans of page 1 and page 2 of a paginated listing.
+    # Both must read the large tables through an index in listing order: no
+    # sequential scan and no sort of more than a few pages of rows.
+    problems = []
+    query, query_params = page_query(name, params, limit=LISTING_PAGE_SIZE)
+    pages = [("page 1", query, query_params)]
+    _, token = fetch_page(connection, name, params, limit=LISTING_PAGE_SIZE)
+    connection.rollback()
+    if token:
+        query, query_params = page_query(name, params, token, LISTING_PAGE_SIZE)
+        pages.append(("page 2", query, query_params))
+    for page, query, query_params in pages:
+        plan = explain(connection, query, query_params)
+        scanned = set(_seq_scans(plan, parents)) & LARGE_TABLES
+        if scanned:
+            problems.append(f"{page} sequentially scans {', '.join(sorted(scanned))}")
+        largest = max(_sorts(plan), default=0)
+        if largest > 4 * (LISTING_PAGE_SIZE + 1):
+            problems.append(f"{page} sorts about {largest} rows instead of reading them in index order")
+    return problems
+
+
+def _sample_params(connection, sample_query):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sample_query)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column.name for column in cursor.description], row))
+    finally:
+        cursor.close()
+        connection.rollback()
+
+
+def check_plans(connection):
+    # Returns (name, problems) for every query that sequentially scans a large
+    # table it is not allowed to, or paginated listing that does not read in
+    # index order; an empty list means all plans pass
+    failures = []
+    parents = partition_parents(connection)
+    for name, query in REPORT_QUERIES.items():
+        offending = explain_seq_scans(connection, query, parents=parents) & LARGE_TABLES - FULL_SCAN_ALLOWED.get(name, set())
+        if offending:
+            failures.append((name, [f"sequential scan on {', '.join(sorted(offending))}"]))
+    for name, (query, sample_query) in LOOKUP_QUERIES.items():
+        params = _sample_params(connection, sample_query)
+        if params is None:
+            continue
+        offending = explain_seq_scans(connection, query, params, parents) & LARGE_TABLES
+        if offending:
+            failures.append((name, [f"sequential scan on {', '.join(sorted(offending))}"]))
+    for name, spec in LISTINGS.items():
+        params = {}
+        if spec["params"]:
+            params = _sample_params(connection, LISTING_SAMPLES[tuple(spec["params"])])
+            if params is None:
+                continue
+        problems = check_listing(connection, name, params, parents)
+        if problems:
+            failures.append((f"{name} (paginated)", problems))
+    for kind in SEARCHES:
+        params = _sample_params(connection, SEARCH_SAMPLES[kind])
+        if params is None:
+            continue
+        offending = explain_seq_scans(connection, *search_query(kind, normalize(params["text"])), parents) & (
+            LARGE_TABLES | {"campaigns"})
+        if offending:
+            failures.append((f"{kind} search", [f"sequential scan on {', '.join(sorted(offending))}"]))
+    return failures
+
+
+def donation_count(connection):
+    cursor = connection.cursor()
+    try:
+        # A partitioned parent holds no rows itself, so add up its partitions
+        cursor.execute("""
+            SELECT SUM(GREATEST(c.reltuples, 0))::bigint
+            FROM pg_class c
+            WHERE c.oid = 'donations'::regclass
+               OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'donations'::regclass);
+        """)
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    finally:
+        cursor.close()
+        connection.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when a canned query falls back to a sequential scan.")
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    parser.add_argument("--analyze", action="store_true", help="VACUUM ANALYZE the large tables first")
+    parser.add_argument("--force", action="store_true", help="run even on a small dataset")
+    args = parser.parse_args()
+
+    try:
+        connection = psycopg2.connect(args.dsn)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return 2
+    try:
+        if args.analyze:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            for table in sorted(LARGE_TABLES):
+                cursor.execute(f"VACUUM ANALYZE {table};")
+            cursor.close()
+            connection.autocommit = False
+        rows = donation_count(connection)
+        if rows < MIN_DONATIONS and not args.force:
+            print(f"Donations has about {rows} rows; load at least {MIN_DONATIONS} synthetic rows before checking plans.")
+            return 2
+        failures = check_plans(connection)
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return 2
+    finally:
+        connection.close()
+
+    for name, problems in failures:
+        print(f"{name}: {'; '.join(problems)}")
+    if failures:
+        return 1
+    print("All canned queries use indexes on the large tables.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
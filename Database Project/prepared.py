@@ -0,0 +1,22 @@
+class StatementRegistry:
+    # Named SQL statements with psycopg's %s placeholders. GngService runs
+    # them with prepare=True, so psycopg prepares each one on a pooled
+    # connection the first time it runs there and the server parses and plans
+    # it only once per session. Prepared state belongs to the connection: one
+    # the pool replaces after a reconnect starts empty and re-prepares lazily.
+
+    def __init__(self):
+        self._queries = {}
+
+    def register(self, name, query):
+        self._queries[name] = query
+        return name
+
+    def __contains__(self, name):
+        return name in self._queries
+
+    def names(self):
+        return list(self._queries)
+
+    def query(self, name):
+        return self._queries[name]
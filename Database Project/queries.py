@@ -0,0 +1,165 @@
+from campaign_totals import CAMPAIGNS_OVER_1000_QUERY, DONATION_COUNTS_QUERY, HIGHEST_DONATION_QUERY
+from keys import CAMPAIGN_COLUMNS
+from partitions import donation_date_range
+from prepared import StatementRegistry
+
+# The canned reports behind menu options 1-10, named after the matching views
+# in gng-construct.sql. Menu option N runs REPORT_QUERIES[f"Query{N}"].
+REPORT_QUERIES = {
+    # List all entities who have made a donation
+    "Query1": "select e.email, e.name from Entity e where exists (select d.entity_email from donations d where e.email = d.entity_email);",
+    # List total donations from each entity
+    "Query2": "select d.entity_email, SUM(d.amount) as total_donations from donations d group by d.entity_email;",
+    # List campaigns with donations exceeding 1000$
+    "Query3": CAMPAIGNS_OVER_1000_QUERY,
+    # List entities who are both a member and employee
+    "Query4": "select entity_email from Member intersect select entity_email from Employee;",
+    # List campaigns with no donations
+    "Query5": f"select {CAMPAIGN_COLUMNS} from Campaigns c where not exists (select 1 from Donations d where d.campaign_id = c.campaign_id);",
+    # List entities scheduled for campaigns after June 1, 2023
+    "Query6": "select distinct s.entity_email from Scheduled s where s.campaign_start_date >= '2023-06-01';",
+    # List all entities with their roles
+    "Query7": "select e.email, e.name, 'Volunteer' as role from entity e join volunteer v on e.email = v.entity_email union select e.email, e.name, 'Member' as role from entity e join member m on e.email = m.entity_email union select e.email, e.name, 'Employee' as role from entity e join employee p on e.email = p.entity_email;",
+    # List the highest donation for each campaign
+    "Query8": HIGHEST_DONATION_QUERY,
+    # List campaigns with more than one donation
+    "Query9": DONATION_COUNTS_QUERY,
+    # List total days for each campaign
+    "Query10": "select issue, SUM(duration_days) as total_days from campaigns group by issue;",
+}
+
+# Reports that can be limited to a donation_date range, with {range} standing
+# for the condition built by partitions.donation_date_range
+DATE_RANGE_REPORTS = {
+    "Query2": "select d.entity_email, SUM(d.amount) as total_donations from donations d where {range} group by d.entity_email;",
+}
+
+
+def report_query(name, since=None, until=None):
+    # The SQL and parameters of a canned report, limited to donations made
+    # from since (inclusive) to until (exclusive) when either is given
+    if not since and not until:
+        return REPORT_QUERIES[name], None
+    if name not in DATE_RANGE_REPORTS:
+        raise ValueError(f"{name} does not take a date range")
+    condition, params = donation_date_range("d", since, until)
+    return DATE_RANGE_REPORTS[name].format(range=condition), params
+
+
+# Reports whose output is at most one row per campaign; these run as prepared
+# statements. The entity-sized reports stream through a server-side cursor
+# instead.
+BOUNDED_REPORTS = ["Query3", "Query5", "Query8", "Query9", "Query10"]
+
+# Fixed statements issued by the service, prepared once per pooled connection
+STATEMENTS = StatementRegistry()
+ENTITY_EXISTS = STATEMENTS.register("entity_exists", "SELECT * FROM Entity WHERE email = %s;")
+CAMPAIGN_EXISTS = STATEMENTS.register(
+    "campaign_exists", f"SELECT {CAMPAIGN_COLUMNS} FROM Campaigns WHERE issue = %s AND location = %s AND start_date = %s;")
+for _name in BOUNDED_REPORTS:
+    STATEMENTS.register(_name.lower(), REPORT_QUERIES[_name])
+UPDATE_CAMPAIGN_ANNOTATION = STATEMENTS.register(
+    "update_campaign_annotation",
+    "UPDATE Campaigns SET annotations = %s WHERE issue = %s AND location = %s AND start_date = %s;")
+INSERT_MEMBERSHIP_HISTORY = STATEMENTS.register(
+    "insert_membership_history",
+    "INSERT INTO MembershipHistory (entity_email, campaign_issue, campaign_location, campaign_start_date, involvement_start_date, involvement_end_date, annotations) VALUES (%s, %s, %s, %s, %s, %s, %s);")
+UPDATE_MEMBERSHIP_ANNOTATION = STATEMENTS.register(
+    "update_membership_annotation",
+    "UPDATE MembershipHistory SET annotations = %s WHERE entity_email = %s AND campaign_issue = %s AND campaign_location = %s AND campaign_start_date = %s;")
+
+# Write commands that check, insert and report in a single statement. Each
+# returns one row holding one of the outcome constants in outcomes.py, so a
+# write is one round trip and there is no gap between the check and the
+# insert for a concurrent client to slip into.
+REGISTER_DONOR = STATEMENTS.register("register_donor", """
+    WITH inserted AS (
+        INSERT INTO Entity (email, name) VALUES (%s, %s)
+        ON CONFLICT (email) DO NOTHING
+        RETURNING email
+    )
+    SELECT CASE WHEN EXISTS (SELECT 1 FROM inserted) THEN 'created' ELSE 'exists' END;
+""")
+# Parameters: email, issue, location, start_date, donation_date, amount
+MAKE_DONATION = STATEMENTS.register("make_donation", """
+    WITH donor AS (
+        SELECT email, entity_id FROM Entity WHERE email = %s
+    ),
+    campaign AS (
+        SELECT issue, location, start_date, campaign_id FROM Campaigns WHERE issue = %s AND location = %s AND start_date = %s
+    ),
+    inserted AS (
+        INSERT INTO Donations (entity_email, campaign_issue, campaign_location, campaign_start_date, donation_date, amount,
+                               entity_id, campaign_id)
+        SELECT d.email, c.issue, c.location, c.start_date, %s::date, %s::numeric, d.entity_id, c.campaign_id
+        FROM donor d CROSS JOIN campaign c
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    SELECT CASE WHEN NOT EXISTS (SELECT 1 FROM donor) THEN 'unknown_donor'
+                WHEN NOT EXISTS (SELECT 1 FROM campaign) THEN 'unknown_campaign'
+                WHEN EXISTS (SELECT 1 FROM inserted) THEN 'created'
+                ELSE 'exists' END;
+""")
+# Parameters: issue, location, start_date, email, name, tier, scheduled_date.
+# The foreign keys of Volunteer and Scheduled are checked at the end of the
+# statement, so they see the Entity row inserted by the earlier CTE. The key
+# resolution trigger does not, so the new entity_id is passed on explicitly.
+ADD_VOLUNTEER = STATEMENTS.register("add_volunteer", """
+    WITH campaign AS (
+        SELECT issue, location, start_date, campaign_id FROM Campaigns WHERE issue = %s AND location = %s AND start_date = %s
+    ),
+    entity AS (
+        INSERT INTO Entity (email, name)
+        SELECT %s::varchar, %s::varchar WHERE EXISTS (SELECT 1 FROM campaign)
+        ON CONFLICT (email) DO NOTHING
+        RETURNING email, entity_id
+    ),
+    volunteer AS (
+        INSERT INTO Volunteer (entity_email, tier)
+        SELECT email, %s::int FROM entity
+        RETURNING entity_email
+    ),
+    scheduled AS (
+        INSERT INTO Scheduled (entity_email, campaign_issue, campaign_location, campaign_start_date, scheduled_date,
+                               entity_id, campaign_id)
+        SELECT v.entity_email, c.issue, c.location, c.start_date, %s::date, e.entity_id, c.campaign_id
+        FROM volunteer v JOIN entity e ON e.email = v.entity_email CROSS JOIN campaign c
+        RETURNING 1
+    )
+    SELECT CASE WHEN NOT EXISTS (SELECT 1 FROM campaign) THEN 'unknown_campaign'
+                WHEN EXISTS (SELECT 1 FROM scheduled) THEN 'created'
+                ELSE 'exists' END;
+""")
+# Parameters: issue, location, start_date, duration_days, phase, budget,
+# website_push_date
+CREATE_CAMPAIGN = STATEMENTS.register("create_campaign", """
+    WITH inserted AS (
+        INSERT INTO Campaigns (issue, location, start_date, duration_days, phase, budget, website_push_date)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (issue, location, start_date) DO NOTHING
+        RETURNING 1
+    )
+    SELECT CASE WHEN EXISTS (SELECT 1 FROM inserted) THEN 'created' ELSE 'exists' END;
+""")
+# Parameters: email, issue, location, start_date, scheduled_date
+SCHEDULE_VOLUNTEER = STATEMENTS.register("schedule_volunteer", """
+    WITH volunteer AS (
+        SELECT email, entity_id FROM Entity WHERE email = %s
+    ),
+    campaign AS (
+        SELECT issue, location, start_date, campaign_id FROM Campaigns WHERE issue = %s AND location = %s AND start_date = %s
+    ),
+    inserted AS (
+        INSERT INTO Scheduled (entity_email, campaign_issue, campaign_location, campaign_start_date, scheduled_date,
+                               entity_id, campaign_id)
+        SELECT v.email, c.issue, c.location, c.start_date, %s::date, v.entity_id, c.campaign_id
+        FROM volunteer v CROSS JOIN campaign c
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    SELECT CASE WHEN NOT EXISTS (SELECT 1 FROM volunteer) THEN 'unknown_donor'
+                WHEN NOT EXISTS (SELECT 1 FROM campaign) THEN 'unknown_campaign'
+                WHEN EXISTS (SELECT 1 FROM inserted) THEN 'created'
+                ELSE 'exists' END;
+""")
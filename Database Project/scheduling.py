@@ -0,0 +1,191 @@
+import argparse
+import csv
+import itertools
+import os
+import time
+from collections import Counter
+
+import psycopg2
+from psycopg2 import OperationalError, errors
+from psycopg2.extras import execute_values
+
+from cache import invalidate_after
+from instrumentation import instrumented
+from outcomes import CREATED, EXISTS, INVALID, UNKNOWN_CAMPAIGN, UNKNOWN_DONOR, unknown_reference
+
+ROSTER_COLUMNS = ["entity_email", "campaign_issue", "campaign_location", "campaign_start_date", "scheduled_date"]
+
+DEFAULT_BATCH_SIZE = 1000
+
+# One multi-row INSERT per batch. Each roster row carries its position n, so
+# the rows that were actually inserted can be reported back; a repeat of an
+# existing (or earlier in the batch) assignment is skipped by ON CONFLICT.
+SCHEDULE_BATCH_QUERY = """
+    WITH roster (n, entity_email, campaign_issue, campaign_location, campaign_start_date, scheduled_date) AS (
+        VALUES %s
+    ),
+    inserted AS (
+        INSERT INTO Scheduled (entity_email, campaign_issue, campaign_location, campaign_start_date, scheduled_date)
+        SELECT entity_email, campaign_issue, campaign_location, campaign_start_date, scheduled_date
+        FROM roster
+        ON CONFLICT DO NOTHING
+        RETURNING entity_email, campaign_issue, campaign_location, campaign_start_date, scheduled_date
+    )
+    SELECT MIN(r.n)
+    FROM inserted i
+    JOIN roster r USING (entity_email, campaign_issue, campaign_location, campaign_start_date, scheduled_date)
+    GROUP BY entity_email, campaign_issue, campaign_location, campaign_start_date, scheduled_date
+"""
+SCHEDULE_BATCH_TEMPLATE = "(%s, %s::varchar, %s::varchar, %s::varchar, %s::date, %s::date)"
+
+
+def roster_rows(entity_emails, campaign, dates):
+    # Every volunteer on every date for one (issue, location, start_date) campaign
+    issue, location, start_date = campaign
+    for email, scheduled_date in itertools.product(entity_emails, dates):
+        yield email, issue, location, start_date, scheduled_date
+
+
+def _insert_batch(cursor, rows, outcomes, stats):
+    # Insert rows (each prefixed by its roster position) under a savepoint. A
+    # batch that violates a foreign key or holds a malformed value is rolled
+    # back to the savepoint and split in half until the bad rows stand alone,
+    # so k bad rows cost O(k log n) extra statements instead of a restart.
+    cursor.execute("SAVEPOINT gng_schedule_batch;")
+    stats["statements"] += 1
+    try:
+        created = execute_values(cursor, SCHEDULE_BATCH_QUERY, rows, template=SCHEDULE_BATCH_TEMPLATE,
+                                 page_size=len(rows), fetch=True)
+    except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+        # ROLLBACK TO keeps the savepoint; release it so each split does not
+        # leave another open subtransaction behind until commit
+        cursor.execute("ROLLBACK TO SAVEPOINT gng_schedule_batch;")
+        cursor.execute("RELEASE SAVEPOINT gng_schedule_batch;")
+        stats["statements"] += 3
+        stats["retried"] += len(rows)
+        if len(rows) == 1:
+            outcomes[rows[0][0]] = unknown_reference(e) if isinstance(e, errors.ForeignKeyViolation) else INVALID
+            return
+        middle = len(rows) // 2
+        _insert_batch(cursor, rows[:middle], outcomes, stats)
+        _insert_batch(cursor, rows[middle:], outcomes, stats)
+        return
+    cursor.execute("RELEASE SAVEPOINT gng_schedule_batch;")
+    stats["statements"] += 2
+    for (n,) in created:
+        outcomes[n] = CREATED
+    for row in rows:
+        outcomes.setdefault(row[0], EXISTS)
+
+
+@instrumented()
+def schedule_volunteers(connection, roster, batch_size=DEFAULT_BATCH_SIZE, commit=True):
+    # Schedule a whole roster of (email, issue, location, start_date,
+    # scheduled_date) rows in one transaction, batch_size rows per INSERT.
+    # Returns a summary with one outcome per roster row, in roster order:
+    # created, exists (already scheduled), unknown_donor, unknown_campaign or
+    # invalid (malformed date). With commit=False the caller owns the
+    # transaction.
+    started = time.perf_counter()
+    outcomes = {}
+    stats = Counter(statements=0, retried=0, batches=0)
+    count = 0
+
+    cursor = connection.cursor()
+    try:
+        batch = []
+        for row in roster:
+            if len(row) != len(ROSTER_COLUMNS):
+                raise ValueError(f"Roster row {count + 1} has {len(row)} fields, expected {len(ROSTER_COLUMNS)}")
+            batch.append((count, *row))
+            count += 1
+            if len(batch) == batch_size:
+                _insert_batch(cursor, batch, outcomes, stats)
+                stats["batches"] += 1
+                batch = []
+        if batch:
+            _insert_batch(cursor, batch, outcomes, stats)
+            stats["batches"] += 1
+        if commit:
+            connection.commit()
+    except Exception:
+        if commit:
+            connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    ordered = [outcomes[n] for n in range(count)]
+    totals = Counter(ordered)
+    if commit and totals[CREATED]:
+        invalidate_after("schedule_volunteer")
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": count,
+        "created": totals[CREATED],
+        "exists": totals[EXISTS],
+        "unknown_donor": totals[UNKNOWN_DONOR],
+        "unknown_campaign": totals[UNKNOWN_CAMPAIGN],
+        "invalid": totals[INVALID],
+        "outcomes": ordered,
+        "batches": stats["batches"],
+        "statements": stats["statements"],
+        "retried_rows": stats["retried"],
+        "seconds": elapsed,
+        "rows_per_second": count / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def _read_roster(path):
+    with open(path, newline="", encoding="utf-8") as handle:
+        reader = csv.reader(handle)
+        header = [name.strip().lower() for name in next(reader, [])]
+        if header != ROSTER_COLUMNS:
+            raise ValueError(f"Roster header must be {','.join(ROSTER_COLUMNS)}")
+        return [tuple(row) for row in reader if row]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedule a roster of volunteers in batched inserts.")
+    parser.add_argument("path", help=f"CSV roster with header {','.join(ROSTER_COLUMNS)}")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--outcomes", help="write each roster row with its outcome to this CSV file")
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    args = parser.parse_args()
+
+    try:
+        roster = _read_roster(args.path)
+    except (ValueError, OSError) as e:
+        print(f"Cannot read roster: {e}")
+        return
+    try:
+        connection = psycopg2.connect(args.dsn)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return
+    try:
+        result = schedule_volunteers(connection, roster, args.batch_size)
+    except ValueError as e:
+        print(f"Invalid roster: {e}")
+        return
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return
+    finally:
+        connection.close()
+
+    print(f"{result['rows']} roster rows: {result['created']} scheduled, {result['exists']} already scheduled, "
+          f"{result['unknown_donor']} unknown volunteers, {result['unknown_campaign']} unknown campaigns, "
+          f"{result['invalid']} invalid in {result['batches']} batches, {result['seconds']:.2f}s "
+          f"({result['rows_per_second']:.0f} rows/s)")
+    if args.outcomes:
+        with open(args.outcomes, "w", newline="", encoding="utf-8") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(ROSTER_COLUMNS + ["outcome"])
+            for row, outcome in zip(roster, result["outcomes"]):
+                writer.writerow(list(row) + [outcome])
+        print(f"Per-row outcomes written to {args.outcomes}")
+
+
+if __name__ == "__main__":
+    main()
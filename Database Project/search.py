@@ -0,0 +1,143 @@
+import argparse
+import os
+import time
+
+import psycopg2
+from psycopg2 import OperationalError
+
+from cache import SEARCH_CACHE
+
+# Prefix and fuzzy lookup of campaigns (by issue and location) and entities
+# (by name and email), so operators can pick a record instead of retyping its
+# exact key. Each kind searches one lowercased "haystack" expression through
+# a pg_trgm GiST index on that same expression (migration 0010), so a changed
+# haystack needs a new migration for its index. The index returns rows in
+# order of word-similarity distance (a KNN scan), so a search reads a bounded
+# window of the nearest rows however large the table is.
+SEARCHES = {
+    "campaigns": {
+        "haystack": "lower(issue || ' ' || location)",
+        "columns": "issue, location, start_date",
+        "table": "Campaigns",
+        "tables": {"campaigns"},
+    },
+    "entities": {
+        "haystack": "lower(email || ' ' || COALESCE(name, ''))",
+        "columns": "email, name",
+        "table": "Entity",
+        "tables": {"entity"},
+    },
+}
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Candidates read from the index per requested result; the ranking below only
+# reorders within this window
+WINDOW_FACTOR = 5
+# Lowest word similarity (0 to 1) a fuzzy match needs to be returned
+MIN_SCORE = 0.3
+
+# The inner query is the KNN scan. The outer one drops weak matches and puts
+# the haystacks where the text starts a word (a prefix match) first, then
+# orders by similarity and the key so equal scores rank stably.
+_SEARCH_QUERY = """
+    SELECT {columns}, round((1 - distance)::numeric, 3) AS score FROM (
+        SELECT {columns}, {haystack} AS haystack, {haystack} <->> %(text)s AS distance
+        FROM {table}
+        ORDER BY {haystack} <->> %(text)s
+        LIMIT %(window)s
+    ) candidates
+    WHERE distance <= %(max_distance)s OR haystack LIKE %(prefix)s OR haystack LIKE %(word_prefix)s
+    ORDER BY (haystack LIKE %(prefix)s OR haystack LIKE %(word_prefix)s) DESC, distance, {columns}
+    LIMIT %(limit)s
+"""
+
+
+def normalize(text):
+    # Searches ignore case and repeated whitespace, so "Clean  Water" and
+    # "clean water" share a cache entry
+    return " ".join(str(text).lower().split())
+
+
+def _like_prefix(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def search_query(kind, text, limit=DEFAULT_LIMIT):
+    # The SQL and parameters of one search; text should be normalized
+    if kind not in SEARCHES:
+        raise ValueError(f"Unknown search {kind}")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"Search limit must be between 1 and {MAX_LIMIT}")
+    spec = SEARCHES[kind]
+    query = _SEARCH_QUERY.format(columns=spec["columns"], haystack=spec["haystack"], table=spec["table"])
+    prefix = _like_prefix(text)
+    return query, {
+        "text": text,
+        "window": limit * WINDOW_FACTOR,
+        "max_distance": 1 - MIN_SCORE,
+        "prefix": prefix,
+        "word_prefix": "% " + prefix,
+        "limit": limit,
+    }
+
+
+def cache_key(kind, text, limit):
+    return ("search", kind, text, limit)
+
+
+def search(connection, kind, text, limit=DEFAULT_LIMIT, cache=SEARCH_CACHE):
+    # Ranked candidates over a psycopg2 connection: (issue, location,
+    # start_date, score) rows for campaigns, (email, name, score) for
+    # entities. Repeated searches, such as the prefixes an autocomplete sends
+    # while someone types, are answered from the in-process cache until a
+    # write to the searched table invalidates them.
+    text = normalize(text)
+    if not text:
+        return []
+    key = cache_key(kind, text, limit)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[1]
+        generation = cache.generation(SEARCHES[kind]["tables"])
+    query, params = search_query(kind, text, limit)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if cache is not None:
+        cache.put(key, SEARCHES[kind]["tables"], None, rows, generation)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search campaigns or entities by prefix or fuzzy match.")
+    parser.add_argument("kind", choices=sorted(SEARCHES))
+    parser.add_argument("text", help="part of an issue or location, or of a name or email")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    args = parser.parse_args()
+
+    try:
+        connection = psycopg2.connect(args.dsn)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return
+    try:
+        started = time.perf_counter()
+        rows = search(connection, args.kind, args.text, args.limit, cache=None)
+        elapsed = time.perf_counter() - started
+        for row in rows:
+            print(row)
+        print(f"{len(rows)} matches in {elapsed * 1000:.1f} ms")
+    except (psycopg2.Error, ValueError) as e:
+        print(f"Search failed: {e}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,568 @@
+import asyncio
+import sys
+import threading
+import time
+
+from psycopg import AsyncConnection, AsyncCursor, AsyncServerCursor, Error, errors
+from psycopg.conninfo import make_conninfo as _make_conninfo
+from psycopg.pq import TransactionStatus
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from cache import REPORT_CACHE, REPORT_TABLES, SEARCH_CACHE, CacheInvalidationListener
+from campaign_totals import accounting_report_query
+from dashboard import MEMBER_DASHBOARD_QUERY, build_dashboard
+from engagement import engagement_query
+from instrumentation import METRICS, explain_statement, instrumented, sql_text
+from outcomes import CREATED, EXISTS, INVALID, NOT_FOUND, UNKNOWN_CAMPAIGN, UPDATED, unknown_reference
+from pagination import DEFAULT_PAGE_SIZE, page_query, split_page
+from queries import (ADD_VOLUNTEER, BOUNDED_REPORTS, CAMPAIGN_EXISTS, CREATE_CAMPAIGN, INSERT_MEMBERSHIP_HISTORY,
+                     MAKE_DONATION, REGISTER_DONOR, SCHEDULE_VOLUNTEER, STATEMENTS, UPDATE_CAMPAIGN_ANNOTATION,
+                     UPDATE_MEMBERSHIP_ANNOTATION, report_query)
+from search import DEFAULT_LIMIT, SEARCHES, cache_key, normalize, search_query
+
+
+async def _explain(connection, query, params):
+    # EXPLAIN in a block that is always rolled back: a savepoint when the
+    # connection is already in a transaction, otherwise its own transaction
+    async with connection.transaction(force_rollback=True):
+        async with AsyncCursor(connection) as cursor:
+            await cursor.execute(explain_statement(query) + sql_text(query, connection).rstrip(";"), params)
+            return "\n".join(row[0] for row in await cursor.fetchall())
+
+
+async def _record(cursor, query, params, seconds, round_trips=1, rows=0, failed=False):
+    if METRICS.statement(query, seconds, round_trips, rows, failed):
+        try:
+            plan = await _explain(cursor.connection, query, params)
+        except Error as e:
+            plan = f"EXPLAIN failed: {e}"
+        METRICS.log_slow_query(query, seconds, plan)
+
+
+class InstrumentedAsyncCursor(AsyncCursor):
+    # The psycopg 3 counterpart of instrumentation.InstrumentedCursor
+
+    async def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            await super().execute(query, params, **kwargs)
+        except Error:
+            await _record(self, query, params, time.perf_counter() - started, failed=True)
+            raise
+        await _record(self, query, params, time.perf_counter() - started,
+                      rows=self.rowcount if self.description else 0)
+        return self
+
+
+class InstrumentedAsyncServerCursor(AsyncServerCursor):
+    # Recorded when fully read: DECLARE plus one FETCH round trip per batch
+
+    async def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        await super().execute(query, params, **kwargs)
+        self._pending = (query, params, time.perf_counter() - started)
+        return self
+
+    async def __aiter__(self):
+        query, params, seconds = getattr(self, "_pending", (None, None, 0.0))
+        self._pending = None
+        round_trips, rows, failed = 1, 0, False
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    batch = await self.fetchmany(self.itersize)
+                except Error:
+                    failed = True
+                    raise
+                finally:
+                    seconds += time.perf_counter() - started
+                    round_trips += 1
+                rows += len(batch)
+                for row in batch:
+                    yield row
+                if len(batch) < self.itersize:
+                    break
+        finally:
+            if query is not None:
+                await _record(self, query, params, seconds, round_trips, rows, failed)
+
+
+class InstrumentedAsyncConnection(AsyncConnection):
+    # Pool connection class: instrumented cursors and counted commits/rollbacks
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = InstrumentedAsyncCursor
+        self.server_cursor_factory = InstrumentedAsyncServerCursor
+
+    async def commit(self):
+        open_transaction = self.info.transaction_status != TransactionStatus.IDLE
+        await super().commit()
+        METRICS.transaction("commit", open_transaction)
+
+    async def rollback(self):
+        open_transaction = self.info.transaction_status != TransactionStatus.IDLE
+        await super().rollback()
+        METRICS.transaction("rollback", open_transaction)
+
+
+# Pool settings. Every connection is checked with an empty query before it
+# is handed out; one that fails is replaced and the checkout tries again with
+# backoff until its timeout, then raises PoolTimeout. Connections above
+# min_size are closed after MAX_IDLE seconds unused, none is reused after
+# MAX_LIFETIME seconds, and a pool that cannot reconnect for
+# RECONNECT_TIMEOUT seconds stops trying. This is the menu's only pool; it
+# replaced the psycopg2 ThreadedConnectionPool of the old pool.py.
+MAX_IDLE = 300.0
+MAX_LIFETIME = 3600.0
+RECONNECT_TIMEOUT = 60.0
+
+
+def _connection_pool(conninfo, min_size, max_size):
+    return AsyncConnectionPool(conninfo, connection_class=InstrumentedAsyncConnection, min_size=min_size,
+                               max_size=max_size, open=False, check=AsyncConnectionPool.check_connection,
+                               max_idle=MAX_IDLE, max_lifetime=MAX_LIFETIME, reconnect_timeout=RECONNECT_TIMEOUT)
+
+
+def _lsn(text):
+    # A pg_lsn such as '16/B374D848' as an integer that orders like the LSN
+    high, low = text.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+# How far behind the primary a replica is: its replay position, and the
+# seconds since the last replayed commit, or 0 when it has replayed all it
+# received (so an idle primary does not look like lag). A server that is not
+# in recovery reports its own position and no lag.
+_REPLICA_STATUS_QUERY = """
+    SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END::text,
+           CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END::float8
+"""
+
+
+class _Replica:
+
+    def __init__(self, conninfo, min_size, max_size):
+        self.pool = _connection_pool(conninfo, min_size, max_size)
+        self.lock = asyncio.Lock()
+        self.replay_lsn = 0
+        self.lag = None
+        self.checked_at = 0.0
+        self.down_until = 0.0
+
+
+class ReplicaRouter:
+    # Chooses the pool for each read: the replicas in turn, skipping one that
+    # is down, lags more than max_lag seconds or, with read_your_writes, has
+    # not yet replayed this service's last write; the primary when none
+    # qualifies. Replica status is probed at most every check_interval seconds.
+
+    def __init__(self, primary, replica_conninfos=(), max_lag=5.0, read_your_writes=False, check_interval=1.0,
+                 retry_interval=10.0, connect_timeout=2.0, min_size=1, max_size=10):
+        self.primary = primary
+        self.replicas = [_Replica(conninfo, min_size, max_size) for conninfo in replica_conninfos]
+        self.max_lag = max_lag
+        self.read_your_writes = read_your_writes
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.connect_timeout = connect_timeout
+        self.last_write_lsn = 0
+        self.routed = {"primary": 0, "replica": 0, "fallback": 0}
+        self._next = 0
+
+    async def open(self):
+        # Replicas connect in the background: one that is down must not stop
+        # the service from starting
+        for replica in self.replicas:
+            await replica.pool.open(wait=False)
+
+    async def close(self):
+        for replica in self.replicas:
+            await replica.pool.close()
+
+    async def _probe(self, replica):
+        try:
+            async with replica.pool.connection(timeout=self.connect_timeout) as connection:
+                async with connection.cursor() as cursor:
+                    await cursor.execute(_REPLICA_STATUS_QUERY)
+                    lsn, lag = await cursor.fetchone()
+            replica.replay_lsn, replica.lag = _lsn(lsn), lag
+        except (Error, PoolTimeout):
+            replica.down_until = time.monotonic() + self.retry_interval
+            replica.lag = None
+        replica.checked_at = time.monotonic()
+
+    async def _caught_up(self, replica, refresh=False):
+        # Whether the replica can serve a read now, and whether it has
+        # replayed the last write made through this service
+        async with replica.lock:
+            now = time.monotonic()
+            if now < replica.down_until:
+                return False, False
+            if refresh or now - replica.checked_at > self.check_interval:
+                await self._probe(replica)
+        if replica.lag is None or replica.lag > self.max_lag:
+            return False, False
+        return True, replica.replay_lsn >= self.last_write_lsn
+
+    async def reader(self):
+        # (pool, fresh): fresh is False when the pool may not show this
+        # service's own last write yet, so the result must not be cached
+        if not self.replicas:
+            self.routed["primary"] += 1
+            return self.primary, True
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            usable, fresh = await self._caught_up(replica)
+            if usable and not fresh and self.read_your_writes:
+                # The cached position may be stale; look once more
+                usable, fresh = await self._caught_up(replica, refresh=True)
+            if usable and (fresh or not self.read_your_writes):
+                self.routed["replica"] += 1
+                return replica.pool, fresh
+        self.routed["fallback"] += 1
+        return self.primary, True
+
+    async def wrote(self, connection):
+        # Remember the primary's WAL position after a committed write. It is
+        # read on the connection that committed, so a write never borrows a
+        # second one from the pool.
+        if not self.replicas:
+            return
+        async with connection.cursor() as cursor:
+            await cursor.execute("SELECT pg_current_wal_lsn()::text;")
+            (lsn,) = await cursor.fetchone()
+        self.last_write_lsn = max(self.last_write_lsn, _lsn(lsn))
+
+    def stats(self):
+        return {
+            **self.routed,
+            "replicas": [{"lag": replica.lag, "down": time.monotonic() < replica.down_until}
+                         for replica in self.replicas],
+        }
+
+
+class GngService:
+    # The gng operations as coroutines over an async connection pool. Each
+    # call borrows its own connection, so independent operations issued with
+    # asyncio.gather run concurrently. Writes return one of the outcome
+    # constants above and always run on the primary; reads return rows and
+    # are routed to the replicas, if any. Canned reports and searches are
+    # served from the result caches, which successful writes invalidate; with
+    # listen, a CacheInvalidationListener also drops what other processes'
+    # writes made stale.
+
+    def __init__(self, conninfo, min_size=1, max_size=10, cache=REPORT_CACHE, replicas=(), max_replica_lag=5.0,
+                 read_your_writes=False, search_cache=SEARCH_CACHE, listen=True):
+        # The primary's connection string, also used by listeners such as live.py
+        self.conninfo = conninfo
+        self.pool = _connection_pool(conninfo, min_size, max_size)
+        self.router = ReplicaRouter(self.pool, replicas, max_lag=max_replica_lag, read_your_writes=read_your_writes,
+                                    min_size=min_size, max_size=max_size)
+        self.cache = cache
+        self.search_cache = search_cache
+        self.listen = listen
+        self.listener = None
+
+    async def open(self, timeout=30.0):
+        # Wait for min_size connections so a bad DSN fails here, not on first use
+        await self.pool.open(wait=True, timeout=timeout)
+        await self.router.open()
+        caches = [cache for cache in (self.cache, self.search_cache) if cache is not None]
+        if self.listen and caches:
+            # Notifications come from the primary only, like the writes
+            self.listener = CacheInvalidationListener(self.conninfo, caches).start()
+        return self
+
+    async def close(self):
+        if self.listener is not None:
+            await asyncio.to_thread(self.listener.stop)
+            self.listener = None
+        await self.router.close()
+        await self.pool.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _fetch(self, query, params=None, pool=None, prepare=None):
+        # prepare=True for the registered statements (queries.STATEMENTS)
+        async with (pool or self.pool).connection() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(query, params, prepare=prepare)
+                columns = tuple(column.name for column in cursor.description or ())
+                return columns, await cursor.fetchall()
+
+    async def _read(self, query, params=None, prepare=None):
+        # A read on the pool chosen by the router
+        pool, _ = await self.router.reader()
+        return await self._fetch(query, params, pool, prepare)
+
+    async def _write(self, statement, params):
+        # Runs one registered write statement in its own transaction and
+        # returns the row count
+        async with self.pool.connection() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(STATEMENTS.query(statement), params, prepare=True)
+                count = cursor.rowcount
+            if count:
+                await connection.commit()
+                await self.router.wrote(connection)
+        return count
+
+    async def _command(self, statement, params):
+        # Runs one of the single-statement write commands and returns its outcome
+        async with self.pool.connection() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(STATEMENTS.query(statement), params, prepare=True)
+                (outcome,) = await cursor.fetchone()
+            if outcome in (CREATED, UPDATED):
+                await connection.commit()
+                await self.router.wrote(connection)
+        return outcome
+
+    # Reports
+
+    def _changed(self, operation, outcome):
+        if outcome in (CREATED, UPDATED):
+            for cache in (self.cache, self.search_cache):
+                if cache is not None:
+                    cache.invalidate_after(operation)
+        return outcome
+
+    @instrumented()
+    async def report(self, name, since=None, until=None):
+        # One of the canned reports Query1-Query10 as (columns, rows), limited
+        # to donations from since to until for the reports in DATE_RANGE_REPORTS
+        query, params = report_query(name, since, until)
+        # The per-campaign reports are small and frequent enough to keep prepared
+        prepare = name in BOUNDED_REPORTS
+        if self.cache is None:
+            return await self._read(query, params, prepare)
+        key = (name, since, until)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        generation = self.cache.generation(REPORT_TABLES[name])
+        pool, fresh = await self.router.reader()
+        columns, rows = await self._fetch(query, params, pool, prepare)
+        # A replica behind this service's own last write would cache a
+        # result that the write already invalidated
+        if fresh:
+            self.cache.put(key, REPORT_TABLES[name], columns, rows, generation)
+        return columns, rows
+
+    @instrumented()
+    async def reports(self, *names):
+        # Several reports at once, each on its own pooled connection
+        results = await asyncio.gather(*(self.report(name) for name in names))
+        return dict(zip(names, results))
+
+    async def stream_report(self, name, itersize=2000, since=None, until=None):
+        # Rows of a report from a server-side cursor, yielded as they arrive.
+        # Results small enough for the cache are kept for the next caller.
+        query, params = report_query(name, since, until)
+        key = (name, since, until)
+        kept = None
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                for row in cached[1]:
+                    yield row
+                return
+            generation = self.cache.generation(REPORT_TABLES[name])
+            kept = []
+        pool, fresh = await self.router.reader()
+        if not fresh:
+            kept = None
+        async with pool.connection() as connection:
+            async with connection.cursor(name=f"gng_async_{name.lower()}") as cursor:
+                cursor.itersize = itersize
+                await cursor.execute(query.rstrip().rstrip(";"), params)
+                async for row in cursor:
+                    if kept is not None:
+                        kept.append(row)
+                        if len(kept) > self.cache.max_rows:
+                            kept = None
+                    yield row
+                columns = tuple(column.name for column in cursor.description or ())
+        if kept is not None:
+            self.cache.put(key, REPORT_TABLES[name], columns, kept, generation)
+
+    @instrumented()
+    async def page(self, name, params=None, token=None, limit=DEFAULT_PAGE_SIZE):
+        # One page of a paginated listing (see pagination.LISTINGS) as
+        # (rows, token for the next page or None). Raises ValueError for a
+        # token that does not belong to this listing and parameters.
+        query, query_params = page_query(name, params, token, limit)
+        _, rows = await self._read(query, query_params)
+        return split_page(name, params or {}, rows, limit)
+
+    @instrumented()
+    async def search(self, kind, text, limit=DEFAULT_LIMIT):
+        # Ranked campaign or entity candidates for a partial or misspelled
+        # key (see search.SEARCHES); hot prefixes come from the search cache
+        text = normalize(text)
+        if not text:
+            return []
+        query, params = search_query(kind, text, limit)
+        if self.search_cache is None:
+            _, rows = await self._read(query, params)
+            return rows
+        key = cache_key(kind, text, limit)
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return cached[1]
+        tables = SEARCHES[kind]["tables"]
+        generation = self.search_cache.generation(tables)
+        pool, fresh = await self.router.reader()
+        _, rows = await self._fetch(query, params, pool)
+        if fresh:
+            self.search_cache.put(key, tables, None, rows, generation)
+        return rows
+
+    @instrumented()
+    async def campaign_status(self, issue, location, start_date):
+        _, rows = await self._read(STATEMENTS.query(CAMPAIGN_EXISTS), (issue, location, start_date), prepare=True)
+        return rows[0] if rows else None
+
+    @instrumented()
+    async def accounting_report(self, since=None, until=None):
+        _, rows = await self._read(*accounting_report_query(since, until))
+        return rows
+
+    @instrumented()
+    async def engagement_scores(self, weights=None, half_life_days=None, since=None, until=None):
+        query, params = engagement_query(weights, half_life_days, since, until)
+        _, rows = await self._read(query, params)
+        return rows
+
+    @instrumented()
+    async def member_dashboard(self, entity_email):
+        # The combined statement already returns all three streams in one round trip
+        _, rows = await self._read(MEMBER_DASHBOARD_QUERY, {"email": entity_email})
+        return build_dashboard(*rows[0])
+
+    @instrumented()
+    async def member_dashboards(self, entity_emails):
+        # Dashboards for several members, fetched concurrently
+        dashboards = await asyncio.gather(*(self.member_dashboard(email) for email in entity_emails))
+        return dict(zip(entity_emails, dashboards))
+
+    # Writes
+
+    @instrumented()
+    async def create_campaign(self, issue, location, start_date, duration_days, phase, budget, website_push_date):
+        try:
+            outcome = await self._command(CREATE_CAMPAIGN,
+                                          (issue, location, start_date, duration_days, phase, budget, website_push_date))
+        except (errors.CheckViolation, errors.ForeignKeyViolation, errors.DataError):
+            return INVALID
+        return self._changed("create_campaign", outcome)
+
+    @instrumented()
+    async def register_donor(self, email, name):
+        return self._changed("register_donor", await self._command(REGISTER_DONOR, (email, name)))
+
+    @instrumented()
+    async def make_donation(self, email, issue, location, start_date, donation_date, amount):
+        try:
+            outcome = await self._command(MAKE_DONATION, (email, issue, location, start_date, donation_date, amount))
+        except errors.ForeignKeyViolation as e:
+            # The donor or campaign was deleted between the lookup and the insert's check
+            return unknown_reference(e)
+        return self._changed("make_donation", outcome)
+
+    @instrumented()
+    async def add_volunteer(self, email, name, tier, issue, location, start_date, volunteer_start_date):
+        try:
+            outcome = await self._command(ADD_VOLUNTEER,
+                                          (issue, location, start_date, email, name, tier, volunteer_start_date))
+        except errors.UniqueViolation:
+            # A concurrent add_volunteer took the email first
+            return EXISTS
+        except errors.ForeignKeyViolation:
+            return UNKNOWN_CAMPAIGN
+        return self._changed("add_volunteer", outcome)
+
+    @instrumented()
+    async def schedule_volunteer(self, email, issue, location, start_date, scheduled_date):
+        try:
+            outcome = await self._command(SCHEDULE_VOLUNTEER, (email, issue, location, start_date, scheduled_date))
+        except errors.ForeignKeyViolation as e:
+            # The entity is not a volunteer, or it or the campaign was deleted
+            # between the lookup and the insert's check
+            return unknown_reference(e)
+        return self._changed("schedule_volunteer", outcome)
+
+    @instrumented()
+    async def add_campaign_annotation(self, issue, location, start_date, annotation):
+        count = await self._write(UPDATE_CAMPAIGN_ANNOTATION, (annotation, issue, location, start_date))
+        return self._changed("add_campaign_annotation", UPDATED if count else NOT_FOUND)
+
+    @instrumented()
+    async def add_membership_history(self, email, issue, location, start_date, involvement_start_date,
+                                     involvement_end_date, annotations):
+        try:
+            await self._write(INSERT_MEMBERSHIP_HISTORY,
+                              (email, issue, location, start_date, involvement_start_date,
+                               involvement_end_date or None, annotations))
+            return self._changed("add_membership_history", CREATED)
+        except errors.UniqueViolation:
+            return EXISTS
+        except errors.ForeignKeyViolation as e:
+            return unknown_reference(e)
+
+    @instrumented()
+    async def update_membership_history_annotation(self, email, issue, location, start_date, annotation):
+        count = await self._write(UPDATE_MEMBERSHIP_ANNOTATION,
+                                  (annotation, email, issue, location, start_date))
+        return self._changed("update_membership_history_annotation", UPDATED if count else NOT_FOUND)
+
+
+class ServiceClient:
+    # Blocking facade over GngService for synchronous callers such as the
+    # menu in gng.py: the service runs on an event loop in a background
+    # thread and each call waits for its coroutine to finish.
+
+    def __init__(self, conninfo, min_size=1, max_size=10, **options):
+        # psycopg's async mode needs a selector loop; Windows defaults to proactor
+        self._loop = asyncio.SelectorEventLoop() if sys.platform == "win32" else asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="gng-service", daemon=True)
+        self._thread.start()
+        self.service = GngService(conninfo, min_size=min_size, max_size=max_size, **options)
+        try:
+            self.call(self.service.open())
+        except Exception:
+            self._stop()
+            raise
+
+    def call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def __getattr__(self, name):
+        # client.make_donation(...) runs service.make_donation(...) to completion
+        method = getattr(self.service, name)
+        if not asyncio.iscoroutinefunction(method):
+            return method
+        return lambda *args, **kwargs: self.call(method(*args, **kwargs))
+
+    def _stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def close(self):
+        try:
+            self.call(self.service.close())
+        finally:
+            self._stop()
+
+
+def make_conninfo(db_name, db_user, db_password, db_host):
+    return _make_conninfo(dbname=db_name, user=db_user, password=db_password, host=db_host)
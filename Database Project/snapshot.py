@@ -0,0 +1,203 @@
+import argparse
+import datetime
+import json
+import os
+import struct
+import time
+
+import numpy as np
+import psycopg2
+from psycopg2 import OperationalError
+
+# A columnar copy of the activity tables for in-process analysis. Each column
+# is a .npy file loaded memory-mapped, so opening a snapshot reads nothing
+# until a column is used. Emails and campaign keys are dictionary-encoded:
+# entity and campaign columns hold int32 codes into entities.json and
+# campaigns.json, numbered in the database's sort order. Dates are int32 days
+# since 1970-01-01.
+EPOCH = datetime.date(1970, 1, 1)
+
+# involvement_end_date of a membership that has not ended
+OPEN_END = np.iinfo(np.int32).max
+
+# Dictionaries numbered once per export, inside the export transaction, so
+# every table below is encoded against the same codes
+_DICTIONARIES = """
+    CREATE TEMP TABLE snapshot_entities ON COMMIT DROP AS
+        SELECT email, (ROW_NUMBER() OVER (ORDER BY email) - 1)::int4 AS code FROM Entity;
+    CREATE TEMP TABLE snapshot_campaigns ON COMMIT DROP AS
+        SELECT issue, location, start_date, budget,
+               (ROW_NUMBER() OVER (ORDER BY issue, location, start_date) - 1)::int4 AS code
+        FROM Campaigns;
+    ANALYZE snapshot_entities;
+    ANALYZE snapshot_campaigns;
+"""
+
+_CAMPAIGN_JOIN = """
+    JOIN snapshot_entities e ON e.email = t.entity_email
+    JOIN snapshot_campaigns c ON c.issue = t.campaign_issue AND c.location = t.campaign_location
+                             AND c.start_date = t.campaign_start_date
+"""
+
+# (table, [(column, expression, dtype)], source). Every column is fixed width
+# and never NULL, so the binary COPY output is an array of identical records.
+SNAPSHOT_TABLES = [
+    ("donations", [
+        ("entity", "e.code", np.int32),
+        ("campaign", "c.code", np.int32),
+        ("date", "(t.donation_date - DATE '1970-01-01')::int4", np.int32),
+        ("amount", "COALESCE(t.amount, 0)::float8", np.float64),
+    ], "Donations t" + _CAMPAIGN_JOIN),
+    ("scheduled", [
+        ("entity", "e.code", np.int32),
+        ("campaign", "c.code", np.int32),
+        ("date", "(t.scheduled_date - DATE '1970-01-01')::int4", np.int32),
+    ], "Scheduled t" + _CAMPAIGN_JOIN),
+    ("membership", [
+        ("entity", "e.code", np.int32),
+        ("campaign", "c.code", np.int32),
+        ("start", "(t.involvement_start_date - DATE '1970-01-01')::int4", np.int32),
+        ("end", f"COALESCE(t.involvement_end_date - DATE '1970-01-01', {OPEN_END})::int4", np.int32),
+    ], "MembershipHistory t" + _CAMPAIGN_JOIN),
+]
+
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+
+def to_day(value):
+    # A date (or YYYY-MM-DD string) as days since EPOCH
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    return (value - EPOCH).days
+
+
+def _record_dtype(columns):
+    # Layout of one binary COPY tuple: a field count, then a length word and
+    # the big-endian value of every field
+    fields = [("fields", ">i2")]
+    for name, _, dtype in columns:
+        fields += [(name + "_length", ">i4"), (name, np.dtype(dtype).newbyteorder(">"))]
+    return np.dtype(fields)
+
+
+def _copy_to_columns(cursor, directory, table, columns, source):
+    # Stream the table with binary COPY into a scratch file, then split the
+    # fixed-width records into one native-endian .npy column per field. The
+    # scratch file is memory-mapped, so neither step holds the table in memory.
+    scratch = os.path.join(directory, table + ".copy")
+    select = ", ".join(f"{expression} AS {name}" for name, expression, _ in columns)
+    with open(scratch, "wb") as out:
+        cursor.copy_expert(f"COPY (SELECT {select} FROM {source}) TO STDOUT WITH (FORMAT binary)", out,
+                           size=1 << 20)
+    try:
+        with open(scratch, "rb") as header:
+            if header.read(len(_COPY_SIGNATURE)) != _COPY_SIGNATURE:
+                raise ValueError(f"{scratch} is not binary COPY output")
+            _, extension = struct.unpack(">ii", header.read(8))
+        offset = len(_COPY_SIGNATURE) + 8 + extension
+        record = _record_dtype(columns)
+        count, remainder = divmod(os.path.getsize(scratch) - offset - 2, record.itemsize)
+        if remainder:
+            raise ValueError(f"{table}: COPY output is not a whole number of {record.itemsize}-byte records")
+        records = (np.memmap(scratch, dtype=record, mode="r", offset=offset, shape=(count,))
+                   if count else np.empty(0, dtype=record))
+        if count and not (records["fields"] == len(columns)).all():
+            raise ValueError(f"{table}: unexpected field count in COPY output")
+        for name, _, dtype in columns:
+            if count and not (records[name + "_length"] == np.dtype(dtype).itemsize).all():
+                raise ValueError(f"{table}.{name}: NULL or variable-width value in COPY output")
+            column = np.lib.format.open_memmap(os.path.join(directory, f"{table}_{name}.npy"), mode="w+",
+                                               dtype=dtype, shape=(count,))
+            column[:] = records[name]
+            column.flush()
+            del column
+        del records
+        return count
+    finally:
+        os.remove(scratch)
+
+
+def export_snapshot(connection, directory, verbose=True):
+    # Write a consistent snapshot of Donations, Scheduled and MembershipHistory
+    # to directory. All tables are read in one REPEATABLE READ transaction, so
+    # they reflect the same instant. Returns the row count per table.
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        cursor.execute(_DICTIONARIES)
+        cursor.execute("SELECT email FROM snapshot_entities ORDER BY code;")
+        entities = [email for (email,) in cursor.fetchall()]
+        cursor.execute("SELECT issue, location, start_date, budget::float8 FROM snapshot_campaigns ORDER BY code;")
+        campaigns = cursor.fetchall()
+        with open(os.path.join(directory, "entities.json"), "w", encoding="utf-8") as out:
+            json.dump(entities, out)
+        with open(os.path.join(directory, "campaigns.json"), "w", encoding="utf-8") as out:
+            json.dump([[issue, location, str(start_date)] for issue, location, start_date, _ in campaigns], out)
+        np.save(os.path.join(directory, "campaign_budget.npy"),
+                np.array([np.nan if budget is None else budget for *_, budget in campaigns], dtype=np.float64))
+
+        for table, columns, source in SNAPSHOT_TABLES:
+            started = time.perf_counter()
+            counts[table] = _copy_to_columns(cursor, directory, table, columns, source)
+            if verbose:
+                print(f"{table}: {counts[table]} rows in {time.perf_counter() - started:.1f}s")
+
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as out:
+            json.dump({"exported_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                       "entities": len(entities), "campaigns": len(campaigns), "rows": counts}, out, indent=2)
+        return counts
+    finally:
+        cursor.close()
+        # Nothing was written; ending the transaction drops the temp tables
+        connection.rollback()
+
+
+class Snapshot:
+    # A snapshot directory opened for reading. Columns are memory-mapped
+    # arrays, e.g. snapshot.donations["amount"].
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as handle:
+            self.meta = json.load(handle)
+        with open(os.path.join(directory, "entities.json"), encoding="utf-8") as handle:
+            self.entities = json.load(handle)
+        with open(os.path.join(directory, "campaigns.json"), encoding="utf-8") as handle:
+            self.campaigns = [tuple(key) for key in json.load(handle)]
+        self.campaign_budget = np.load(os.path.join(directory, "campaign_budget.npy"))
+        for table, columns, _ in SNAPSHOT_TABLES:
+            setattr(self, table, {
+                name: np.load(os.path.join(directory, f"{table}_{name}.npy"), mmap_mode="r")
+                for name, _, _ in columns
+            })
+
+    def emails(self, codes):
+        return [self.entities[code] for code in codes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a columnar snapshot of the activity tables.")
+    parser.add_argument("directory", help="where to write the .npy columns and dictionaries")
+    parser.add_argument("--dsn", default=os.environ.get("GNG_DSN", ""), help="libpq connection string")
+    args = parser.parse_args()
+
+    try:
+        connection = psycopg2.connect(args.dsn)
+    except OperationalError as e:
+        print(f"The error '{e}' occurred")
+        return
+    try:
+        started = time.perf_counter()
+        counts = export_snapshot(connection, args.directory)
+        print(f"Snapshot of {sum(counts.values())} rows written to {args.directory} "
+              f"in {time.perf_counter() - started:.1f}s")
+    except (psycopg2.Error, ValueError, OSError) as e:
+        print(f"Snapshot export failed: {e}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import csv
+import datetime
+import itertools
+import json
+import sys
+from decimal import Decimal
+
+DEFAULT_ITERSIZE = 2000
+
+_cursor_ids = itertools.count(1)
+
+
+def format_row(row):
+    # Convert datetime and Decimal objects to strings
+    return [str(item) if isinstance(item, (datetime.date, Decimal)) else item for item in row]
+
+
+def stream_query(connection, query, params=None, itersize=DEFAULT_ITERSIZE, with_header=False):
+    # Run query on a named (server-side) cursor and yield rows lazily. Only
+    # itersize rows are held client-side at a time, so memory stays constant
+    # no matter how large the result is. With with_header the first item
+    # yielded is the tuple of column names.
+    cursor = connection.cursor(name=f"gng_stream_{next(_cursor_ids)}")
+    cursor.itersize = itersize
+    if isinstance(query, str):
+        # The query is wrapped in DECLARE ... CURSOR FOR, which rejects a trailing semicolon
+        query = query.rstrip().rstrip(";")
+    try:
+        cursor.execute(query, params)
+        rows = iter(cursor)
+        # The description of a named cursor is only known after the first fetch
+        first = next(rows, None)
+        if with_header:
+            yield tuple(column.name for column in cursor.description or ())
+        if first is None:
+            return
+        yield first
+        yield from rows
+    finally:
+        cursor.close()
+
+
+def console_sink(rows, out=None):
+    out = out or sys.stdout
+    count = 0
+    for row in rows:
+        print(format_row(row), file=out)
+        count += 1
+    return count
+
+
+def csv_sink(rows, out, header=None):
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def json_sink(rows, out, header=None):
+    # Writes a JSON array incrementally; rows become objects when a header is given
+    out.write("[")
+    count = 0
+    for row in rows:
+        if count:
+            out.write(",\n")
+        item = dict(zip(header, row)) if header else list(row)
+        out.write(json.dumps(item, default=str))
+        count += 1
+    out.write("]\n")
+    return count
+
+
+def stream_to(connection, query, sink, out=None, params=None, itersize=DEFAULT_ITERSIZE):
+    # Stream a query into one of the sinks above and return the number of rows written
+    if sink is console_sink:
+        return console_sink(stream_query(connection, query, params, itersize), out)
+    rows = stream_query(connection, query, params, itersize, with_header=True)
+    header = next(rows)
+    return sink(rows, out, header)
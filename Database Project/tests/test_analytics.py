@@ -0,0 +1,90 @@
+import datetime
+import types
+import unittest
+
+import numpy as np
+
+import analytics
+from snapshot import OPEN_END, to_day
+
+
+def _days(*dates):
+    return np.array([to_day(date) for date in dates], dtype=np.int32)
+
+
+def _snapshot():
+    # Three donors, three campaigns over two issues, one volunteer still
+    # active and one whose involvement has ended
+    return types.SimpleNamespace(
+        entities=["ann@example.org", "bob@example.org", "cat@example.org"],
+        campaigns=[("Climate", "Vancouver", "2023-01-01"), ("Climate", "Victoria", "2023-01-01"),
+                   ("Water", "Victoria", "2023-01-01")],
+        campaign_budget=np.array([100.0, 100.0, 50.0]),
+        donations={
+            "entity": np.array([0, 0, 1], dtype=np.int32),
+            "campaign": np.array([0, 1, 0], dtype=np.int32),
+            "date": _days("2023-02-01", "2023-03-15", "2023-04-01"),
+            "amount": np.array([10.0, 20.0, 5.0]),
+        },
+        membership={
+            "entity": np.array([2, 1], dtype=np.int32),
+            "campaign": np.array([2, 2], dtype=np.int32),
+            "start": _days("2023-01-10", "2023-01-10"),
+            "end": np.array([OPEN_END, to_day("2023-02-01")], dtype=np.int32),
+        },
+    )
+
+
+class AnalyticsTest(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = _snapshot()
+
+    def test_entity_totals(self):
+        result = analytics.entity_totals(self.snapshot)
+        self.assertEqual(result["entity"].tolist(), [0, 1])
+        self.assertEqual(result["total"].tolist(), [30.0, 5.0])
+        self.assertEqual(result["count"].tolist(), [2, 1])
+
+    def test_entity_totals_date_range(self):
+        result = analytics.entity_totals(self.snapshot, since="2023-03-01", until="2023-04-01")
+        self.assertEqual(result["entity"].tolist(), [0])
+        self.assertEqual(result["total"].tolist(), [20.0])
+
+    def test_campaign_stats(self):
+        result = analytics.campaign_stats(self.snapshot)
+        self.assertEqual(result["campaign"].tolist(), [0, 1, 2])
+        self.assertEqual(result["sum"].tolist(), [15.0, 20.0, 0.0])
+        self.assertEqual(result["count"].tolist(), [2, 1, 0])
+        self.assertEqual(result["max"][:2].tolist(), [10.0, 20.0])
+        self.assertTrue(np.isnan(result["max"][2]))
+
+    def test_campaign_stats_empty_range(self):
+        result = analytics.campaign_stats(self.snapshot, since="2024-01-01")
+        self.assertEqual(result["count"].tolist(), [0, 0, 0])
+        self.assertTrue(np.isnan(result["max"]).all())
+
+    def test_accounting_report(self):
+        result = analytics.accounting_report(self.snapshot)
+        self.assertEqual(result["issue"].tolist(), ["Climate", "Water"])
+        self.assertEqual(result["budget"].tolist(), [100.0, 50.0])
+        self.assertEqual(result["total"].tolist(), [35.0, 0.0])
+        self.assertEqual(result["coverage"].tolist(), [0.35, 0.0])
+
+    def test_engagement_scores(self):
+        result = analytics.engagement_scores(self.snapshot, as_of=datetime.date(2023, 6, 1))
+        # ann and cat tie on 20 points and are ordered by code
+        self.assertEqual(result["entity"].tolist(), [0, 2, 1])
+        self.assertEqual(result["score"].tolist(), [20, 20, 10])
+        self.assertEqual(result["donation_count"].tolist(), [2, 0, 1])
+        self.assertEqual(result["volunteering_count"].tolist(), [0, 1, 0])
+
+    def test_engagement_scores_decay(self):
+        # bob's only donation is exactly one half-life old
+        result = analytics.engagement_scores(self.snapshot, weights={"volunteering": 0}, half_life_days=61,
+                                             since="2023-04-01", as_of="2023-06-01")
+        self.assertEqual(result["entity"].tolist(), [1])
+        self.assertAlmostEqual(result["score"][0], 5.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
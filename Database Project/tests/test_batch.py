@@ -0,0 +1,48 @@
+import io
+import unittest
+
+import batch
+from queries import MAKE_DONATION, REPORT_QUERIES, STATEMENTS
+
+
+class ReadOperationsTest(unittest.TestCase):
+    def test_lines(self):
+        stream = io.StringIO('{"op": "report", "name": "Query3"}\n'
+                             '\n'
+                             '{"op": \n'
+                             '[1, 2]\n')
+        operations = list(batch.read_operations(stream))
+        self.assertEqual([number for number, _ in operations], [1, 3, 4])
+        self.assertEqual(operations[0][1], {"op": "report", "name": "Query3"})
+        self.assertTrue(operations[1][1].startswith("not valid JSON"))
+        self.assertEqual(operations[2][1], "not a JSON object")
+
+
+class StatementTest(unittest.TestCase):
+    def test_write_parameters_in_order(self):
+        operation = {"op": "make_donation", "amount": 25, "email": "ann@example.org", "issue": "Climate",
+                     "location": "Victoria", "start_date": "2023-01-01", "donation_date": "2023-02-01", "id": 7}
+        query, params = batch.statement(operation)
+        self.assertEqual(query, STATEMENTS.query(MAKE_DONATION))
+        self.assertEqual(params, ("ann@example.org", "Climate", "Victoria", "2023-01-01", "2023-02-01", 25))
+
+    def test_report(self):
+        self.assertEqual(batch.statement({"op": "report", "name": "Query3"}), (REPORT_QUERIES["Query3"], None))
+        query, params = batch.statement({"op": "report", "name": "Query2", "since": "2023-01-01"})
+        self.assertIn("d.donation_date >= %(since)s::date", query)
+        self.assertEqual(params, {"since": "2023-01-01", "until": None})
+
+    def test_malformed(self):
+        cases = [
+            ({"op": "report"}, "report needs a name"),
+            ({"op": "report", "name": "Query3", "since": "2023-01-01"}, "does not take a date range"),
+            ({"op": "drop_table"}, "unknown op 'drop_table'"),
+            ({"op": "register_donor", "email": "ann@example.org"}, "register_donor needs name"),
+        ]
+        for operation, message in cases:
+            with self.assertRaisesRegex(ValueError, message):
+                batch.statement(operation)
+
+
+if __name__ == "__main__":
+    unittest.main()
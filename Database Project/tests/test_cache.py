@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+
+import cache
+
+COLUMNS = ["issue", "total"]
+ROWS = [("Climate", 35), ("Water", 0)]
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_hit_and_miss(self):
+        results = cache.ResultCache()
+        self.assertIsNone(results.get("Query3"))
+        self.assertTrue(results.put("Query3", {"donations"}, COLUMNS, ROWS))
+        self.assertEqual(results.get("Query3"), (COLUMNS, ROWS))
+        self.assertEqual((results.hits, results.misses), (1, 1))
+
+    def test_invalidate_drops_readers_of_the_table(self):
+        results = cache.ResultCache()
+        results.put("Query3", {"donations"}, COLUMNS, ROWS)
+        results.put("Query10", {"campaigns"}, COLUMNS, ROWS)
+        self.assertEqual(results.invalidate(["Donations"]), 1)
+        self.assertIsNone(results.get("Query3"))
+        self.assertIsNotNone(results.get("Query10"))
+        results.invalidate_after("create_campaign")
+        self.assertIsNone(results.get("Query10"))
+
+    def test_result_older_than_a_write_is_not_stored(self):
+        results = cache.ResultCache()
+        generation = results.generation({"donations"})
+        results.invalidate({"campaigns"})
+        self.assertTrue(results.put("Query3", {"donations"}, COLUMNS, ROWS, generation))
+        generation = results.generation({"donations"})
+        results.invalidate({"donations"})
+        self.assertFalse(results.put("Query3", {"donations"}, COLUMNS, ROWS, generation))
+        self.assertIsNone(results.get("Query3"))
+
+    def test_clear_is_a_write_to_every_table(self):
+        results = cache.ResultCache()
+        generation = results.generation({"donations"})
+        results.clear()
+        self.assertFalse(results.put("Query3", {"donations"}, COLUMNS, ROWS, generation))
+
+    def test_ttl(self):
+        results = cache.ResultCache(ttl=30.0)
+        with mock.patch.object(cache.time, "monotonic", return_value=100.0):
+            results.put("Query3", {"donations"}, COLUMNS, ROWS)
+        with mock.patch.object(cache.time, "monotonic", return_value=130.0):
+            self.assertIsNotNone(results.get("Query3"))
+        with mock.patch.object(cache.time, "monotonic", return_value=130.5):
+            self.assertIsNone(results.get("Query3"))
+        self.assertEqual(results.expirations, 1)
+        self.assertEqual(results.stats()["entries"], 0)
+
+    def test_limits(self):
+        results = cache.ResultCache(max_entries=2, max_rows=3)
+        self.assertFalse(results.put("big", {"donations"}, COLUMNS, ROWS * 2))
+        results.put("a", {"donations"}, COLUMNS, ROWS[:1])
+        results.put("b", {"donations"}, COLUMNS, ROWS[:1])
+        results.get("a")
+        results.put("c", {"donations"}, COLUMNS, ROWS[:1])
+        # b was the least recently used
+        self.assertIsNone(results.get("b"))
+        # Over max_rows, the oldest entries go until the rows fit
+        results.put("d", {"donations"}, COLUMNS, ROWS)
+        self.assertIsNone(results.get("a"))
+        self.assertEqual(results.stats()["rows"], 3)
+        self.assertEqual(results.evictions, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from instrumentation import Metrics, sql_text
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_statement_outside_an_operation_is_ignored(self):
+        self.metrics.statement("SELECT 1", 0.001)
+        self.assertEqual(self.metrics.snapshot(), {})
+
+    def test_nested_spans(self):
+        # A statement counts once in every enclosing operation, and each
+        # operation is one call
+        with self.metrics.operation("batch"):
+            self.metrics.statement("SELECT 1", 0.001, rows=1)
+            with self.metrics.operation("single"):
+                self.metrics.statement("SELECT 2", 0.002, rows=2)
+                self.metrics.transaction("commit", True)
+        stats = self.metrics.snapshot()
+        self.assertEqual(stats["batch"]["calls"], 1)
+        self.assertEqual(stats["batch"]["statements"], 2)
+        self.assertEqual(stats["batch"]["rows"], 3)
+        self.assertEqual(stats["batch"]["round_trips"], 3)
+        self.assertEqual(stats["batch"]["slowest_statement"]["sql"], "SELECT 2")
+        self.assertEqual(stats["single"]["calls"], 1)
+        self.assertEqual(stats["single"]["statements"], 1)
+        self.assertEqual(stats["single"]["commits"], 1)
+
+    def test_labelled_renames_only_the_next_operation(self):
+        with self.metrics.labelled("Query3"):
+            with self.metrics.operation("report"):
+                self.metrics.statement("SELECT 3", 0.001)
+                with self.metrics.operation("inner"):
+                    pass
+            with self.metrics.operation("report"):
+                pass
+        with self.metrics.operation("report"):
+            pass
+        stats = self.metrics.snapshot()
+        self.assertEqual(sorted(stats), ["Query3", "inner", "report"])
+        self.assertEqual(stats["Query3"]["calls"], 1)
+        self.assertEqual(stats["Query3"]["statements"], 1)
+        self.assertEqual(stats["report"]["calls"], 2)
+
+    def test_failures(self):
+        with self.assertRaises(RuntimeError):
+            with self.metrics.operation("fails"):
+                raise RuntimeError("boom")
+        with self.metrics.operation("statement_fails"):
+            self.metrics.statement("SELECT 1/0", 0.001, failed=True)
+        stats = self.metrics.snapshot()
+        self.assertEqual(stats["fails"]["failures"], 1)
+        self.assertEqual(stats["statement_fails"]["failures"], 1)
+
+    def test_reset(self):
+        with self.metrics.operation("report"):
+            pass
+        self.metrics.reset()
+        self.assertEqual(self.metrics.snapshot(), {})
+
+    def test_sql_text(self):
+        self.assertEqual(sql_text(b"SELECT *\n  FROM Entity\tWHERE email = %s"), "SELECT * FROM Entity WHERE email = %s")
+
+
+if __name__ == "__main__":
+    unittest.main()
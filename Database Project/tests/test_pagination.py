@@ -0,0 +1,76 @@
+import datetime
+import unittest
+
+import pagination
+
+
+class TokenTest(unittest.TestCase):
+    def test_round_trip(self):
+        params = {"email": "ann@example.org"}
+        row = ("Climate", "Victoria", datetime.date(2023, 1, 1), datetime.date(2023, 2, 1), 25)
+        token = pagination.encode_token("member_donations", params, row)
+        self.assertNotIn("=", token)
+        self.assertEqual(pagination.decode_token("member_donations", params, token),
+                         ["2023-02-01", "Climate", "Victoria", "2023-01-01"])
+
+    def test_other_parameters_rejected(self):
+        token = pagination.encode_token("member_donations", {"email": "ann@example.org"},
+                                        ("Climate", "Victoria", datetime.date(2023, 1, 1), datetime.date(2023, 2, 1)))
+        with self.assertRaisesRegex(ValueError, "does not belong"):
+            pagination.decode_token("member_donations", {"email": "bob@example.org"}, token)
+
+    def test_other_listing_rejected(self):
+        token = pagination.encode_token("Query1", {}, ("ann@example.org", "Ann"))
+        with self.assertRaisesRegex(ValueError, "does not belong"):
+            pagination.decode_token("Query2", {}, token)
+
+    def test_malformed(self):
+        for token in ["not a token", "e30", "W10"]:
+            with self.assertRaisesRegex(ValueError, "Malformed"):
+                pagination.decode_token("Query1", {}, token)
+
+
+class PageQueryTest(unittest.TestCase):
+    def test_first_page(self):
+        query, params = pagination.page_query("Query1", limit=10)
+        self.assertEqual(params, {"limit": 11})
+        self.assertIn("ORDER BY e.email LIMIT", query)
+        self.assertNotIn("%(k0)s", query)
+
+    def test_seek_after_token(self):
+        token = pagination.encode_token("Query5", {}, ("Climate", "Victoria", datetime.date(2023, 1, 1)))
+        query, params = pagination.page_query("Query5", token=token, limit=5)
+        self.assertIn("AND (c.issue, c.location, c.start_date) > "
+                      "(%(k0)s::varchar, %(k1)s::varchar, %(k2)s::date)", query)
+        self.assertEqual(params, {"limit": 6, "k0": "Climate", "k1": "Victoria", "k2": "2023-01-01"})
+
+    def test_lower_bound_only_with_token(self):
+        query, _ = pagination.page_query("Query7")
+        self.assertNotIn("e.email >=", query)
+        token = pagination.encode_token("Query7", {}, ("ann@example.org", "Ann", "Member"))
+        query, _ = pagination.page_query("Query7", token=token)
+        self.assertEqual(query.count("AND e.email >= %(k0)s::varchar"), 3)
+
+    def test_listing_parameters(self):
+        _, params = pagination.page_query("member_scheduled", {"email": "ann@example.org", "other": 1})
+        self.assertEqual(params, {"email": "ann@example.org", "limit": pagination.DEFAULT_PAGE_SIZE + 1})
+        with self.assertRaisesRegex(ValueError, "needs email"):
+            pagination.page_query("member_scheduled")
+
+    def test_invalid_requests(self):
+        with self.assertRaisesRegex(ValueError, "Unknown listing"):
+            pagination.page_query("Query4")
+        for limit in [0, pagination.MAX_PAGE_SIZE + 1]:
+            with self.assertRaisesRegex(ValueError, "Page size"):
+                pagination.page_query("Query1", limit=limit)
+
+    def test_split_page(self):
+        rows = [("a@example.org", "A"), ("b@example.org", "B"), ("c@example.org", "C")]
+        page, token = pagination.split_page("Query1", {}, rows, 2)
+        self.assertEqual(page, rows[:2])
+        self.assertEqual(pagination.decode_token("Query1", {}, token), ["b@example.org"])
+        self.assertEqual(pagination.split_page("Query1", {}, rows, 3), (rows, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+
+import search
+
+
+class SearchTest(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(search.normalize("  Clean \t Water\n"), "clean water")
+        self.assertEqual(search.normalize("Clean  Water"), search.normalize("clean water"))
+        self.assertEqual(search.normalize(2023), "2023")
+
+    def test_like_prefix_escapes_wildcards(self):
+        self.assertEqual(search._like_prefix("clean"), "clean%")
+        self.assertEqual(search._like_prefix("100%_sure\\"), "100\\%\\_sure\\\\%")
+
+    def test_search_query(self):
+        _, params = search.search_query("campaigns", "clean", limit=5)
+        self.assertEqual(params["prefix"], "clean%")
+        self.assertEqual(params["word_prefix"], "% clean%")
+        self.assertEqual(params["limit"], 5)
+        with self.assertRaisesRegex(ValueError, "Unknown search"):
+            search.search_query("nothing", "clean")
+        with self.assertRaisesRegex(ValueError, "limit"):
+            search.search_query("campaigns", "clean", limit=0)
+
+
+if __name__ == "__main__":
+    unittest.main()